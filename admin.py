@@ -1,31 +1,85 @@
-from copy import deepcopy
+from contextlib import contextmanager, suppress
+from copy import copy, deepcopy
 from base64 import b64decode, b64encode
+import json
+import uuid
 
 from django import forms
 from django.conf import settings
 from django.contrib import admin, messages
-from django.contrib.admin.utils import unquote
+from django.contrib.admin.utils import quote, unquote
 from django.contrib.admin.widgets import AutocompleteSelect
 from django.core.exceptions import PermissionDenied, ValidationError
-from django.db import models, transaction
+from django.db import IntegrityError, transaction
 from django.db.models import Q
 from django.forms.widgets import RadioSelect
+from django.http import (
+    Http404, HttpResponse, HttpResponseNotAllowed, JsonResponse)
 from django.shortcuts import render
+from django.views.decorators.http import condition
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from django.utils.translation import gettext_lazy as _
+from django.utils.http import urlencode
+from django.utils.text import capfirst
+from django.utils.translation import get_language, gettext_lazy as _
 from django.urls import path, reverse
 
+import reversion
 from reversion.admin import VersionAdmin
 from reversion.models import Version
 
-from .models import (Team, Match, Player, Scoresheet,
+from .models import (Team, Match, Player, Scoresheet, Signature,
                      Timer, TimerProfile, TimerStage, TIMERSTATES,)
+from .scoresheets._rules import scoring_rules
+from .signals import MatchPayloadRefresh, ScheduleProjection
+from . import revisions, signatures
+from .pagination import AFTER_VAR, KeysetChangeList
+
+
+def violates(error, model, name):
+    # Whether an IntegrityError is a violation of model's unique constraint
+    # (or unique field) name. Most databases name the constraint (after its
+    # field, for a unique field), SQLite lists its columns.
+    fields = [name]
+    for constraint in model._meta.constraints:
+        if constraint.name == name:
+            fields = constraint.fields
+    columns = ", ".join("{}.{}".format(
+        model._meta.db_table, model._meta.get_field(field).column)
+        for field in fields)
+    message = str(error)
+    return name in message or message.endswith(": " + columns)
 
 
 class RadioRow(RadioSelect):
     template_name = "fllfms/radiorow.html"
     option_template_name = "fllfms/radiorow_option.html"
 
+    # Rendered widgets, by cache_key, language, name, attrs and value.
+    _rendered = {}
+
+    # If given a cache_key, the choices (and labels) for that key must never
+    # change, e.g. a model field. Then each rendering (there is one for each
+    # possible value) is only done once per language.
+    def __init__(self, attrs=None, choices=(), cache_key=None):
+        super().__init__(attrs, choices)
+        self.cache_key = cache_key
+
+    def render(self, name, value, attrs=None, renderer=None):
+        values = tuple(self.format_value(value))
+        if self.cache_key is None or not set(values) <= {
+                str(v) for v, _ in self.choices}:
+            # Posted values can be anything, only cache valid ones.
+            return super().render(name, value, attrs, renderer)
+
+        key = (self.cache_key, get_language(), name,
+               tuple(sorted((attrs or {}).items())), values)
+        html = self._rendered.get(key)
+        if html is None:
+            html = super().render(name, value, attrs, renderer)
+            self._rendered[key] = html
+        return html
+
     # There are some remanants from the RadioSelect context, we ignore them.
     # self.attrs seems to be applied to both <ul> and <input> elements.
     # This is also true for RadioSelect, and doesn't seem to break anything.
@@ -51,6 +105,12 @@ class RadioRow(RadioSelect):
 class SignatureWidget(forms.Widget):
     template_name = 'fllfms/signature_widget.html'
 
+    def __init__(self, url=None, **kwargs):
+        # url is ScoresheetAdmin.signature_view's, with '__digest__' for the
+        # signature's key, to show it (when disabled) as a cacheable image.
+        super().__init__(**kwargs)
+        self.url = url
+
     def format_value(self, value):
         value = value or ""
         if isinstance(value, str):
@@ -58,6 +118,17 @@ class SignatureWidget(forms.Widget):
             return value
         return str(b64encode(value or b""), 'ascii')
 
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        if context['widget']['attrs'].get('disabled') and self.url:
+            # Without the pad to draw the strokes, show them as an image.
+            # Signatures are content-addressed, so the key is the data's.
+            with suppress(TypeError, ValueError):
+                context['widget']['image'] = self.url.replace(
+                    '__digest__', Signature.fromdata(
+                        b64decode(context['widget']['value'])).digest)
+        return context
+
     class Media:
         js = (
             "fllfms/vendor/signature_pad/signature_pad.umd.min.js",
@@ -73,10 +144,12 @@ class SignatureField(forms.Field):
         if not value:
             return None
         try:
-            return b64decode(value)
+            value = b64decode(value)
+            signatures.check(value)  # Strokes from signature_widget.js.
         except (TypeError, ValueError):
             raise ValidationError(_("Invalid data format."),
                                   code='invalid')
+        return value
 
     def clean(self, value):
         value = self.to_python(value)
@@ -84,11 +157,125 @@ class SignatureField(forms.Field):
             raise ValidationError(_("A signature is required."),
                                   code='required')
 
-        return value
+        return Signature.fromdata(value)
+
+
+class PlayerAutocompleteSelect(AutocompleteSelect):
+    # Players have no ModelAdmin (and so no autocomplete view) of their own,
+    # so this uses ScoresheetAdmin.player_autocomplete_view instead.
+    def __init__(self, rel, admin_site, url, **kwargs):
+        super().__init__(rel, admin_site, **kwargs)
+        self.url = url
+
+    def get_url(self):
+        return self.url
+
+
+class ScoresheetForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The initial signature is its key, but SignatureWidget needs data.
+        if self.initial.get('signature') is not None:
+            self.initial['signature'] = self.instance.signature.data
+
+
+class ClearableAutocompleteSelect(AutocompleteSelect):
+    # Objects already loaded by the form (see PlayerForm), rendered as is when
+    # selected, rather than queried for again (once per inline row).
+    selected = ()
+
+    def build_attrs(self, base_attrs, extra_attrs=None):
+        attrs = super().build_attrs(base_attrs, extra_attrs)
+        attrs.update({'data-allow-clear': 'true'})
+        return attrs
+
+    def optgroups(self, name, value, attr=None):
+        known = {str(obj.pk): obj for obj in self.selected}
+        chosen = [str(v) for v in value
+                  if str(v) not in self.choices.field.empty_values]
+        if not known or not set(chosen) <= known.keys():
+            return super().optgroups(name, value, attr)
+        groups = super().optgroups(name, (), attr)  # Without querying.
+        options = groups[0][1]
+        for pk in chosen[:1]:
+            options.append(self.create_option(
+                name, known[pk].pk,
+                self.choices.field.label_from_instance(known[pk]), True,
+                len(options)))
+        return groups
+
+
+class PlayerForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The team was loaded with the player (see PlayerAdmin.get_queryset).
+        team = self.fields.get('team')
+        if team is not None and self.instance.team_id is not None:
+            widget = getattr(team.widget, 'widget', team.widget)  # Wrapped.
+            widget.selected = [self.instance.team]
+
+
+class BatchedVersionAdmin(VersionAdmin):
+    # Options for reversion.register() (e.g. fields to exclude), for this
+    # admin's model. Models of inlines are registered with the defaults.
+    reversion_options = {}
+
+    def reversion_register(self, model, **kwargs):
+        if model is self.model:
+            kwargs.update(self.reversion_options)
+        revisions.register(model, **kwargs)
+
+    @contextmanager
+    def create_revision(self, request):
+        # Objects saved by the view are serialised once, at the end.
+        with super().create_revision(request), revisions.batched():
+            yield
+
+    # Changelists are paginated by keyset, and histories by version, so
+    # neither slows down as the event goes on (see pagination.py).
+    show_full_result_count = False
+    change_list_template = "fllfms/change_list.html"
+    object_history_template = "fllfms/object_history.html"
+    history_per_page = 100
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def history_view(self, request, object_id, extra_context=None):
+        # As VersionAdmin's, but a page of versions at a time.
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        opts = self.model._meta
+        latest_first = self.history_latest_first
+        versions = Version.objects.get_for_object_reference(
+            self.model, unquote(object_id)).select_related(
+                'revision__user').order_by('-pk' if latest_first else 'pk')
+        with suppress(KeyError, ValueError):
+            versions = versions.filter(**{
+                'pk__lt' if latest_first else 'pk__gt':
+                int(request.GET[AFTER_VAR])})
+        versions = list(versions[:self.history_per_page + 1])
+
+        context = {
+            'action_list': [{
+                'revision': version.revision,
+                'url': reverse("{}:{}_{}_revision".format(
+                    self.admin_site.name, opts.app_label, opts.model_name),
+                    args=(quote(version.object_id), version.pk)),
+            } for version in versions[:self.history_per_page]],
+            'history_next_url': "?" + urlencode({
+                AFTER_VAR: versions[-2].pk,
+            }) if len(versions) > self.history_per_page else None,
+            **(extra_context or {}),
+        }
+        # Skip VersionAdmin's (unpaginated) list.
+        return super(VersionAdmin, self).history_view(
+            request, object_id, context)
 
 
 class PlayerAdmin(admin.TabularInline):
     model = Player
+    form = PlayerForm
     fields = ('match', 'station', 'team', 'surrogate', 'scoresheet_link',)
     readonly_fields = ('scoresheet_link',)
 
@@ -99,21 +286,32 @@ class PlayerAdmin(admin.TabularInline):
 
     ordering = ('station',)
 
-    def scoresheet_link(self, obj):
+    def get_queryset(self, request):
+        # For scoresheet_link() and the rows' labels, rather than per row.
+        return super().get_queryset(request).select_related(
+            'match', 'team', 'scoresheet')
+
+    @cached_property
+    def _scoresheet_urls(self):
+        # Reversed once (inlines are instantiated per request), not per row.
         url_name_data = (self.admin_site.name, Scoresheet._meta.app_label,
                          Scoresheet._meta.model_name)
+        return (reverse("{}:{}_{}_change".format(*url_name_data),
+                        args=['__pk__']),
+                reverse("{}:{}_{}_add".format(*url_name_data)))
+
+    def scoresheet_link(self, obj):
+        change_url, add_url = self._scoresheet_urls
 
         if getattr(obj, 'scoresheet', None) is not None:
             text = _(
                 "Edit scoresheet... (Score: {})").format(obj.scoresheet.score)
-            url = reverse("{}:{}_{}_change".format(*url_name_data),
-                          args=[obj.scoresheet.pk])
+            url = change_url.replace('__pk__', quote(str(obj.scoresheet.pk)))
         elif obj.station is not None and obj.match.actual is not None:
             # Only allow adding for existing players on a completed match.
             text = _("Click to add...")
             # Kinda hacky to prepopulate via querystring, but it works, so...
-            url = (reverse("{}:{}_{}_add".format(*url_name_data)) +
-                   "?player={}".format(obj.pk))
+            url = add_url + "?player={}".format(obj.pk)
 
         else:
             return "-"  # No link for not-yet-created players.
@@ -124,12 +322,6 @@ class PlayerAdmin(admin.TabularInline):
     # Standard autocomplete field won't allow us to clear it once selected. We
     # fix that by subclassing the AutocompleteSelect widget, and using that.
     def formfield_for_foreignkey(self, db_field, request, **kwargs):
-        class ClearableAutocompleteSelect(AutocompleteSelect):
-            def build_attrs(self, base_attrs, extra_attrs=None):
-                attrs = super().build_attrs(base_attrs, extra_attrs)
-                attrs.update({'data-allow-clear': 'true'})
-                return attrs
-
         db = kwargs.get('using')
         if db_field.name == 'team':
             kwargs['widget'] = ClearableAutocompleteSelect(
@@ -156,7 +348,7 @@ class PlayerAdmin(admin.TabularInline):
 
 
 @admin.register(Team)
-class TeamAdmin(VersionAdmin, admin.ModelAdmin):
+class TeamAdmin(BatchedVersionAdmin, admin.ModelAdmin):
     class EligibilityFilter(admin.SimpleListFilter):
         title = _("eligibility")
         parameter_name = 'dq'
@@ -199,7 +391,7 @@ class TeamAdmin(VersionAdmin, admin.ModelAdmin):
 
 
 @admin.register(Match)
-class MatchAdmin(VersionAdmin, admin.ModelAdmin):
+class MatchAdmin(BatchedVersionAdmin, admin.ModelAdmin):
     class MatchCompleteFilter(admin.SimpleListFilter):
         title = _("completion state")
         parameter_name = 'complete'
@@ -211,20 +403,12 @@ class MatchAdmin(VersionAdmin, admin.ModelAdmin):
             )
 
         def queryset(self, request, queryset):
+            # A match is complete if (and only if):
+            #   - Scores are present, or
+            #   - Actual start time is NOT null
+            # This is maintained in Match.played (see update_state()).
             if self.value() in ('0', '1'):
-                # A match is complete if (and only if):
-                #   - Scores are present (when implemented - TODO), or
-                #   - Actual start time is NOT null
-                # (Str always casts True, so cast self.value() to int first.)
-
-                action = queryset.filter  # For '0', filter on played matches.
-                if self.value() == '1':
-                    action = queryset.exclude  # Exclude played (Yet To Play).
-
-                # Distinct to prevent duplicates.
-                return action(Q(actual__isnull=False)
-                              | Q(players__scoresheet__isnull=False)
-                              ).distinct()
+                return queryset.filter(played=self.value() == '0')
 
     class StationCountFilter(admin.SimpleListFilter):
         title = _("missing teams")
@@ -240,17 +424,15 @@ class MatchAdmin(VersionAdmin, admin.ModelAdmin):
             )
 
         def queryset(self, request, queryset):
-            queryset = queryset.annotate(models.Count('players'))
             # self.value() is taken from self.lookups() (and is a string)
+            stations = len(settings.FLLFMS['STATIONS'])
             if self.value() == '0':
-                return queryset.filter(players__count=0)
+                return queryset.filter(player_count=0)
             if self.value() == '1':
-                return queryset.filter(
-                    players__count__gt=0,
-                    players__count__lt=len(settings.FLLFMS['TOURNAMENTS']))
+                return queryset.filter(player_count__gt=0,
+                                       player_count__lt=stations)
             if self.value() == '2':
-                return queryset.filter(
-                    players__count=len(settings.FLLFMS['TOURNAMENTS']))
+                return queryset.filter(player_count=stations)
 
     @staticmethod
     def action_reset(self, request, queryset):
@@ -259,43 +441,28 @@ class MatchAdmin(VersionAdmin, admin.ModelAdmin):
 
         # Reset the match to an unplayed state.
         # Completed matches only (actual is not None or scoresheets exist).
-        # Note that distinct() is needed else the second Q causes duplicates.
-        queryset = queryset.prefetch_related('players__scoresheet').filter(
-            Q(actual__isnull=False) | Q(players__scoresheet__isnull=False)
-            ).distinct()
-        scoring = self.admin_site._registry.get(Scoresheet)
-
-        for match in queryset:
-            # We seek permission to clear actual and delete scoresheets,
-            # but not modify the player, since we don't do that.
-            if not self.has_change_permission(request, match):
-                break
-            for player in match.players.all():
-                if (getattr(player, 'scoresheet', None) is not None
-                        and not scoring.has_delete_permission(
-                            request, player.scoresheet)):
-                    break
-        else:
-            # Valid, the loop did not terminate.
-            with transaction.atomic():
-                count = queryset.count()  # Get count before updating.
-                Scoresheet.objects.filter(player__match__in=queryset).delete()
-                for match in queryset:
-                    if match.actual is not None:
-                        match.actual = None
-                        match.save()  # Trigger a reversion change.
+        # We seek permission to clear actual and delete scoresheets, but not
+        # modify the player, since we don't do that. Permissions here aren't
+        # object-specific, so they're checked once per model.
+        if not self.can_reset(request):
             self.message_user(
-                request, _(
-                    "{} matches were reset. Any other selected matches were "
-                    "already in an unplayed state.").format(count),
-                level=messages.SUCCESS)
-
-            return  # Skip error below.
+                request, _("You do not have sufficient privileges to perform "
+                           "the requested action."),
+                level=messages.ERROR)
+            return
 
+        pks = list(queryset.filter(played=True).values_list('pk', flat=True))
+        matches = Match.objects.filter(pk__in=pks)
+        with transaction.atomic(), self.create_revision(request):
+            with matches.deferred_state():
+                Scoresheet.objects.filter(player__match__in=pks).delete()
+                matches.update(actual=None)
+            self.bulk_changed(matches)
         self.message_user(
-            request, _("You do not have sufficient privileges to perform the "
-                       "requested action."),
-            level=messages.ERROR)
+            request, _(
+                "{} matches were reset. Any other selected matches were "
+                "already in an unplayed state.").format(len(pks)),
+            level=messages.SUCCESS)
 
     @staticmethod
     def action_empty(self, request, queryset):
@@ -303,9 +470,7 @@ class MatchAdmin(VersionAdmin, admin.ModelAdmin):
         # The staticmethod decorator ensures that it's not provided twice.
 
         # Remove players from stations (only possible if match is unplayed).
-        if queryset.filter(
-                Q(actual__isnull=False) | Q(players__scoresheet__isnull=False)
-                ).exists():
+        if queryset.filter(played=True).exists():
             self.message_user(
                 request, _("Selection includes matches that have already been "
                            "played (cannot clear players). Reset those "
@@ -315,24 +480,40 @@ class MatchAdmin(VersionAdmin, admin.ModelAdmin):
 
         playeradmin = PlayerAdmin(parent_model=self.model,
                                   admin_site=self.admin_site)
-        playerset = Player.objects.filter(match__in=queryset)
-        valid = all((
-            playeradmin.has_delete_permission(request, obj)
-            for obj in playerset
-        ))
-        if valid:
-            num = playerset.delete()[0]
-            for match in queryset:
-                match.save()  # Trigger reversion change.
-            # TODO the ngettext translation thing.
-            self.message_user(
-                request, _("{} players were deleted.").format(num),
-                level=messages.SUCCESS)
-        else:
+        if not playeradmin.has_delete_permission(request):
             self.message_user(
                 request, _("You do not have sufficient privileges to perform "
                            "the requested action."),
                 level=messages.ERROR)
+            return
+
+        pks = list(queryset.values_list('pk', flat=True))
+        matches = Match.objects.filter(pk__in=pks)
+        with transaction.atomic(), self.create_revision(request):
+            with matches.deferred_state():
+                num = Player.objects.filter(match__in=pks).delete()[0]
+            self.bulk_changed(matches)
+        # TODO the ngettext translation thing.
+        self.message_user(
+            request, _("{} players were deleted.").format(num),
+            level=messages.SUCCESS)
+
+    def can_reset(self, request):
+        scoring = self.admin_site._registry.get(Scoresheet)
+        return (self.has_change_permission(request)
+                and scoring is not None
+                and scoring.has_delete_permission(request))
+
+    @staticmethod
+    def bulk_changed(matches):
+        # Matches changed in bulk (without Match.save()) still need to be in
+        # the current revision, and have their timers' payloads refreshed.
+        # Their state must be up to date first, as it's serialised here.
+        matches = list(matches.prefetch_related('players'))
+        for match in matches:
+            reversion.add_to_revision(match)
+        MatchPayloadRefresh.queue(matches=[match.pk for match in matches])
+        ScheduleProjection.queue_matches(matches)
 
     list_display = (
         'tournament', 'number', 'round', 'field', 'schedule', 'actual',)
@@ -346,8 +527,7 @@ class MatchAdmin(VersionAdmin, admin.ModelAdmin):
 
     def get_actions(self, request):
         actions = super().get_actions(request)
-        # TODO check scoresheet deletion permissions.
-        if self.has_change_permission(request) and True:
+        if self.can_reset(request):
             actions['reset'] = (self.action_reset, 'reset', _(
                 "Reset selected matches to unplayed state (time/scores)"))
         if PlayerAdmin(parent_model=self.model, admin_site=self.admin_site
@@ -360,9 +540,108 @@ class MatchAdmin(VersionAdmin, admin.ModelAdmin):
         PlayerAdmin,
     ]
 
+    # State of a single call of a view, kept on a copy of the admin (which
+    # is otherwise shared by all requests), see call(): the rows saved by a
+    # list_editable submission (to write in bulk), and the error to show a
+    # rolled back submission again with.
+    changed = None
+    conflict = None
+
+    def call(self, **state):
+        # The views of a copy of this admin, with state for the one call.
+        admin = copy(self)
+        for name, value in state.items():
+            setattr(admin, name, value)
+        return super(MatchAdmin, admin)
+
+    def changelist_view(self, request, extra_context=None):
+        # Rows saved with list_editable are collected by save_model(), then
+        # written with one bulk update (in the one revision) once all are
+        # valid, rather than one full save (and its signals) per row.
+        if request.method != 'POST' or '_save' not in request.POST:
+            return super().changelist_view(request, extra_context)
+        changed = []
+        try:
+            with transaction.atomic(), self.create_revision(request):
+                response = self.call(changed=changed).changelist_view(
+                    request, extra_context)
+                if changed:
+                    Match.objects.bulk_update(changed, self.list_editable)
+                    # Including the fields the matches were moved from.
+                    ScheduleProjection.queue_matches(changed)
+                    moved = [m.pk for m in changed if m.moved()]
+                    if moved:
+                        Match.objects.filter(pk__in=moved).update_players()
+                    matches = Match.objects.filter(
+                        pk__in=[m.pk for m in changed])
+                    matches.update_state()
+                    self.bulk_changed(matches)
+            return response
+        except IntegrityError as e:
+            conflict = self.team_too_many_matches(e)
+            if conflict is None:
+                raise
+        # Rolled back. Run the view again, with the conflict as the formset's
+        # error, to show the rows with the user's input (an invalid formset
+        # saves nothing).
+        return self.call(conflict=conflict).changelist_view(
+            request, extra_context)
+
+    def changeform_view(self, request, *args, **kwargs):
+        try:
+            return super().changeform_view(request, *args, **kwargs)
+        except IntegrityError as e:
+            conflict = self.team_too_many_matches(e)
+            if conflict is None:
+                raise
+        # Rolled back (the view is atomic). As changelist_view(), run it
+        # again, for the form to show the conflict with the user's input.
+        return self.call(conflict=conflict).changeform_view(
+            request, *args, **kwargs)
+
+    @staticmethod
+    def team_too_many_matches(error):
+        # player_round_tournament_uniq is a partial index, which can't be
+        # validated by the forms (without a query per player), so saves that
+        # violate it fail in the database. Returns the form error for such an
+        # IntegrityError, or None for any other.
+        if not violates(error, Player, "player_round_tournament_uniq"):
+            return None
+        return ValidationError(_(
+            "Cannot have more than one match per team, per round, per "
+            "tournament (non-surrogate matches). Nothing was saved."),
+            code="team_too_many_matches")
+
+    def with_conflict(self, cls):
+        # The form (or formset) class, failing with the conflict (if any).
+        error = self.conflict
+        if error is None:
+            return cls
+
+        class Conflict(cls):
+            def clean(self):
+                super().clean()
+                raise error
+        return Conflict
+
+    def get_form(self, request, *args, **kwargs):
+        return self.with_conflict(
+            super().get_form(request, *args, **kwargs))
+
+    def get_changelist_formset(self, request, **kwargs):
+        return self.with_conflict(
+            super().get_changelist_formset(request, **kwargs))
+
+    def save_model(self, request, obj, form, change):
+        if self.changed is None or not change:
+            return super().save_model(request, obj, form, change)
+        self.changed.append(obj)
+
 
 @admin.register(Scoresheet)
-class ScoresheetAdmin(VersionAdmin, admin.ModelAdmin):
+class ScoresheetAdmin(BatchedVersionAdmin, admin.ModelAdmin):
+    form = ScoresheetForm
+
     # Deepcopy but cast list to allow modifiction without altering original.
     _mission_fieldsets = list(deepcopy(Scoresheet.missions))
     for missionset in _mission_fieldsets:
@@ -375,10 +654,231 @@ class ScoresheetAdmin(VersionAdmin, admin.ModelAdmin):
         (section[1]['fields'] for section in _mission_fieldsets), [])
 
     def imgsignature(self, obj):
-        return format_html('<img src="data:image/png;base64,{}">',
-                           str(b64encode(obj.signature), 'ascii'))
+        # Referenced rather than inlined, so browsers can cache it.
+        info = self.admin_site.name, *self.model._meta.label_lower.split('.')
+        return format_html('<img src="{}">', reverse(
+            "{}:{}_{}_signature".format(*info), args=[obj.signature_id]))
     imgsignature.short_description = _("team initials")
 
+    def scorepreview(self, obj):
+        # Updated live by score_preview.js, using the rules from rules_view.
+        # Also carries the submit_view URL for scoresheet_queue.js.
+        info = self.admin_site.name, *self.model._meta.label_lower.split('.')
+        return format_html(
+            '<output class="score-preview" data-rules="{}" data-submit="{}">'
+            '{}</output>',
+            reverse("{}:{}_{}_rules".format(*info)),
+            reverse("{}:{}_{}_submit".format(*info)),
+            obj.score if obj is not None and obj.score is not None else "-")
+    scorepreview.short_description = _("score")
+
+    readonly_fields = ('scorepreview',)
+
+    def get_urls(self):
+        info = self.model._meta.app_label, self.model._meta.model_name
+
+        return [
+            path('rules.json',
+                 self.admin_site.admin_view(self.rules_view),
+                 name="{}_{}_rules".format(*info)),
+            path('submit/',
+                 self.admin_site.admin_view(self.submit_view),
+                 name="{}_{}_submit".format(*info)),
+            path('player-autocomplete/',
+                 self.admin_site.admin_view(self.player_autocomplete_view),
+                 name="{}_{}_player_autocomplete".format(*info)),
+            path('signature/<slug:digest>.png',
+                 self.admin_site.admin_view(self.signature_view),
+                 name="{}_{}_signature".format(*info)),
+            *super().get_urls(),
+        ]
+
+    def rules_view(self, request):
+        # Same permissions as viewing the scoresheets these rules apply to.
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        data, etag = scoring_rules(self.model)
+
+        # Scoring rules never change at runtime, so browsers can revalidate
+        # with the ETag (getting a 304) rather than download them again.
+        @condition(etag_func=lambda request: etag)
+        def view(request):
+            response = HttpResponse(data, content_type="application/json")
+            response['Cache-Control'] = "private, max-age=3600"
+            return response
+        return view(request)
+
+    def signature_view(self, request, digest):
+        # Same permissions as viewing the scoresheets they're signed on.
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+
+        # Signatures are content-addressed (so never change), and the ETag
+        # is the key. Browsers can cache them for good, even across versions.
+        @condition(etag_func=lambda request: digest)
+        def view(request):
+            try:
+                # Once rasterised, the strokes aren't needed to serve it.
+                signature = Signature.objects.defer('data').get(pk=digest)
+            except Signature.DoesNotExist:
+                raise Http404
+            response = HttpResponse(signature.png(), content_type="image/png")
+            response['Cache-Control'] = "private, max-age=31536000, immutable"
+            return response
+        return view(request)
+
+    @staticmethod
+    def player_choices(queryset, scoresheet=None):
+        # Specify limiting and especially ordering here, not model.
+        # Players that have played but not been scored, plus the player of
+        # the given scoresheet (the one being edited, or its history).
+        filter = Q(scoresheet__isnull=True, match__actual__isnull=False)
+        if scoresheet is not None:
+            filter |= Q(scoresheet__pk=scoresheet)
+        return queryset.filter(filter).select_related(
+            'match', 'team').order_by('-match__actual', 'match', 'station')
+
+    @staticmethod
+    def get_version(request, pk):
+        # Memoised per request, since forms (and so their fields) can be
+        # built more than once per request.
+        versions = request.__dict__.setdefault('_fllfms_versions', {})
+        if str(pk) not in versions:
+            versions[str(pk)] = Version.objects.get(pk=pk)
+        return versions[str(pk)]
+
+    def _reversion_revisionform_view(self, request, version, *args, **kwargs):
+        # The revision and recover views have already fetched the version.
+        request.__dict__.setdefault('_fllfms_versions', {})[
+            str(version.pk)] = version
+        return super()._reversion_revisionform_view(
+            request, version, *args, **kwargs)
+
+    def get_queryset(self, request):
+        # For str(scoresheet), e.g. in the change and history view titles.
+        return super().get_queryset(request).select_related(
+            'player__match', 'player__team')
+
+    PLAYER_AUTOCOMPLETE_PAGE = 20
+
+    def player_autocomplete_view(self, request):
+        # Search for PlayerAutocompleteSelect (in the select2 format).
+        # Each (integer) search term matches a team number or match number.
+        if not (self.has_add_permission(request)
+                or self.has_change_permission(request)):
+            raise PermissionDenied
+        scoresheet = request.GET.get('scoresheet')
+        try:
+            page = max(int(request.GET.get('page', 1)), 1)
+            if scoresheet is not None:
+                scoresheet = int(scoresheet)
+        except ValueError:
+            return JsonResponse({'error': _("Invalid request.")}, status=400)
+
+        queryset = self.player_choices(Player._default_manager, scoresheet)
+        for term in request.GET.get('term', '').split():
+            with suppress(ValueError):
+                term = int(term)
+                queryset = queryset.filter(
+                    Q(team__number=term) | Q(match__number=term))
+
+        # Fetch one extra, rather than counting, to know if there's more.
+        size = self.PLAYER_AUTOCOMPLETE_PAGE
+        players = list(queryset[(page - 1) * size:page * size + 1])
+        return JsonResponse({
+            'results': [{'id': str(p.pk), 'text': str(p)}
+                        for p in players[:size]],
+            'pagination': {'more': len(players) > size},
+        })
+
+    SUBMIT_BATCH_LIMIT = 100
+
+    def submit_view(self, request):
+        # Batch submission for referee tablets (see scoresheet_queue.js).
+        # Expects {"scoresheets": [{"key": uuid, "fields": {...}}, ...]},
+        # where fields are as posted by the add form. Each scoresheet is
+        # validated by the add form (and so the model's clean()), and saved
+        # in a savepoint of its own, so one rejected by the database doesn't
+        # take the rest with it. Keys which were already saved (even by a
+        # concurrent retry) are reported as duplicates, so retries are safe.
+        if request.method != 'POST':
+            return HttpResponseNotAllowed(['POST'])
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+
+        try:
+            items = json.loads(request.body.decode())['scoresheets']
+            if not isinstance(items, list):
+                raise TypeError
+        except (ValueError, KeyError, TypeError):
+            return JsonResponse({'error': _("Invalid request.")}, status=400)
+        if len(items) > self.SUBMIT_BATCH_LIMIT:
+            return JsonResponse({'error': _(
+                "Too many scoresheets (maximum {}).").format(
+                    self.SUBMIT_BATCH_LIMIT)}, status=400)
+
+        def parse(item):
+            # Returns (key, fields), or None if the item is malformed.
+            try:
+                return uuid.UUID(str(item['key'])), dict(item['fields'])
+            except (KeyError, TypeError, ValueError):
+                return None
+        parsed = [parse(item) for item in items]
+
+        form_class = self.get_form(request)
+        results = []
+        with transaction.atomic():
+            # One query for all retried submissions, rather than per item.
+            saved = {k: (pk, score) for k, pk, score in
+                     self.model.objects.filter(submission__in=[
+                         p[0] for p in parsed if p is not None
+                     ]).values_list('submission', 'pk', 'score')}
+
+            for item, p in zip(items, parsed):
+                result = {'key': item.get('key')
+                          if isinstance(item, dict) else None}
+                results.append(result)
+                if p is None:
+                    result.update(status='invalid', errors={'__all__': [
+                        {'message': _("Invalid key or fields."),
+                         'code': 'invalid'}]})
+                    continue
+                k, fields = p
+                if k in saved:
+                    result.update(status='duplicate', pk=saved[k][0],
+                                  score=saved[k][1])
+                    continue
+
+                form = form_class(data=fields)
+                if not form.is_valid():
+                    result.update(status='invalid',
+                                  errors=form.errors.get_json_data())
+                    continue
+                obj = form.save(commit=False)
+                obj.submission = k
+                try:
+                    # A revision each, as if entered through the add form.
+                    with transaction.atomic(), self.create_revision(request):
+                        obj.save()
+                        self.log_addition(request, obj, [{'added': {}}])
+                except IntegrityError as e:
+                    if not violates(e, self.model, 'submission'):
+                        # E.g. the player was scored since validation.
+                        result.update(status='invalid', errors={'__all__': [
+                            {'message': _("Could not be saved, please "
+                                          "check and re-enter."),
+                             'code': 'integrity'}]})
+                        continue
+                    saved[k] = self.model.objects.filter(
+                        submission=k).values_list('pk', 'score').get()
+                    result.update(status='duplicate', pk=saved[k][0],
+                                  score=saved[k][1])
+                    continue
+                saved[k] = (obj.pk, obj.score)  # In case of repeats.
+                result.update(status='created', pk=obj.pk, score=obj.score)
+
+        return JsonResponse({'results': results})
+
     def get_fieldsets(self, request, obj=None):
         # Replace signature with imgsignature if it's going to be readonly.
         # Kinda cheaty, but admin forms can only output text/booleans.
@@ -394,7 +894,7 @@ class ScoresheetAdmin(VersionAdmin, admin.ModelAdmin):
             }),
             *self._mission_fieldsets,
             (_("Sign off"), {
-                'fields': [signature]
+                'fields': ['scorepreview', signature]
             }),
         )
 
@@ -403,10 +903,7 @@ class ScoresheetAdmin(VersionAdmin, admin.ModelAdmin):
 
         if db_field.name == 'player':
             if 'queryset' not in kwargs:
-                # Specify limiting and especially ordering here, not model.
                 mgr = db_field.remote_field.model._default_manager.using(db)
-                filter = Q(scoresheet__isnull=True,
-                           match__actual__isnull=False)
 
                 # If we're editing existing, show current selection too.
                 obj = request.resolver_match.kwargs.get('object_id')
@@ -416,7 +913,7 @@ class ScoresheetAdmin(VersionAdmin, admin.ModelAdmin):
                     # Slice, then add [None] in case empty, then get element.
                     obj = (request.resolver_match.args[-1:] + (None,))[0]
                     if obj is not None:
-                        obj = Version.objects.get(pk=obj)  # Get prev version.
+                        obj = self.get_version(request, obj)  # Prev version.
 
                         # When editing a revision, or recovering a deleted
                         # object, a fake version is created to restore from. If
@@ -446,11 +943,18 @@ class ScoresheetAdmin(VersionAdmin, admin.ModelAdmin):
                         # For now, it's actually the old value from the fake.
                         obj = obj.field_dict.get(Scoresheet._meta.pk.column)
 
-                if obj is not None:
-                    filter |= Q(scoresheet__pk=obj)
+                kwargs['queryset'] = self.player_choices(mgr, obj)
 
-                kwargs['queryset'] = mgr.filter(filter).order_by(
-                    '-match__actual', 'match', 'station')
+                # Rather than a <select> of every player, only the selected
+                # player is rendered, and the rest are searched for.
+                if 'widget' not in kwargs:
+                    info = (self.admin_site.name,
+                            *self.model._meta.label_lower.split('.'))
+                    url = reverse("{}:{}_{}_player_autocomplete".format(*info))
+                    if obj is not None:
+                        url += "?" + urlencode({'scoresheet': obj})
+                    kwargs['widget'] = PlayerAutocompleteSelect(
+                        db_field.remote_field, self.admin_site, url, using=db)
 
             # Skip the RelatedFieldWidgetWrapper.
             return db_field.formfield(**kwargs)
@@ -460,11 +964,20 @@ class ScoresheetAdmin(VersionAdmin, admin.ModelAdmin):
             return db_field.formfield(**kwargs)
 
         if db_field.name == 'signature':
-            return db_field.formfield(form_class=SignatureField, **kwargs)
+            # Not a ModelChoiceField, signatures are entered as data.
+            info = (self.admin_site.name,
+                    *self.model._meta.label_lower.split('.'))
+            return SignatureField(
+                label=capfirst(db_field.verbose_name),
+                widget=SignatureWidget(url=reverse(
+                    "{}:{}_{}_signature".format(*info),
+                    args=['__digest__'])))
 
         if db_field.name in self._mission_fields:
             if 'widget' not in kwargs:
-                kwargs['widget'] = RadioRow()
+                # The model field's choices never change, so can be cached.
+                kwargs['widget'] = RadioRow(
+                    cache_key=None if 'choices' in kwargs else db_field)
             if 'choices' not in kwargs:
                 kwargs['choices'] = db_field.get_choices(include_blank=False)
 
@@ -473,6 +986,10 @@ class ScoresheetAdmin(VersionAdmin, admin.ModelAdmin):
         # Later: filter on referee role for referee field.
         return super().formfield_for_dbfield(db_field, request, **kwargs)
 
+    class Media:
+        js = ("fllfms/score_preview.js", "fllfms/scoresheet_queue.js")
+        css = {'all': ("fllfms/score_preview.css",)}
+
 
 class TimerStageAdmin(admin.TabularInline):
     model = TimerStage
@@ -482,7 +999,13 @@ class TimerStageAdmin(admin.TabularInline):
 
 
 @admin.register(Timer)
-class TimerAdmin(VersionAdmin, admin.ModelAdmin):
+class TimerAdmin(BatchedVersionAdmin, admin.ModelAdmin):
+    # The timer's state and start time change all through an event (and
+    # aren't edited here), so keep them out of its history. Reverting leaves
+    # them at their defaults, i.e. a reset timer.
+    reversion_options = {'exclude': ('state', 'starttime',),
+                         'ignore_duplicates': True}
+
     list_display = ('id', 'name', 'match', 'statestring', 'profile',)
     list_display_links = list_display[:2]
     fields = ('id', 'name', 'profile', 'statestring', 'match',)
@@ -536,7 +1059,7 @@ class TimerAdmin(VersionAdmin, admin.ModelAdmin):
 
 
 @admin.register(TimerProfile)
-class TimerProfileAdmin(VersionAdmin, admin.ModelAdmin):
+class TimerProfileAdmin(BatchedVersionAdmin, admin.ModelAdmin):
     list_display = ('name', 'duration', 'format',)
     # fields = list_display
     ordering = ('name', 'duration', 'pk',)
@@ -6,4 +6,4 @@ class FLLFMSConfig(AppConfig):
     verbose_name = "FLL FMS"
 
     def ready(self):
-        from . import signals  # Bind signals.
+        from . import signals, sqlite  # Bind signals.
@@ -11,6 +11,8 @@ from channels.generic.websocket import JsonWebsocketConsumer
 from django.contrib.admin.utils import unquote
 from django.contrib.staticfiles.templatetags.staticfiles import static
 from django.core.exceptions import ValidationError
+from django.utils.dateformat import time_format
+from django.utils.timezone import localtime
 
 from .models import APP_STATIC_ROOT, Match, Timer, TimerProfile, TIMERSTATES
 
@@ -46,8 +48,8 @@ class TimerConsumer(JsonWebsocketConsumer):
     def send_profile(cls, profile, sendable=None):
         if sendable is None:
             def sendable(msg):
-                for timer in profile.timers.values('pk'):
-                    cls.group_sendable(cls.getgroup(timer, "profile"))
+                for timer in profile.timers.values_list('pk', flat=True):
+                    cls.group_sendable(cls.getgroup(timer, "profile"))(msg)
 
         def as_static(path):
             if not path:
@@ -264,3 +266,34 @@ class TimerConsumer(JsonWebsocketConsumer):
         with suppress(TypeError, KeyError):
             code = code['code']  # In case this is a dispatched event.
         super().close(code)
+
+
+class ScheduleConsumer(JsonWebsocketConsumer):
+    # Pushes projected start times (see projection.py) to schedule displays.
+    # The schedule is public, and nothing is received, so no session checks.
+    channel_layer = get_channel_layer(
+        JsonWebsocketConsumer.channel_layer_alias)
+
+    group = "schedule"
+    groups = [group]
+
+    @classmethod
+    def send_projected(cls, matches):
+        # Times are formatted here, as on the page, in the server's time zone
+        # (not the browser's, which may differ).
+        async_to_sync(cls.channel_layer.group_send)(cls.group, {
+            'type': "projected",
+            'matches': [
+                {
+                    'id': match.pk,
+                    'projected': (
+                        time_format(localtime(match.projected), "H:i")
+                        if match.projected is not None else None),
+                    'played': match.actual is not None,
+                }
+                for match in matches
+            ],
+        })
+
+    def projected(self, message):
+        self.send_json(message)
@@ -52,6 +52,11 @@ FLLFMS = {
         "Ranking",
         "Practice",
     ])),
+
+    # SQLite connections are configured by fllfms/sqlite.py (WAL, etc.).
+    # 'SQLITE_PRAGMAS': {'synchronous': "FULL"},
+    # Seconds between ANALYZE and WAL checkpoints (0 to disable).
+    # 'SQLITE_MAINTENANCE_INTERVAL': 300,
 }
 
 
@@ -140,6 +145,8 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # Reuse connections (and their page cache) between requests.
+        'CONN_MAX_AGE': 60,
     }
 }
 
@@ -0,0 +1,32 @@
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext as _
+
+from ...models import Scoresheet
+
+
+class Command(BaseCommand):
+    # We can't gettext_lazy here as the help output function needs a string.
+    help = _("Reports scoresheets whose cached score doesn't match their "
+             "missions (calculated by the database, in a single query).")
+
+    def handle(self, *args, **kwargs):
+        try:
+            stale = Scoresheet.objects.stale().select_related(
+                'player__match', 'player__team').order_by('pk')
+        except ImproperlyConfigured as e:
+            raise CommandError(_("{} Use 'rescore --dry-run' instead.").format(
+                e))
+
+        count = 0
+        for sheet in stale:
+            count += 1
+            self.stdout.write(_("{}: cached {}, calculated {}").format(
+                sheet, sheet.score, sheet.calculated_score))
+
+        if count:
+            # Nonzero exit status, so the audit can be scripted.
+            raise CommandError(_(
+                "{} cached scores are stale. Run 'rescore' to fix them."
+                ).format(count))
+        self.stdout.write(self.style.SUCCESS(_("All cached scores match.")))
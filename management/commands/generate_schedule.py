@@ -0,0 +1,259 @@
+from collections import Counter
+import csv
+import datetime
+from itertools import combinations, permutations
+import random
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.utils.translation import gettext as _
+from django.utils.timezone import get_current_timezone as tz
+
+from ...models import Team, Match
+from ...signals import ScheduleProjection
+from .import_schedule import Command as ImportCommand
+
+
+class Scheduler:
+    # Builds one schedule, as rows for ImportCommand.plan(). Matches are laid
+    # out in slots (every cycle), with up to one match per field in a slot.
+    # Each round is filled before the next starts. The next team is the one
+    # waiting longest, with ties broken at random, and its opponents are the
+    # teams it has met least, then those waiting longest. Teams are only
+    # picked after turnaround since their last match. A round's last match
+    # is filled with surrogates (who have already played in the round).
+    def __init__(self, teams, rounds, fields, stations, cycle, turnaround,
+                 rng):
+        self.teams = teams
+        self.rounds = rounds
+        self.fields = fields
+        self.stations = stations
+        self.cycle = cycle
+        self.turnaround = turnaround
+        self.rng = rng
+
+        self.last = {}  # Start time of the team's last match.
+        self.met = Counter()  # By (team, team), in number order.
+        self.on_field = Counter()  # By (team, field).
+        self.on_station = Counter()  # By (team, station).
+        self.surrogates = Counter()  # By team.
+        self.order = {}  # Random tie breaks, per round.
+
+    def ready(self, team, time):
+        last = self.last.get(team)
+        return last is None or time - last >= self.turnaround
+
+    def pick(self, candidates, picked, field):
+        def cost(team):
+            return (sum(self.met[min(t, team), max(t, team)] for t in picked),
+                    self.on_field[team, field],
+                    self.last.get(team, datetime.datetime.min),
+                    self.order[team])
+        return min(candidates, key=cost)
+
+    def fill(self, time, field, remaining, busy):
+        # The teams to play on field at time, as {station: team}, or {} if
+        # there aren't yet enough ready to fill the match.
+        size = len(self.stations)
+        ready = [t for t in remaining - busy if self.ready(t, time)]
+        if not ready or (len(ready) < size and len(remaining - busy) >= size):
+            return {}
+        surrogates = sorted(
+            (t for t in self.teams
+             if t not in remaining and t not in busy and self.ready(t, time)),
+            key=lambda t: (self.surrogates[t], self.order[t]))
+        surrogates = surrogates[:max(0, size - len(ready))]
+        if len(ready) + len(surrogates) < min(size, len(self.teams)):
+            # Better to wait for surrogates than start a match short.
+            return {}
+
+        picked = []
+        while ready and len(picked) < size:
+            team = self.pick(ready, picked, field)
+            ready.remove(team)
+            picked.append(team)
+        for team in surrogates:
+            self.surrogates[team] += 1
+            picked.append(team)
+
+        # The stations each team has used least.
+        stations = min(permutations(self.stations, len(picked)), key=lambda p:
+                       sum(self.on_station[t, s] for t, s in zip(picked, p)))
+        for a, b in combinations(sorted(picked), 2):
+            self.met[a, b] += 1
+        for team, station in zip(picked, stations):
+            self.last[team] = time
+            self.on_field[team, field] += 1
+            self.on_station[team, station] += 1
+        return dict(zip(stations, picked))
+
+    def run(self, start):
+        rows = []
+        time = start
+        for round in range(self.rounds):
+            self.order = {t: self.rng.random() for t in self.teams}
+            remaining = set(self.teams)
+            offset = 0
+            while remaining:
+                players, busy = {}, set()
+                for i in range(len(self.fields)):
+                    # Rotate which field is filled first, to balance them.
+                    field = self.fields[(offset + i) % len(self.fields)]
+                    stations = self.fill(time, field, remaining, busy)
+                    if stations:
+                        players[field] = stations
+                        busy.update(stations.values())
+                remaining -= busy
+                if players:
+                    rows.append((time, players))
+                    offset += 1
+                time += self.cycle
+        return rows
+
+    def cost(self):
+        # Repeat opponents count more than imbalanced fields or stations.
+        return (sum(n * n for n in self.met.values()) * 4
+                + sum(n * n for n in self.on_field.values())
+                + sum(n * n for n in self.on_station.values())
+                + sum(self.surrogates.values()))
+
+
+class Command(ImportCommand):
+    # We can't gettext_lazy here as the help output function needs a string.
+    help = _("Generates a match schedule for the teams.")
+
+    # Many schedules are built at random (see Scheduler), and the one with
+    # the fewest repeat opponents and imbalanced fields is kept. Then it's
+    # planned and inserted just as imported schedules are.
+
+    def add_arguments(self, parser):
+        def start(strval):
+            return datetime.datetime.strptime(strval, "%Y-%m-%dT%H:%M")
+
+        def minutes(strval):
+            return datetime.timedelta(minutes=int(strval))
+
+        TOURNAMENTS = settings.FLLFMS['TOURNAMENTS']
+        parser.add_argument('start', type=start,
+                            help=_("First match time (yyyy-mm-ddThh:mm)"))
+        parser.add_argument('--tournament', type=int,
+                            default=TOURNAMENTS[0][0],
+                            choices=[t[0] for t in TOURNAMENTS],
+                            help=_("Tournament, one of: {}").format(", ".join(
+                                "{} ({})".format(*t) for t in TOURNAMENTS)))
+        parser.add_argument('--teams', type=str,
+                            help=_("File of teams (number,name) to schedule, "
+                                   "instead of all saved teams"))
+        parser.add_argument('--rounds', type=int, default=3,
+                            help=_("Matches for each team"))
+        parser.add_argument('--fields', type=int,
+                            default=len(settings.FLLFMS['FIELDS']),
+                            help=_("Fields used at once"))
+        parser.add_argument('--cycle', type=minutes, default=minutes(5),
+                            help=_("Minutes between match starts"))
+        parser.add_argument('--turnaround', type=minutes,
+                            default=minutes(15),
+                            help=_("Minimum minutes between a team's "
+                                   "matches"))
+        parser.add_argument('--attempts', type=int, default=20,
+                            help=_("Schedules to try"))
+        parser.add_argument('--seed', type=int,
+                            help=_("Random seed, to repeat a schedule"))
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help=_("Rows per bulk insert query"))
+        parser.add_argument('--dry-run', action='store_true',
+                            help=_("Show the schedule without saving it"))
+
+    def read_teams(self, file):
+        # Returns {number: name}, from the file if given, else the database.
+        if file is None:
+            return dict(Team.objects.values_list('number', 'name'))
+        teams = {}
+        with open(file, newline='') as f:
+            for row in csv.reader(f):
+                if not row or not row[0].strip():
+                    continue
+                try:
+                    number = int(row[0])
+                except ValueError:
+                    raise CommandError(_("Invalid team number {!r}.").format(
+                        row[0])) from None
+                if number in teams:
+                    raise CommandError(_(
+                        "Team {} is listed twice.").format(number))
+                teams[number] = row[1].strip() if len(row) > 1 else ""
+        return teams
+
+    def schedule(self, teams, start, attempts, seed, **kwargs):
+        # The best of several schedules, as rows for plan().
+        rng = random.Random(seed)
+        best = None
+        for attempt in range(attempts):
+            scheduler = Scheduler(sorted(teams), rng=rng, **kwargs)
+            rows = scheduler.run(start)
+            score = (scheduler.cost(), rows[-1][0])
+            if best is None or score < best[0]:
+                best = score, rows, scheduler
+        (cost, end), rows, scheduler = best
+        self.stdout.write(_(
+            "Best of {} schedules ends {}. Teams meet at most {} times, and "
+            "{} surrogates are needed.").format(
+                attempts, end.isoformat(), max(scheduler.met.values(),
+                                               default=0),
+                sum(scheduler.surrogates.values())))
+        return rows
+
+    @transaction.atomic()
+    def handle(self, start, tournament, teams, rounds, fields, cycle,
+               turnaround, attempts, seed, batch_size, dry_run, *args,
+               **kwargs):
+        FIELDS = settings.FLLFMS['FIELDS']
+        STATIONS = settings.FLLFMS['STATIONS']
+        if Match.objects.filter(tournament=tournament).exists():
+            raise CommandError(_(
+                "Matches already exist in the tournament, will not "
+                "overwrite. Terminating."))
+        if not 1 <= fields <= len(FIELDS):
+            raise CommandError(_("Between 1 and {} fields can be used."
+                                 ).format(len(FIELDS)))
+        if rounds < 1 or attempts < 1:
+            raise CommandError(_("Rounds and attempts must be positive."))
+
+        teams = self.read_teams(teams)
+        if not teams:
+            raise CommandError(_("No teams to schedule."))
+        self.stdout.write(_("Scheduling {} teams.").format(len(teams)))
+
+        # Fields and stations are indexes into FIELDS and STATIONS (as rows
+        # of an imported schedule are).
+        rows = self.schedule(
+            teams, start, attempts, seed, rounds=rounds,
+            fields=list(range(fields)), stations=list(range(len(STATIONS))),
+            cycle=cycle, turnaround=turnaround)
+        # Localised per row, rather than adding cycles to an aware start.
+        new, matches = self.plan(teams, [
+            (tournament, tz().localize(time), players)
+            for time, players in rows])
+        saved = set(Team.objects.values_list('number', flat=True))
+        new = [team for team in new if team.number not in saved]
+
+        for match, players in matches:
+            self.stdout.write("{} {} {}: {}".format(
+                match.schedule.strftime("%Y-%m-%d %H:%M"),
+                dict(FIELDS)[match.field], match.number, " v ".join(
+                    "{}{}".format(team, "*" if player.surrogate else "")
+                    for player, team in players)))
+
+        self.create(new, matches, batch_size)
+        # No signals are sent by bulk queries, so update the match counts,
+        # and project the new schedule.
+        Match.objects.update_state()
+        ScheduleProjection.queue(fields=[field for field, name in FIELDS])
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(_(
+                "Dry run: nothing was saved.")))
+            transaction.set_rollback(True)
+            return
+        self.stdout.write(self.style.SUCCESS(_("Complete.")))
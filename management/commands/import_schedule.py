@@ -9,16 +9,21 @@ from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
+from django.db.models import Exists, OuterRef
 from django.utils.translation import gettext as _
 from django.utils.timezone import get_current_timezone as tz
 
-from ...models import Team, Match, Player
+from ...models import Team, Match, Player, Scoresheet, Timer
+from ...signals import MatchPayloadRefresh, ScheduleProjection
 
 
 class Command(BaseCommand):
     # We can't gettext_lazy here as the help output function needs a string.
     help = _("Imports a schedule file (with teams).")
 
+    # The whole file is parsed and checked in memory first (see plan()), then
+    # inserted with a few bulk queries, rather than a few queries per row.
+
     def add_arguments(self, parser):
         def date(strval):
             return datetime.date(*map(int, strval.split('-')))
@@ -27,140 +32,100 @@ class Command(BaseCommand):
         parser.add_argument('date', type=date, nargs='?',
                             default=datetime.date.today(),
                             help=_("First day of competition (yyyy-mm-dd)"))
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help=_("Rows per bulk insert query"))
+        parser.add_argument('--dry-run', action='store_true',
+                            help=_("Check the file without saving anything"))
+        parser.add_argument('--merge', action='store_true',
+                            help=_("Update existing data to match the file"))
 
-    @transaction.atomic()
-    def handle(self, file, date, *args, **kwargs):
-        if Team.objects.exists() or Match.objects.exists():
-            # Check for non-empty db. Player objects require Team and Match.
-            raise CommandError(_(
-                "Data already exists, will not overwrite. Terminating."))
-
-        TOURNAMENTS = [i[0] for i in settings.FLLFMS['TOURNAMENTS']]
+    def parse_match_row(self, row, date):
+        # Returns the row's time, and its teams as {field: {station: team}},
+        # where field and station are indexes into FIELDS and STATIONS.
         FIELDS = [i[0] for i in settings.FLLFMS['FIELDS']]
         STATIONS = [i[0] for i in settings.FLLFMS['STATIONS']]
 
-        def process_match_row(row, tournament):
-            try:
-                # Some of them store in decimal (% of day passed).
-                days = int(float(row[1]))
-                seconds = (float(row[1]) % 1) * 86400  # 86400 in 1 day.
-                # hour, minute, second, microsecond
-                time = datetime.time(seconds // 3600, seconds // 60,
-                                     seconds // 1, seconds % 1)
-
-            except ValueError:
-                # Otherwise attempt to match "(Day 1 )11:03(:00) AM".
-                strtime = re.match(
-                    "^(Day (?P<day>\d+) )?"
-                    "(?P<hour>((0?|1)[0-9])|(2[0-3])):(?P<minute>[0-5][0-9])"
-                    "(:(?P<second>[0-5][0-9]))? (?P<meridiem>[AP]M)$",
-                    row[1], re.IGNORECASE)
-
-                if strtime:
-                    def getint(group):
-                        # Helper function: make integer from regex group.
-                        val = strtime.group(group)
-                        if val is None:
-                            return 0
-                        return int(val)
-
-                    # Days are 1-indexed (subtract 1), but None -> 0.
-                    # By using max(0, day-1), it can't fall below 0.
-                    days = max(0, getint('day')-1)
-
-                    # Calculate hour before instantiating immutable time().
-                    hour = getint('hour')
-                    if strtime.group('meridiem').upper() == "PM" and hour < 12:
-                        hour += 12
-
-                    # No microsecond value available here.
-                    time = datetime.time(hour, getint('minute'),
-                                         getint('second'))
-
-                else:
-                    raise ValueError(_("Couldn't parse timestamp {!r}.").
-                                     format(row[1])) from None
-
-            # We can't simply add a timedelta to the start date.
-            # e.g. 11am on the day where daylight savings starts, hours=11 will
-            # actually result in 12pm (2am-3am does not exist).
-            time = datetime.datetime.combine(
-                date + datetime.timedelta(days=days), time)
-            time = tz().localize(time)
-
-            players = defaultdict(dict)
-            # Each field column is `(field * station) - 1` (zero-indexed).
-            # e.g. A1,A2,B1,B2, etc. (works for any number of stations/fields).
-            for col, team in enumerate(row[3:]):
-                if not team:
-                    continue  # No team, skip.
-                team = int(team)
-
-                field = col // len(STATIONS)
-                if field > len(FIELDS):
-                    # (Avoids FIELDS[field] IndexError, more details this way.)
-                    raise ValueError(_(
-                        "Field number {0} too large (max {1}) (time {2})."
-                        ).format(field, len(FIELDS), time.isoformat()))
-
-                players[field][col % len(STATIONS)] = team
-
-            if not players:
-                players[0] = {}  # Default to first field (no players).
-            elif len(players) > 1:
-                # Warn, but not a breaking error, even if extra supplied.
-                self.stdout.write(self.style.WARNING(_(
-                    "Splitting simultaneous match (time {}).").format(
-                        time.isoformat())))
-
-            for field in players:
-                # Now save the objects to the database.
-                number = 1
-                round = 1
-                last = Match.objects.filter(
-                    tournament=tournament).order_by('number').last()
-                if last is not None:
-                    number = last.number + 1
-                    round = last.round
-
-                # Enum value by index for field.
-                match = Match(
-                    tournament=tournament, number=number, round=round,
-                    field=FIELDS[field], schedule=time, actual=None)
-                match.full_clean()  # Ensure friendly errors.
-                match.save()
-
-                # Find players that fail full_clean() (duplicate team/round).
-                clean_players = []
-                dirty_players = []  # "Clean failed."
-                for stn, team in players[field].items():
-                    team = Team.objects.get(number=team)
-                    # Get station enum value by index.
-                    player = Player(team=team, match=match,
-                                    station=STATIONS[stn], surrogate=False)
-                    try:
-                        player.full_clean()
-                        # No exceptions, so it's clean.
-                        clean_players.append(player)
-                    except ValidationError:
-                        # Too difficult to ensure correct ValidationError, so
-                        # just assume it is. Presumably any db constraints will
-                        # restrict all the important things anyway.
-                        dirty_players.append(player)
+        try:
+            # Some of them store in decimal (% of day passed).
+            days = int(float(row[1]))
+            seconds = (float(row[1]) % 1) * 86400  # 86400 in 1 day.
+            # hour, minute, second, microsecond
+            time = datetime.time(seconds // 3600, seconds // 60,
+                                 seconds // 1, seconds % 1)
 
-                # If (players exist, and) all are repeats, then next round.
-                if dirty_players and not clean_players:
-                    match.round += 1
-                    match.save()  # During setup, no race condition F(...).
-                # Else, make the extras surrogates.
-                else:
-                    for p in dirty_players:
-                        p.surrogate = True
-                # Finally, save all.
-                clean_players.extend(dirty_players)
-                for p in clean_players:
-                    p.full_clean()  # Ensure friendly errors.
-                    p.save()
+        except ValueError:
+            # Otherwise attempt to match "(Day 1 )11:03(:00) AM".
+            strtime = re.match(
+                r"^(Day (?P<day>\d+) )?"
+                "(?P<hour>((0?|1)[0-9])|(2[0-3])):(?P<minute>[0-5][0-9])"
+                "(:(?P<second>[0-5][0-9]))? (?P<meridiem>[AP]M)$",
+                row[1], re.IGNORECASE)
+
+            if strtime:
+                def getint(group):
+                    # Helper function: make integer from regex group.
+                    val = strtime.group(group)
+                    if val is None:
+                        return 0
+                    return int(val)
+
+                # Days are 1-indexed (subtract 1), but None -> 0.
+                # By using max(0, day-1), it can't fall below 0.
+                days = max(0, getint('day')-1)
+
+                # Calculate hour before instantiating immutable time().
+                hour = getint('hour')
+                if strtime.group('meridiem').upper() == "PM" and hour < 12:
+                    hour += 12
+
+                # No microsecond value available here.
+                time = datetime.time(hour, getint('minute'),
+                                     getint('second'))
+
+            else:
+                raise ValueError(_("Couldn't parse timestamp {!r}.").
+                                 format(row[1])) from None
+
+        # We can't simply add a timedelta to the start date.
+        # e.g. 11am on the day where daylight savings starts, hours=11 will
+        # actually result in 12pm (2am-3am does not exist).
+        time = datetime.datetime.combine(
+            date + datetime.timedelta(days=days), time)
+        time = tz().localize(time)
+
+        players = defaultdict(dict)
+        # Each field column is `(field * station) - 1` (zero-indexed).
+        # e.g. A1,A2,B1,B2, etc. (works for any number of stations/fields).
+        for col, team in enumerate(row[3:]):
+            if not team:
+                continue  # No team, skip.
+            team = int(team)
+
+            field = col // len(STATIONS)
+            if field >= len(FIELDS):
+                # (Avoids FIELDS[field] IndexError, more details this way.)
+                raise ValueError(_(
+                    "Field number {0} too large (max {1}) (time {2})."
+                    ).format(field + 1, len(FIELDS), time.isoformat()))
+
+            players[field][col % len(STATIONS)] = team
+
+        if not players:
+            players[0] = {}  # Default to first field (no players).
+        elif len(players) > 1:
+            # Warn, but not a breaking error, even if extra supplied.
+            self.stdout.write(self.style.WARNING(_(
+                "Splitting simultaneous match (time {}).").format(
+                    time.isoformat())))
+
+        return time, players
+
+    def parse(self, file, date):
+        # Returns the teams as {number: name}, and the match rows as a list of
+        # (tournament, time, players), players as from parse_match_row().
+        TOURNAMENTS = [i[0] for i in settings.FLLFMS['TOURNAMENTS']]
+        teams = {}
+        rows = []
 
         with open(file, newline='') as f:
             reader = csv.reader(f, delimiter=',', quotechar='"')
@@ -176,18 +141,21 @@ class Command(BaseCommand):
             with suppress(StopIteration):
                 # Block 1; teams.
                 self.stdout.write(self.style.SUCCESS(_(
-                    "Found block 1; importing teams...")))
+                    "Found block 1; reading teams...")))
                 next(reader)  # Number of Teams,26
                 row = next(reader)  # First team row.
                 while row[0] != "Block Format":
-                    team = Team(number=int(row[0]), name=row[1])
-                    team.full_clean()  # Ensure friendly errors.
-                    team.save()
+                    number = int(row[0])
+                    if number in teams:
+                        raise CommandError(_(
+                            "Team {} is listed more than once.").format(
+                                number))
+                    teams[number] = row[1]
                     row = next(reader)
 
                 # Block 2; ranking matches.
                 self.stdout.write(self.style.SUCCESS(_(
-                    "Found block 2; importing ranking matches...")))
+                    "Found block 2; reading ranking matches...")))
                 if len(row[1]) == 1:
                     # Normally skip Number of [Ranking] Matches, but some tools
                     # do miss the newline character, merging the following line
@@ -202,7 +170,8 @@ class Command(BaseCommand):
                 next(reader)  # Table Names
                 row = next(reader)  # First match row.
                 while row[0] != "Block Format":
-                    process_match_row(row, TOURNAMENTS[0])
+                    rows.append((TOURNAMENTS[0],
+                                 *self.parse_match_row(row, date)))
                     row = next(reader)
 
                 # Block 3; judging, ignored.
@@ -214,7 +183,7 @@ class Command(BaseCommand):
 
                 # Block 4; practice matches.
                 self.stdout.write(self.style.SUCCESS(_(
-                    "Found block 4; importing practice matches...")))
+                    "Found block 4; reading practice matches...")))
                 if len(row[1]) == 1:
                     # As before, check if the line was accidentally merged, and
                     # if it's split, we need to skip the extra line.
@@ -229,10 +198,279 @@ class Command(BaseCommand):
                     # We shouldn't see another "Block Format", so ultimately
                     # this goes until the end of the file (StopIteration).
                     # If we hit a "Block Format", we terminate early, all good.
-                    process_match_row(row, TOURNAMENTS[1])
+                    rows.append((TOURNAMENTS[1],
+                                 *self.parse_match_row(row, date)))
                     row = next(reader)
 
                 self.stdout.write(self.style.WARNING(_(
                     "Found a 5th block, but ignoring the rest of the file.")))
 
+        return teams, rows
+
+    def plan(self, teams, rows):
+        # Builds the (unsaved) teams, and the matches with their players, as
+        # [(match, [(player, team number)])]. Matches are numbered in order
+        # per tournament. A match whose teams have all played in the current
+        # round starts the next round, otherwise any repeat teams in it are
+        # surrogates. Indexes replace the database lookups for all of this.
+        FIELDS = [i[0] for i in settings.FLLFMS['FIELDS']]
+        STATIONS = [i[0] for i in settings.FLLFMS['STATIONS']]
+
+        def check(obj, *args, **kwargs):
+            # Field validation and clean() only, which don't query.
+            try:
+                obj.full_clean(*args, validate_unique=False, **kwargs)
+            except ValidationError as e:
+                raise CommandError(_("{!r}: {}").format(
+                    obj, " ".join(e.messages))) from None
+
+        teams = {number: Team(number=number, name=name)
+                 for number, name in teams.items()}
+        for team in teams.values():
+            check(team)
+
+        matches = []
+        last = {}  # (number, round) of the last match, by tournament.
+        played = set()  # (tournament, round, team) of non-surrogates.
+        for tournament, time, players in rows:
+            for field, stations in players.items():
+                number, round = last.get(tournament, (0, 1))
+                number += 1
+                for team in stations.values():
+                    if team not in teams:
+                        raise CommandError(_(
+                            "Team {} (time {}) isn't in the teams block."
+                            ).format(team, time.isoformat()))
+                if len(set(stations.values())) < len(stations):
+                    raise CommandError(_(
+                        "A team plays twice in one match (time {})."
+                        ).format(time.isoformat()))
+
+                # If (players exist, and) all are repeats, then next round.
+                # Else, make the extras surrogates.
+                repeat = {team for team in stations.values()
+                          if (tournament, round, team) in played}
+                if repeat and repeat == set(stations.values()):
+                    round += 1
+                    repeat = {team for team in stations.values()
+                              if (tournament, round, team) in played}
+                    if repeat:
+                        raise CommandError(_(
+                            "Teams {} play twice in round {} (time {})."
+                            ).format(sorted(repeat), round, time.isoformat()))
+                last[tournament] = number, round
+
+                match = Match(
+                    tournament=tournament, number=number, round=round,
+                    field=FIELDS[field], schedule=time, actual=None)
+                check(match)
+                match_players = []
+                for station, team in stations.items():
+                    player = Player(station=STATIONS[station],
+                                    surrogate=team in repeat, round=round,
+                                    tournament=tournament)
+                    # The related objects aren't saved yet (nor queried).
+                    check(player, exclude=['match', 'team'])
+                    match_players.append((player, team))
+                    if not player.surrogate:
+                        played.add((tournament, round, team))
+                matches.append((match, match_players))
+
+        return list(teams.values()), matches
+
+    def insert(self, model, objs, batch_size):
+        for start in range(0, len(objs), batch_size):
+            model.objects.bulk_create(objs[start:start + batch_size])
+            self.stdout.write(_("Inserted {} of {} {}.").format(
+                min(start + batch_size, len(objs)), len(objs),
+                model._meta.verbose_name_plural))
+
+    def insert_players(self, players, batch_size):
+        # Inserts the players, given as [(player, match, team number)].
+        # bulk_create() doesn't set pks on all databases, so look them up.
+        team_pks = dict(Team.objects.values_list('number', 'pk'))
+        match_pks = {(t, n): pk for t, n, pk in Match.objects.values_list(
+            'tournament', 'number', 'pk')}
+        for player, match, team in players:
+            player.match_id = match_pks[match.tournament, match.number]
+            player.team_id = team_pks[team]
+        self.insert(Player, [player for player, _, _ in players], batch_size)
+
+    def create(self, teams, matches, batch_size):
+        self.insert(Team, teams, batch_size)
+        self.insert(Match, [match for match, players in matches], batch_size)
+        self.insert_players([
+            (player, match, team) for match, players in matches
+            for player, team in players], batch_size)
+
+    def merge(self, teams, matches, batch_size):
+        # Applies only the differences between the file and the database,
+        # reporting each. Teams are identified by number, matches by their
+        # tournament and number, and players by their match and station, so
+        # existing matches keep their timers and actual start times.
+        # Scored players can't be removed or given another team.
+        def report(change, obj, detail=""):
+            self.stdout.write("{} {}{}".format(change, obj, detail))
+
+        teams = {team.number: team for team in teams}
+        old_teams = Team.objects.in_bulk(field_name='number')
+        old_matches = {(m.tournament, m.number): m
+                       for m in Match.objects.all()}
+        old_players = {
+            (p.match.tournament, p.match.number, p.station): p
+            for p in Player.objects.select_related('match', 'team').annotate(
+                scored=Exists(Scoresheet.objects.filter(
+                    player=OuterRef('pk'))))}
+
+        new_teams, changed_teams = [], []
+        for number, team in teams.items():
+            old = old_teams.get(number)
+            if old is None:
+                report("+", team)
+                new_teams.append(team)
+            elif old.name != team.name:
+                report("~", old, ": {!r} -> {!r}".format(old.name, team.name))
+                old.name = team.name
+                changed_teams.append(old)
+        removed_teams = [team for number, team in old_teams.items()
+                         if number not in teams]
+        for team in removed_teams:
+            report("-", team)
+
+        new_matches, changed_matches = [], []
+        new_players, changed_players, removed_players = [], [], []
+        blocked = []
+        fields = ('round', 'field', 'schedule')
+        keys = set()
+        for match, players in matches:
+            key = match.tournament, match.number
+            keys.add(key)
+            old = old_matches.get(key)
+            if old is None:
+                report("+", match)
+                new_matches.append(match)
+            else:
+                diff = [(f, getattr(old, f), getattr(match, f))
+                        for f in fields
+                        if getattr(old, f) != getattr(match, f)]
+                if diff:
+                    report("~", old, ": " + ", ".join(
+                        "{} {} -> {}".format(*d) for d in diff))
+                    for f, before, after in diff:
+                        setattr(old, f, after)
+                    changed_matches.append(old)
+                match = old or match
+
+            for player, team in players:
+                key = match.tournament, match.number, player.station
+                keys.add(key)
+                old = old_players.get(key)
+                if old is not None and old.team.number == team:
+                    if old.surrogate != player.surrogate:
+                        report("~", old, ": surrogate {} -> {}".format(
+                            old.surrogate, player.surrogate))
+                        old.surrogate = player.surrogate
+                        changed_players.append(old)
+                    continue
+                if old is not None:
+                    # Replaced, rather than updated (see apply below).
+                    if old.scored:
+                        blocked.append(old)
+                    report("-", old)
+                    removed_players.append(old)
+                report("+", match, ": {} team {}{}".format(
+                    player.get_station_display(), team,
+                    " (surrogate)" if player.surrogate else ""))
+                new_players.append((player, match, team))
+
+        removed_matches = [m for key, m in old_matches.items()
+                           if key not in keys]
+        for match in removed_matches:
+            report("-", match)
+        for key, player in old_players.items():
+            if key not in keys and key[:2] in keys:
+                report("-", player)
+                removed_players.append(player)
+            if key not in keys and player.scored:
+                blocked.append(player)
+
+        if blocked:
+            raise CommandError(_(
+                "Refusing to remove (or change the team of) players with "
+                "scoresheets: {}. Delete their scoresheets first.").format(
+                    ", ".join(map(str, blocked))))
+
+        # Players are replaced (not updated) if their team changes, so that
+        # swapping teams between stations can't clash on the way.
+        Player.objects.filter(pk__in=[p.pk for p in removed_players]).delete()
+        timers = list(Timer.objects.filter(
+            match__in=removed_matches).values_list('pk', flat=True))
+        Match.objects.filter(pk__in=[m.pk for m in removed_matches]).delete()
+        # The database checks player_round_tournament_uniq row by row, so a
+        # team's match can only take the non-surrogate place in a round once
+        # the old one has left it: players becoming surrogates go first, then
+        # matches move (with their players), then players stop being them.
+        self.insert(Team, new_teams, batch_size)
+        Team.objects.bulk_update(changed_teams, ['name'], batch_size)
+        Player.objects.bulk_update(
+            [p for p in changed_players if p.surrogate], ['surrogate'],
+            batch_size)
+        Match.objects.bulk_update(changed_matches, fields, batch_size)
+        Match.objects.filter(pk__in=[
+            m.pk for m in changed_matches if m.moved()]).update_players()
+        self.insert(Match, new_matches, batch_size)
+        Player.objects.bulk_update(
+            [p for p in changed_players if not p.surrogate], ['surrogate'],
+            batch_size)
+        self.insert_players(new_players, batch_size)
+        Team.objects.filter(pk__in=[t.pk for t in removed_teams]).delete()
+
+        # Displays showing the changed matches (or removed ones) need to know.
+        MatchPayloadRefresh.queue(
+            timers=timers, teams=[t.pk for t in changed_teams], matches={
+                *(m.pk for m in changed_matches),
+                *(p.match_id for p in changed_players),
+                *(p.match_id for p in removed_players),
+                *(p.match_id for p, m, t in new_players)})
+        self.stdout.write(self.style.SUCCESS(_(
+            "Merged: {} teams, {} matches and {} players added, {}, {} and {} "
+            "changed, {}, {} and {} removed.").format(
+                len(new_teams), len(new_matches), len(new_players),
+                len(changed_teams), len(changed_matches),
+                len(changed_players), len(removed_teams),
+                len(removed_matches), len(removed_players))))
+
+    @transaction.atomic()
+    def handle(self, file, date, batch_size, dry_run, merge, *args,
+               **kwargs):
+        existing = Team.objects.exists() or Match.objects.exists()
+        if existing and not merge:
+            # Check for non-empty db. Player objects require Team and Match.
+            raise CommandError(_(
+                "Data already exists, will not overwrite (see --merge). "
+                "Terminating."))
+
+        teams, matches = self.plan(*self.parse(file, date))
+        self.stdout.write(self.style.SUCCESS(_(
+            "Read {} teams, {} matches and {} players.").format(
+                len(teams), len(matches),
+                sum(len(players) for match, players in matches))))
+
+        if existing:
+            self.merge(teams, matches, batch_size)
+        else:
+            self.create(teams, matches, batch_size)
+
+        # No signals are sent by bulk queries, so update the match counts,
+        # and project the (new) schedule.
+        Match.objects.update_state()
+        ScheduleProjection.queue(
+            fields=[field for field, name in settings.FLLFMS['FIELDS']])
+
+        if dry_run:
+            # Rolled back, but only after the database checked it all too.
+            self.stdout.write(self.style.WARNING(_(
+                "Dry run: nothing was saved.")))
+            transaction.set_rollback(True)
+            return
         self.stdout.write(self.style.SUCCESS(_("Complete (end-of-file).")))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.translation import gettext as _
+from reversion.errors import RevertError
+from reversion.models import Version
+
+from ...models import Scoresheet, Signature
+
+
+class Command(BaseCommand):
+    # We can't gettext_lazy here as the help output function needs a string.
+    help = _("Deletes stored signatures which no scoresheet uses any more "
+             "(nor any version of one, so reverting still finds them).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help=_("Signatures per delete query"))
+        parser.add_argument('--dry-run', action='store_true',
+                            help=_("Report orphans without deleting them"))
+
+    @transaction.atomic()
+    def handle(self, chunk_size, dry_run, *args, **kwargs):
+        # Signatures are shared (content-addressed), and PROTECTed by their
+        # scoresheets, so they're left behind when those are deleted (or
+        # change signature). Versions only store the key, so those are kept.
+        used = set(Scoresheet.objects.values_list('signature', flat=True))
+        for version in Version.objects.get_for_model(Scoresheet).iterator():
+            try:
+                used.add(version.field_dict['signature_id'])
+            except (RevertError, KeyError):
+                # Better to keep them all than lose a version's signature.
+                raise CommandError(_(
+                    "Can't read the signature of version {}, nothing was "
+                    "deleted.").format(version.pk))
+
+        orphans = sorted(set(Signature.objects.values_list(
+            'pk', flat=True)) - used)
+        if not orphans:
+            self.stdout.write(self.style.SUCCESS(_("No orphaned signatures.")))
+            return
+        if dry_run:
+            self.stdout.write(self.style.WARNING(_(
+                "Dry run: {} orphaned signatures would be deleted.").format(
+                    len(orphans))))
+            return
+
+        for start in range(0, len(orphans), chunk_size):
+            Signature.objects.filter(
+                pk__in=orphans[start:start + chunk_size]).delete()
+        self.stdout.write(self.style.SUCCESS(_(
+            "Deleted {} orphaned signatures.").format(len(orphans))))
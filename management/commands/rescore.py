@@ -0,0 +1,90 @@
+from itertools import chain
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils.translation import gettext as _
+
+from ...models import Scoresheet
+
+
+class Command(BaseCommand):
+    # We can't gettext_lazy here as the help output function needs a string.
+    help = _("Recalculates the cached score of every scoresheet (e.g. after "
+             "correcting mission weights).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help=_("Rows per bulk update query"))
+        parser.add_argument('--dry-run', action='store_true',
+                            help=_("Report changes without saving them"))
+
+    def calculate(self, fields, rows):
+        # Returns an array of new scores, one per row (in the same order).
+        # Rows are (pk, score, *fields), as fetched in handle().
+        if Scoresheet.has_vectorised_scoring():
+            # Transpose rows into columns; booleans stay boolean so that
+            # season modules can use logical operators on them.
+            columns = {}
+            for i, (name, config) in enumerate(fields, 2):
+                dtype = np.int64 if 'choices' in config else np.bool_
+                columns[name] = np.fromiter(
+                    (row[i] for row in rows), dtype=dtype, count=len(rows))
+            return Scoresheet.calculatescores(columns)
+
+        # Custom scoring logic without a vectorised form. Build unsaved
+        # instances (mission fields only) and score them one at a time.
+        self.stdout.write(self.style.WARNING(_(
+            "{} has no vectorised calculatescores(), scoring each sheet "
+            "individually.").format(Scoresheet.__module__)))
+        names = [name for name, config in fields]
+        return np.array([
+            Scoresheet(**dict(zip(names, row[2:]))).calculatescore()
+            for row in rows
+        ], dtype=np.int64)
+
+    @transaction.atomic()
+    def handle(self, chunk_size, dry_run, *args, **kwargs):
+        fields = list(chain.from_iterable(
+            (m[1]['fields'] for m in Scoresheet.missions)))
+
+        # Lock the rows (where supported) so scores can't change underneath.
+        rows = list(Scoresheet.objects.select_for_update().order_by(
+            'pk').values_list('pk', 'score', *(f[0] for f in fields)))
+        if not rows:
+            self.stdout.write(self.style.SUCCESS(_("No scoresheets found.")))
+            return
+
+        pks = np.fromiter((row[0] for row in rows), dtype=np.int64,
+                          count=len(rows))
+        old = np.fromiter((row[1] for row in rows), dtype=np.int64,
+                          count=len(rows))
+        new = self.calculate(fields, rows)
+
+        changed = np.flatnonzero(old != new)
+        if not changed.size:
+            self.stdout.write(self.style.SUCCESS(_(
+                "All {} scores are up to date.").format(len(rows))))
+            return
+
+        # Only changed sheets are loaded in full, for readable output.
+        sheets = Scoresheet.objects.select_related(
+            'player__match', 'player__team').in_bulk(pks[changed].tolist())
+        for i in changed:
+            self.stdout.write(_("{}: {} -> {}").format(
+                sheets[int(pks[i])], old[i], new[i]))
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(_(
+                "Dry run: {} of {} scores would change.").format(
+                    changed.size, len(rows))))
+            transaction.set_rollback(True)
+            return
+
+        # bulk_update() skips save(), so score isn't recalculated again, and
+        # no signals or revisions are created (it's a cached value only).
+        Scoresheet.objects.bulk_update(
+            [Scoresheet(pk=int(pks[i]), score=int(new[i])) for i in changed],
+            ['score'], batch_size=chunk_size)
+        self.stdout.write(self.style.SUCCESS(_(
+            "Updated {} of {} scores.").format(changed.size, len(rows))))
@@ -0,0 +1,350 @@
+import ast
+from collections import defaultdict
+from functools import reduce
+from itertools import chain
+import inspect
+import operator
+import textwrap
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils.translation import gettext as _
+
+from ...models import Scoresheet
+from ...scoresheets._base import BaseScoresheet
+from ...scoresheets._expressions import Unsupported, q_json, tree_fields
+
+
+# Lookups and arithmetic of the expression trees (see _expressions.py), over
+# NumPy columns. Division truncates, as in the database (and the browser).
+LOOKUPS = {
+    'exact': operator.eq,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'in': lambda column, values: np.isin(column, list(values)),
+}
+OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': lambda lhs, rhs: np.trunc(np.divide(lhs, rhs)).astype(np.int64),
+}
+
+
+def evaluate_expression(tree, columns):
+    # Evaluate an expression tree over NumPy columns.
+    if 'field' in tree:
+        return columns[tree['field']]
+    if 'value' in tree:
+        return tree['value']
+    if 'op' in tree:
+        return OPS[tree['op']](*(evaluate_expression(arg, columns)
+                                 for arg in tree['args']))
+    size = len(next(iter(columns.values())))
+    return np.select(
+        [np.broadcast_to(evaluate_condition(condition, columns), size)
+         for condition, result in tree['case']],
+        [evaluate_expression(result, columns)
+         for condition, result in tree['case']],
+        evaluate_expression(tree['default'], columns))
+
+
+def evaluate_condition(tree, columns):
+    # Evaluate a condition tree over NumPy columns, returning a boolean array
+    # (True where the condition is satisfied).
+    results = []
+    for child in tree['children']:
+        if 'connector' in child:
+            results.append(evaluate_condition(child, columns))
+        else:
+            results.append(LOOKUPS[child['lookup']](
+                columns[child['field']],
+                evaluate_expression(child['value'], columns)))
+
+    join = operator.and_ if tree['connector'] == Q.AND else operator.or_
+    result = reduce(join, results, np.bool_(tree['connector'] == Q.AND))
+    return ~result if tree['negated'] else result
+
+
+def evaluate_q(q, columns):
+    # Evaluate a check constraint's Q object (raising Unsupported if it has
+    # no tree form).
+    return evaluate_condition(q_json(q), columns)
+
+
+def self_attributes(model, methods, names):
+    # Static analysis: which of names are read as self.<name> in the given
+    # methods, across every class in the model's MRO (above BaseScoresheet,
+    # whose own methods are handled by the scoring plan). Returns None if any
+    # source is unavailable, so the caller can assume everything is read.
+    found = set()
+    for klass in model.__mro__:
+        if klass is BaseScoresheet:
+            break
+        for method in methods:
+            func = vars(klass).get(method)
+            if func is None:
+                continue
+            func = getattr(func, '__func__', func)  # Unwrap classmethods.
+            try:
+                tree = ast.parse(textwrap.dedent(inspect.getsource(func)))
+            except (OSError, TypeError, SyntaxError):
+                return None
+            for node in ast.walk(tree):
+                if (isinstance(node, ast.Attribute)
+                        and isinstance(node.value, ast.Name)
+                        and node.value.id == 'self'
+                        and node.attr in names):
+                    found.add(node.attr)
+    return found
+
+
+class Command(BaseCommand):
+    # We can't gettext_lazy here as the help output function needs a string.
+    help = _("Enumerates every combination of mission values for the "
+             "SCORESHEET model, reporting the achievable scores and any "
+             "combination where the validators and check constraints "
+             "disagree.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--bins', type=int, default=20,
+                            help=_("Number of histogram bins to report"))
+        parser.add_argument('--chunk-size', type=int, default=1 << 20,
+                            help=_("Combinations evaluated per NumPy batch"))
+        parser.add_argument('--examples', type=int, default=10,
+                            help=_("Disagreeing combinations to list"))
+        parser.add_argument(
+            '--split-independent', action='store_true',
+            help=_("Convolve fields the validators and scoring logic don't "
+                   "appear to read, rather than enumerating them (heuristic, "
+                   "from their source)"))
+
+    def handle(self, bins, chunk_size, examples, split_independent, *args,
+               **kwargs):
+        fields = list(chain.from_iterable(
+            (m[1]['fields'] for m in Scoresheet.missions)))
+        names = [name for name, config in fields]
+        radix = {
+            name: len(config['choices']) if 'choices' in config else 2
+            for name, config in fields
+        }
+        booleans = {name for name, config in fields
+                    if 'choices' not in config}
+
+        # The per-field choice constraints generated by MetaScoresheet always
+        # hold for enumerated values, so they're not checked. All others are.
+        generated = {"{}_choices".format(name) for name in names}
+        constraints = []
+        for constraint in Scoresheet._meta.constraints:
+            if constraint.name in generated:
+                continue
+            try:
+                constraints.append(q_json(constraint.check))
+            except Unsupported as e:
+                raise CommandError(_(
+                    "Can't evaluate constraint {!r} ({})").format(
+                        constraint.name, e))
+        constrained = set()
+        for check in constraints:
+            constrained |= tree_fields(check) & set(names)
+
+        # By default, every field is enumerated jointly. Optionally, fields
+        # read by custom validation or scoring logic are coupled (enumerated
+        # jointly), and all others are independent: they contribute a fixed
+        # amount to the score whatever else is entered, so the distribution
+        # of their total is calculated by convolution. Which fields are read
+        # is only found by parsing the source for self.<name>, so it misses
+        # fields read through helpers, getattr() or loops.
+        validated = scored = set(names)
+        if split_independent:
+            self.stdout.write(self.style.WARNING(_(
+                "Independent fields are found heuristically (from the "
+                "source of clean(), clean_scores() and calculatescore()), "
+                "so the results may be wrong if these read fields "
+                "indirectly.")))
+            validated = self_attributes(
+                Scoresheet, ['clean', 'clean_scores'], names)
+            scored = self_attributes(Scoresheet, ['calculatescore'], names)
+            if validated is None or scored is None:
+                self.stdout.write(self.style.WARNING(_(
+                    "Couldn't analyse source, enumerating all fields "
+                    "jointly.")))
+                validated = scored = set(names)
+        coupled = [n for n in names if n in constrained | validated | scored]
+        independent = [n for n in names if n not in coupled]
+
+        total = reduce(operator.mul, radix.values(), 1)
+        self.stdout.write(_("{} combinations of {} fields.").format(
+            total, len(names)))
+        self.stdout.write(_("Coupled (enumerated): {}").format(
+            ", ".join(coupled) or "-"))
+        self.stdout.write(_("Independent (convolved): {}").format(
+            ", ".join(independent) or "-"))
+
+        contributions = self.contributions(independent, radix)
+        python_valid = self.python_validity(
+            [n for n in coupled if n in validated], radix, booleans,
+            chunk_size)
+
+        # Enumerate the coupled fields, in chunks of mixed-radix indices.
+        counts = defaultdict(int)  # Coupled score -> valid combinations.
+        disagree = {True: [], False: []}  # Keyed by Python validity.
+        disagree_count = {True: 0, False: 0}
+        size = reduce(operator.mul, (radix[n] for n in coupled), 1)
+        for start in range(0, size, chunk_size):
+            index = np.arange(start, min(start + chunk_size, size),
+                              dtype=np.int64)
+            columns = self.decode(index, coupled, radix, booleans)
+
+            py_ok = python_valid(columns, len(index))
+            db_ok = np.ones(len(index), dtype=np.bool_)
+            for check in constraints:
+                db_ok &= evaluate_condition(check, columns)
+
+            for py in (True, False):
+                rows = np.flatnonzero((py_ok == py) & (db_ok != py))
+                disagree_count[py] += rows.size
+                for row in rows[:max(0, examples - len(disagree[py]))]:
+                    disagree[py].append({n: columns[n][row].item()
+                                         for n in coupled})
+
+            valid = py_ok & db_ok
+            scores = self.coupled_scores(
+                columns, len(index), independent, contributions, booleans)
+            values, value_counts = np.unique(scores[valid],
+                                             return_counts=True)
+            for value, count in zip(values.tolist(), value_counts.tolist()):
+                counts[value] += count
+
+        if not counts:
+            raise CommandError(_("No valid combinations."))
+        low, distribution = self.convolve(counts, contributions)
+        self.report(low, distribution, bins)
+
+        for py, label in ((True, _("accepted by validators but rejected by "
+                                   "check constraints")),
+                          (False, _("rejected by validators but accepted by "
+                                    "check constraints"))):
+            if disagree_count[py]:
+                self.stdout.write(self.style.ERROR(_("{} combinations {}:")
+                                                   .format(disagree_count[py],
+                                                           label)))
+                for example in disagree[py]:
+                    self.stdout.write("  " + ", ".join(
+                        "{}={}".format(*i) for i in example.items()))
+        if any(disagree_count.values()):
+            raise CommandError(_(
+                "Validators and check constraints disagree (independent "
+                "fields are omitted, as they don't affect validity)."))
+        self.stdout.write(self.style.SUCCESS(_(
+            "Validators and check constraints agree.")))
+
+    def decode(self, index, names, radix, booleans):
+        # Mixed-radix decoding of combination indices into value columns.
+        columns = {}
+        for name in reversed(names):
+            index, digit = np.divmod(index, radix[name])
+            columns[name] = digit.astype(
+                np.bool_ if name in booleans else np.int64)
+        return columns
+
+    def contributions(self, names, radix):
+        # Score contributed by each value of each independent field.
+        plan = Scoresheet.scoring_plan
+        weights = dict(chain(plan.multipliers, plan.lookups))
+        functions = dict(plan.functions)
+        result = {}
+        for name in names:
+            values = range(radix[name])
+            if name in functions:
+                points = [functions[name](v) for v in values]
+            elif name in dict(plan.lookups):
+                points = [weights[name][v] for v in values]
+            else:
+                points = [v * weights.get(name, 0) for v in values]
+            result[name] = np.array(points, dtype=np.int64)
+        return result
+
+    def coupled_scores(self, columns, size, independent, contributions,
+                       booleans):
+        # Score of the coupled fields, with independent fields excluded.
+        # Independent fields are scored at their first value and subtracted.
+        columns = dict(columns)
+        for name in independent:
+            columns[name] = np.zeros(
+                size, dtype=np.bool_ if name in booleans else np.int64)
+        baseline = sum(int(contributions[n][0]) for n in independent)
+
+        if Scoresheet.has_vectorised_scoring():
+            return Scoresheet.calculatescores(columns) - baseline
+        names = list(columns)
+        return np.array([
+            Scoresheet(**{n: columns[n][i].item() for n in names}
+                       ).calculatescore()
+            for i in range(size)
+        ], dtype=np.int64) - baseline
+
+    def python_validity(self, names, radix, booleans, chunk_size):
+        # Run the Python validators once per combination of the fields they
+        # read, returning a function mapping columns to a validity array.
+        # If there are more combinations than fit in a chunk (e.g. all fields
+        # are enumerated jointly), they're run on each chunk instead.
+        size = reduce(operator.mul, (radix[n] for n in names), 1)
+        if size > chunk_size:
+            return lambda columns, size: self.validate(columns, names, size)
+        valid = self.validate(
+            self.decode(np.arange(size, dtype=np.int64), names, radix,
+                        booleans), names, size)
+
+        def lookup(columns, size):
+            index = np.zeros(size, dtype=np.int64)
+            for name in names:
+                index = index * radix[name] + columns[name]
+            return valid[index]
+        return lookup
+
+    def validate(self, columns, names, size):
+        # Validity of each row of columns, by the Python validators.
+        valid = np.empty(size, dtype=np.bool_)
+        for i in range(size):
+            sheet = Scoresheet(**{n: columns[n][i].item() for n in names})
+            errs = defaultdict(list)
+            sheet.clean_scores(errs)
+            valid[i] = not errs
+        return valid
+
+    def convolve(self, counts, contributions):
+        # Combine the coupled score counts with each independent field's
+        # contributions. Returns (lowest score, counts from lowest score).
+        low = min(counts)
+        distribution = np.zeros(max(counts) - low + 1, dtype=np.int64)
+        for value, count in counts.items():
+            distribution[value - low] = count
+        for points in contributions.values():
+            field = np.zeros(points.max() - points.min() + 1, dtype=np.int64)
+            np.add.at(field, points - points.min(), 1)
+            distribution = np.convolve(distribution, field)
+            low += int(points.min())
+        return low, distribution
+
+    def report(self, low, distribution, bins):
+        scores = np.flatnonzero(distribution) + low
+        total = int(distribution.sum())
+        values = np.arange(low, low + len(distribution))
+        mean = float((values * distribution).sum()) / total
+        self.stdout.write(_("{} valid combinations, {} distinct scores.")
+                          .format(total, scores.size))
+        self.stdout.write(_("Score range: {} to {} (mean {:.2f}).").format(
+            scores.min(), scores.max(), mean))
+
+        # Integer bin edges, so each bin is an exact (inclusive) score range.
+        edges = np.unique(np.linspace(
+            scores.min(), scores.max() + 1, bins + 1).round().astype(int))
+        hist, edges = np.histogram(values, bins=edges, weights=distribution)
+        width = max(1, int(hist.max()))
+        for count, start, end in zip(hist, edges[:-1], edges[1:]):
+            self.stdout.write("{:>6} - {:<6} {:>16} {}".format(
+                start, end - 1, int(count), "#" * int(40 * count / width)))
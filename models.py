@@ -1,16 +1,22 @@
 from collections import defaultdict, OrderedDict
+from contextlib import contextmanager
 from datetime import datetime, timezone
 from importlib import import_module
 import os.path
+import threading
 
 from django.conf import settings
 from django.db import models
-from django.db.models import Q
+from django.db.models import (
+    Case, OuterRef, Q, Subquery, Value, When)
+from django.db.models.functions import Coalesce
 from django.core.validators import (
     MinValueValidator, MaxValueValidator, RegexValidator)
 from django.core.exceptions import ValidationError, NON_FIELD_ERRORS
 from django.utils.translation import gettext_lazy as _
 
+from .scoresheets._base import Signature  # noqa: F401 (for all seasons)
+
 
 class AttrDict(OrderedDict):
     # Enums for Django. Must be sorted to serialise, hence OrderedDict.
@@ -106,7 +112,56 @@ class Team(models.Model):
         ]
 
 
+class MatchQuerySet(models.QuerySet):
+    # Nesting depth of deferred_state(), per thread.
+    _deferred = threading.local()
+
+    def update_state(self):
+        # Recalculate the denormalised state of these matches (see Match)
+        # from their players and scoresheets. Receivers in signals.py call
+        # this when those change, else run Match.objects.update_state().
+        if getattr(self._deferred, 'depth', 0):
+            return
+        self._update_state()
+
+    @contextmanager
+    def deferred_state(self):
+        # For bulk changes to these matches: update_state() calls (i.e. from
+        # signals.py, once per object) are skipped within the block, and the
+        # state of these matches is recalculated just once on leaving it.
+        self._deferred.depth = getattr(self._deferred, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            self._deferred.depth -= 1
+        self._update_state()
+
+    def update_players(self):
+        # Copy the round and tournament of these matches to their players.
+        match = Match.objects.using(self.db).filter(pk=OuterRef('match'))
+        Player.objects.using(self.db).filter(match__in=self).update(
+            round=Subquery(match.values('round')),
+            tournament=Subquery(match.values('tournament')))
+
+    def _update_state(self):
+        def count(**filters):
+            return Coalesce(Subquery(
+                Player.objects.filter(match=OuterRef('pk'), **filters)
+                .order_by().values('match')
+                .annotate(count=models.Count('pk')).values('count'),
+                output_field=models.PositiveSmallIntegerField()), 0)
+
+        self.update(player_count=count(),
+                    scored_count=count(scoresheet__isnull=False))
+        self.update(played=Case(
+            When(Q(actual__isnull=False) | Q(scored_count__gt=0),
+                 then=Value(True)),
+            default=Value(False), output_field=models.BooleanField()))
+
+
 class Match(models.Model):
+    objects = MatchQuerySet.as_manager()
+
     # Auto PK
     tournament = models.PositiveSmallIntegerField(
         db_index=True, choices=settings.FLLFMS['TOURNAMENTS'],
@@ -128,6 +183,22 @@ class Match(models.Model):
     actual = models.DateTimeField(
         auto_now=False, auto_now_add=False, blank=True, null=True,
         verbose_name=_("actual start time"))
+    # When an unplayed match is now expected to start, given the delays so
+    # far on its field. Maintained by projection.py, after commit.
+    projected = models.DateTimeField(
+        blank=True, null=True, editable=False,
+        verbose_name=_("projected start time"))
+
+    # Denormalised state, for filtering (indexed). Maintained by signals.py,
+    # via MatchQuerySet.update_state(). A match has been played if (and only
+    # if) it has an actual start time, or any scoresheets.
+    played = models.BooleanField(default=False, db_index=True, editable=False,
+                                 verbose_name=_("played"))
+    scored_count = models.PositiveSmallIntegerField(
+        default=0, editable=False, verbose_name=_("scoresheet count"))
+    player_count = models.PositiveSmallIntegerField(
+        default=0, db_index=True, editable=False,
+        verbose_name=_("player count"))
 
     # Matches have teams, so m2m goes on matches (appears on Match admin form).
     # related_query_name == related_name, for both sides of the relationship.
@@ -135,23 +206,26 @@ class Match(models.Model):
                                    related_name="matches",
                                    verbose_name=_("players"))
 
-    def clean(self):
-        errs = defaultdict(list)
-
-        # Friendly error for player_round_tournament_uniq.
-        if self.pk is not None and Player.objects.filter(
-                    team__in=self.teams.exclude(players__surrogate=True),
-                    match__round=self.round, match__tournament=self.tournament,
-                    surrogate=False
-                ).exclude(pk__in=self.players.all()).exists():
-            errs['round'].append(ValidationError(
-                _("Cannot have more than one match per team, per round, per "
-                  "tournament (non-surrogate matches). (It appears you changed"
-                  " the match round, which would violate this constraint.)"),
-                code="team_too_many_matches"))
-
-        if errs:
-            raise ValidationError(errs)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Some values as loaded, so that signals.py can tell what changed
+        # without a query: the old field is reprojected after a move, and
+        # players only follow a change of round or tournament.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded = {name: instance.__dict__.get(name)
+                            for name in ('field', 'round', 'tournament')}
+        return instance
+
+    def moved(self):
+        # Whether the round or tournament changed since loading (if loaded).
+        loaded = getattr(self, '_loaded', {})
+        return any(loaded.get(name) != getattr(self, name)
+                   for name in ('round', 'tournament'))
+
+    def save(self, *args, **kwargs):
+        # The counts may be stale, but are recalculated after saving anyway.
+        self.played = self.actual is not None or self.scored_count > 0
+        super().save(*args, **kwargs)
 
     def __repr__(self, raw=False):
         # The raw argument allows for the class name to be omitted.
@@ -174,6 +248,14 @@ class Match(models.Model):
             # Rounds are still part of that tournament.
             ('tournament', 'number'),
         ]
+        indexes = [
+            # Most recently played first, e.g. when picking a player to score.
+            models.Index(fields=['-actual'], name="match_actual_idx"),
+            # A field's latest starts, and its unplayed matches in order
+            # (see projection.py).
+            models.Index(fields=['field', 'actual', 'schedule'],
+                         name="match_field_actual_idx"),
+        ]
         constraints = [
             models.CheckConstraint(
                 check=Q(tournament__in=[
@@ -211,24 +293,17 @@ class Player(models.Model):
     surrogate = models.BooleanField(default=False,  # Might not be used.
                                     verbose_name=_("is surrogate?"))
 
+    # The match's round and tournament, copied here for the unique index
+    # player_round_tournament_uniq (an index can't follow the relation).
+    # Set by save(), and kept up to date with the match by signals.py.
+    round = models.PositiveSmallIntegerField(
+        editable=False, verbose_name=_("match round"))
+    tournament = models.PositiveSmallIntegerField(
+        editable=False, verbose_name=_("tournament"))
+
     def clean(self):
         errs = defaultdict(list)
 
-        # Friendly error for player_round_tournament_uniq.
-        # Minor race condition if match round/tournament is changed after load.
-        # Apparently this runs even if individual field validation fails.
-        if (getattr(self, 'team', None) is not None
-                and getattr(self, 'match', None) is not None
-                and not self.surrogate
-                and Player.objects.filter(
-                    team=self.team, match__round=self.match.round,
-                    match__tournament=self.match.tournament, surrogate=False
-                    ).exclude(pk=self.pk).exists()):
-            errs[NON_FIELD_ERRORS].append(ValidationError(
-                _("Cannot have more than one match per team, per round, per "
-                  "tournament (non-surrogate matches)."),
-                code="team_too_many_matches"))
-
         # We want to disallow editing the team once set, else scores would move
         # to the new team, so require scoresheet deletion first.
         if (self.pk is not None
@@ -244,6 +319,10 @@ class Player(models.Model):
         if errs:
             raise ValidationError(errs)
 
+    def save(self, *args, **kwargs):
+        self.round, self.tournament = self.match.round, self.match.tournament
+        super().save(*args, **kwargs)
+
     def __repr__(self, raw=False):
         match = getattr(self, 'match', Match())  # Fallback value.
         out = "{}-{}".format(match.__repr__(raw=True),
@@ -265,14 +344,16 @@ class Player(models.Model):
         unique_together = [
             ('match', 'station'),
             ('match', 'team'),
-            # We use an SQL view to enforce the following constraint:
-            # ('match__round', 'match__tournament', 'team', 'surrogate')
-            # It's not possible to follow relations for Django uniqueness.
-            # NOTE: We can't index views and so cannot enforce this on SQLite.
-            # See migrations/setup.sql for player_round_tournament_uniq index.
         ]
 
         constraints = [
+            # One (non-surrogate) match per team, per round, per tournament.
+            # A partial index, so it isn't checked by full_clean(), and
+            # violations are an IntegrityError (see MatchAdmin).
+            models.UniqueConstraint(
+                fields=['team', 'round', 'tournament'],
+                condition=Q(surrogate=False),
+                name="player_round_tournament_uniq"),
             models.CheckConstraint(
                 check=Q(station__in=[
                     i[0] for i in settings.FLLFMS['STATIONS']]),
@@ -0,0 +1,155 @@
+from functools import partial
+from itertools import count
+import logging
+from queue import Queue
+import threading
+from weakref import WeakValueDictionary
+
+from django.db import close_old_connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxBatch:
+    # The pending broadcasts of a transaction, put within one savepoint (or
+    # the transaction itself). Only the updates are kept, each numbered in
+    # the order they were made, so that on commit the transaction's batches
+    # can be replayed together into one set of entries (see flush()).
+    def __init__(self, outbox, alias):
+        self.outbox = outbox
+        self.alias = alias
+        self.updates = []
+        self.sent = False
+
+    def flush(self):
+        # Called by transaction.on_commit, so this runs after the data is
+        # visible to other connections (or immediately, in autocommit mode).
+        # The first batch of a transaction to be flushed sends those of all
+        # its (surviving) savepoints, and the rest then have nothing to do.
+        # Entries are keyed so that repeated updates to the same object/
+        # subscription coalesce into a single send (the last one made wins,
+        # but keeps the position of the first).
+        if self.sent:
+            return
+        batches = {self, *self.outbox._pending(self.alias)}
+        entries = {}
+        for _seq, update in sorted(
+                (u for batch in batches for u in batch.updates),
+                key=lambda u: u[0]):
+            update(entries)
+        for batch in batches:
+            batch.sent = True
+        self.outbox.queue.put(list(entries.values()))
+
+
+class Outbox:
+    # Queues broadcasts (callables which build and send their own messages)
+    # until the surrounding transaction commits, then hands the whole batch to
+    # a background thread, so a slow channel layer never blocks the request.
+    # Each savepoint gets a batch of its own, registered with on_commit inside
+    # it: if the savepoint (or the transaction) rolls back, Django discards
+    # the callback, and the batch along with it, leaving the outer batches as
+    # they were. Released savepoints' batches are merged with the rest.
+    # Use the module-level instance below; each instance has its own worker.
+
+    def __init__(self):
+        self.queue = Queue()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._local = threading.local()
+        self._seq = count()
+
+    def _batches(self):
+        # This thread's batches, by (alias, savepoint id). They are only held
+        # weakly here: the on_commit registration is the one strong
+        # reference, so a batch goes as soon as Django runs or discards it.
+        # A rolled back batch can't be reused, or sent with the transaction.
+        batches = getattr(self._local, 'batches', None)
+        if batches is None:
+            batches = self._local.batches = WeakValueDictionary()
+        return batches
+
+    def _pending(self, alias):
+        return [batch for batch in list(self._batches().values())
+                if batch.alias == alias and not batch.sent]
+
+    def _batch(self, using=None):
+        # Find (or start) the batch for the innermost savepoint, or the
+        # transaction itself if there's none. Returns the batch, and whether
+        # it's new (so needs registering).
+        conn = transaction.get_connection(using)
+        if not conn.in_atomic_block:
+            return OutboxBatch(self, conn.alias), True
+
+        batches = self._batches()
+        # atomic(savepoint=False) blocks can't roll back by themselves, so
+        # they share the batch of the block they are in. Savepoint ids are
+        # unique to the thread, but the transaction's own key (None) isn't.
+        key = conn.alias, next(
+            (sid for sid in reversed(conn.savepoint_ids) if sid), None)
+        batch = batches.get(key)
+        if batch is None or batch.sent:
+            batch = batches[key] = OutboxBatch(self, conn.alias)
+            return batch, True
+        return batch, False
+
+    def _add(self, update, using=None):
+        # Add update(entries) to the current batch, then register it to be
+        # flushed on commit (if new). The order matters: in autocommit mode,
+        # on_commit flushes immediately, so updates must be complete.
+        self._ensure_worker()
+        batch, new = self._batch(using)
+        batch.updates.append((next(self._seq), update))
+        if new:
+            transaction.on_commit(batch.flush, using=using)
+
+    def put(self, key, func, *args, using=None, **kwargs):
+        # Queue func(*args, **kwargs) to be run after commit. Any previously
+        # queued call with the same key (in this transaction) is replaced.
+        def update(entries):
+            entries[key] = partial(func, *args, **kwargs)
+        self._add(update, using=using)
+
+    def collect(self, key, factory, *args, using=None, **kwargs):
+        # Accumulate work (e.g. a set of ids) over a transaction, to process
+        # all at once after commit. The entry under key is created with
+        # factory() if needed, then entry.collect(*args, **kwargs) is called.
+        # The entry itself is called (with no arguments) after commit.
+        def update(entries):
+            if key not in entries:
+                entries[key] = factory()
+            entries[key].collect(*args, **kwargs)
+        self._add(update, using=using)
+
+    def _ensure_worker(self):
+        # Lazily start the worker, so management commands that never
+        # broadcast (migrate, etc.) don't spawn a thread.
+        with self._worker_lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name="fllfms-outbox", daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = self.queue.get()
+            try:
+                for func in batch:
+                    try:
+                        func()
+                    except Exception:
+                        # One failed broadcast mustn't take the rest with it.
+                        logger.exception("Outbox broadcast failed.")
+            finally:
+                # Broadcasts may query the database (e.g. match players), and
+                # this thread is not managed by the request cycle.
+                close_old_connections()
+                self.queue.task_done()
+
+    def join(self):
+        # Block until all flushed batches have been sent (useful in tests).
+        self.queue.join()
+
+
+outbox = Outbox()
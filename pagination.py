@@ -0,0 +1,154 @@
+import json
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.utils import NotRelationField, get_fields_from_path
+from django.contrib.admin.views.main import ALL_VAR, ChangeList
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
+
+# Keyset pagination for admin changelists. Page numbers (?p=) are an OFFSET,
+# so the database walks every row before the page, and each page also needs
+# a COUNT(*) of them all. Instead, the "next page" link carries the ordering
+# values of the page's last row (?after=), and the next page is sought from
+# those, using the ordering's index. Counts stop at COUNT_LIMIT.
+AFTER_VAR = 'after'
+COUNT_LIMIT = 1000
+
+
+def count(queryset, limit=COUNT_LIMIT):
+    # Returns (count, capped), counting no more than limit + 1 rows.
+    num = queryset[:limit + 1].count()
+    return min(num, limit), num > limit
+
+
+def _encode(values):
+    # Datetimes keep their microseconds (unlike DjangoJSONEncoder).
+    return json.dumps(values, separators=(',', ':'), default=(
+        lambda v: v.isoformat() if hasattr(v, 'isoformat') else str(v)))
+
+
+def _decode(data, length):
+    try:
+        values = json.loads(data)
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != length:
+        raise IncorrectLookupParameters("Invalid {} value.".format(AFTER_VAR))
+    return values
+
+
+def after(keys, values, using='default'):
+    # A Q for the rows strictly after values, in the order given by keys, a
+    # list of (field path, descending). NULLs sort as the database does.
+    nulls_largest = connections[using].features.nulls_order_largest
+    query = None
+    for (path, descending), value in reversed(list(zip(keys, values))):
+        nulls_first = nulls_largest == descending
+        if value is None:
+            greater = Q(**{path + '__isnull': False}) if nulls_first else None
+            equal = Q(**{path + '__isnull': True})
+        else:
+            greater = Q(**{path + ('__lt' if descending else '__gt'): value})
+            if not nulls_first:
+                greater |= Q(**{path + '__isnull': True})
+            equal = Q(**{path: value})
+        if query is not None:
+            equal &= query
+            query = equal if greater is None else greater | equal
+        else:
+            query = greater
+    return query if query is not None else Q(pk__in=[])
+
+
+class KeysetChangeList(ChangeList):
+    # Falls back to page numbers if the ordering isn't (only) by fields.
+    keys = None
+    result_count_capped = False
+
+    def __init__(self, request, *args, **kwargs):
+        self.after = request.GET.get(AFTER_VAR)
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        params = super().get_filters_params(params)
+        params.pop(AFTER_VAR, None)
+        return params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Any other change (sorting, filtering) starts from the first page.
+        return super().get_query_string(new_params, [*(remove or ()),
+                                                     AFTER_VAR])
+
+    def get_keys(self):
+        # The ordering as [(field path, descending)], or None if unsupported.
+        keys = []
+        for part in self.queryset.query.order_by:
+            if not isinstance(part, str) or part == '?':
+                return None
+            path = part.lstrip('-')
+            if path == 'pk':
+                path = self.lookup_opts.pk.name
+            try:
+                field = get_fields_from_path(self.model, path)[-1]
+            except (FieldDoesNotExist, NotRelationField):
+                return None
+            if field.is_relation:
+                return None  # Ordered by the related model's ordering.
+            if path not in (key for key, _ in keys):  # Else a no-op.
+                keys.append((path, part.startswith('-')))
+        return keys
+
+    def get_results(self, request):
+        self.keys = self.get_keys()
+        if self.keys is None or (self.show_all and self.after is None):
+            self.keys = None
+            return super().get_results(request)
+
+        queryset = self.queryset
+        if self.after is not None:
+            queryset = queryset.filter(after(
+                self.keys, _decode(self.after, len(self.keys)),
+                queryset.db))
+
+        self.result_count, self.result_count_capped = count(self.queryset)
+        self.show_full_result_count = False
+        self.full_result_count = None
+        self.show_admin_actions = True
+        self.can_show_all = (self.result_count <= self.list_max_show_all
+                             and not self.result_count_capped)
+        self.result_list = queryset[:self.list_per_page]
+        self.more = queryset[self.list_per_page:][:1].exists()
+        self.multi_page = self.more or self.after is not None
+        self.paginator = None
+
+    def get_values(self, obj):
+        values = []
+        for path, _ in self.keys:
+            value = obj
+            for name in path.split('__'):
+                value = getattr(value, name)
+                if value is None:
+                    break
+            values.append(value)
+        return values
+
+    @property
+    def next_url(self):
+        if not self.keys or not self.more:
+            return None
+        last = list(self.result_list)[-1]
+        return self.get_query_string(
+            {AFTER_VAR: _encode(self.get_values(last))})
+
+    @property
+    def first_url(self):
+        if not self.keys or self.after is None:
+            return None
+        return self.get_query_string()
+
+    @property
+    def show_all_url(self):
+        if not self.keys or not self.can_show_all or not self.multi_page:
+            return None
+        return self.get_query_string({ALL_VAR: ''})
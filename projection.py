@@ -0,0 +1,68 @@
+from datetime import timedelta
+
+from django.db.models import Max
+
+from .models import Match, TimerProfile
+
+# Projected start times. Each field runs its matches in schedule order, so a
+# delay on a field carries through to its later matches, less any slack in
+# the schedule between them. The latest match started (by actual time) on a
+# field anchors the projection of its unplayed matches, which then start no
+# sooner than scheduled, and no sooner than a cycle after the one before.
+# A cycle is how long the field has recently taken between matches when
+# running late (the median of the last RECENT such gaps), but never less
+# than the duration of the field's match timer. With neither to go by, the
+# scheduled gap between the matches is kept.
+RECENT = 3
+
+
+def cycle(started, duration):
+    # Given [(schedule, actual)] of recent matches, latest first, and the
+    # timer duration (or None). Returns None if there's nothing to go by.
+    started = started[::-1]
+    gaps = sorted(a2 - a1 for (s1, a1), (s2, a2) in zip(started, started[1:])
+                  if a2 > s2)
+    known = [duration] if duration is not None else []
+    if gaps:
+        known.append(gaps[len(gaps) // 2])
+    return max(known, default=None)
+
+
+def project(field, using='default'):
+    # Updates the projected times of the unplayed matches on field (and
+    # clears those of played matches), with a query each for the recent
+    # starts, timer duration, newly played and unplayed matches, and one
+    # (bulk) update. Returns the matches changed.
+    matches = Match.objects.using(using).filter(field=field)
+    started = list(matches.filter(actual__isnull=False).order_by(
+        '-actual').values_list('schedule', 'actual')[:RECENT + 1])
+    duration = TimerProfile.objects.using(using).filter(
+        timers__match__field=field).aggregate(
+            duration=Max('duration'))['duration']
+    turnover = cycle(started, duration)
+
+    # Played matches are no longer projected (so the displays clear them).
+    changed = list(matches.filter(
+        actual__isnull=False, projected__isnull=False).only(
+            'pk', 'field', 'actual', 'projected'))
+    for match in changed:
+        match.projected = None
+
+    # The (schedule, projected start) of the match before.
+    previous = started[0] if started else None
+    for match in matches.filter(actual__isnull=True).order_by(
+            'schedule', 'tournament', 'number').only(
+                'pk', 'field', 'schedule', 'actual', 'projected'):
+        projected = match.schedule
+        if previous is not None:
+            schedule, start = previous
+            gap = turnover
+            if gap is None:
+                gap = max(match.schedule - schedule, timedelta(0))
+            projected = max(projected, start + gap)
+        previous = match.schedule, projected
+        if match.projected != projected:
+            match.projected = projected
+            changed.append(match)
+    Match.objects.using(using).bulk_update(changed, ['projected'])
+    return changed
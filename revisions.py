@@ -0,0 +1,100 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import threading
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.signals import m2m_changed, post_save
+from django.dispatch import receiver
+import reversion
+
+
+# django-reversion serialises an object (and follows its relations, a query
+# each) every time it's saved within a revision, so an object saved several
+# times in a request is serialised each time, with the data of the moment.
+# Within batched(), saves are only noted, and each object is serialised once,
+# as the block exits, loaded in bulk per model with its follows prefetched.
+# This must still happen within the revision's transaction (not after it, off
+# the request), so that versions always commit with the changes they record.
+
+_local = threading.local()
+
+# The relations each model follows, as registered with register() below
+# (django-reversion keeps its own registrations private).
+_follows = {}
+
+
+def register(model, **options):
+    # As reversion.register(), noting the model's follows for batched().
+    # Models registered otherwise are still batched, just not prefetched.
+    reversion.register(model, **options)
+    _follows[model] = tuple(options.get('follow', ()))
+    return model
+
+
+def follows(model):
+    return _follows.get(model, ())
+
+
+class RevisionBatch:
+    # The pks of registered objects saved in one batched() block, by model
+    # and database.
+    def __init__(self):
+        self.pending = defaultdict(lambda: defaultdict(set))
+
+    def note(self, instance, using):
+        self.pending[instance.__class__][using].add(instance.pk)
+
+    def flush(self):
+        for model, dbs in self.pending.items():
+            follow = [name for name in follows(model)
+                      if _is_relation(model, name)]
+            for db, pks in dbs.items():
+                # Objects deleted since are skipped (as reversion would).
+                for obj in model._base_manager.using(db).filter(
+                        pk__in=pks).prefetch_related(*follow):
+                    reversion.add_to_revision(obj, model_db=db)
+
+
+def _is_relation(model, name):
+    try:
+        return model._meta.get_field(name).is_relation
+    except FieldDoesNotExist:
+        return False
+
+
+@contextmanager
+def batched():
+    # Batch the serialisation of saves within the active revision (if any).
+    # Nested blocks join the outermost batch.
+    if not reversion.is_active():
+        yield
+        return
+    outer = getattr(_local, 'batch', None)
+    # Manually managed, so reversion's own receivers don't serialise saves.
+    # (The revision being joined is already atomic.)
+    with reversion.create_revision(manage_manually=True, atomic=False):
+        if outer is not None:
+            yield
+            return
+        _local.batch = batch = RevisionBatch()
+        try:
+            yield
+            batch.flush()
+        finally:
+            _local.batch = None
+
+
+@receiver(post_save, dispatch_uid="revision_batch_post_save")
+def revision_batch_post_save(sender, instance, using, **kwargs):
+    batch = getattr(_local, 'batch', None)
+    if batch is not None and reversion.is_registered(sender):
+        batch.note(instance, using)
+
+
+@receiver(m2m_changed, dispatch_uid="revision_batch_m2m_changed")
+def revision_batch_m2m_changed(sender, instance, action, reverse, using,
+                               **kwargs):
+    batch = getattr(_local, 'batch', None)
+    if (batch is not None and action.startswith("post_") and not reverse
+            and reversion.is_registered(instance)):
+        batch.note(instance, using)
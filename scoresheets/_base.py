@@ -1,14 +1,22 @@
 from collections import defaultdict
 from contextlib import suppress
 from itertools import chain
+from functools import reduce
+from hashlib import sha256
+from operator import add, attrgetter, mul
 
+import numpy as np
 from django.conf import settings
-from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models import Q
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import (
+    Case, ExpressionWrapper, F, IntegerField, Q, Value, When)
+from django.db.models.functions import Cast
 from django.db.models.base import ModelBase
 from django.utils.translation import gettext_lazy as _
 
+from .. import signatures
+
 
 # For boolean and integer fields, we still declare choices, as the Django admin
 # site will then make it a select/radio field where we can replicate the style
@@ -25,6 +33,103 @@ def choices(*choices, **kwargs):
                                             **kwargs)
 
 
+class ScoringPlan:
+    # A flattened, precompiled form of the mission spec, used for scoring.
+    # Fields are split by weight type once (at class creation), so scoring
+    # doesn't need to inspect every weight on every call. Fields with a zero
+    # (or missing) multiplier can't affect the score, so they're dropped.
+    def __init__(self, missions):
+        multipliers, lookups, functions = [], [], []
+        self.booleans = set()  # Names of boolean (no choices) fields.
+        fields = chain.from_iterable((m[1]['fields'] for m in missions))
+        for name, config in fields:
+            if 'choices' not in config:
+                self.booleans.add(name)
+            weight = config.get('value', 0)
+            if callable(weight):
+                functions.append((name, weight))
+            elif hasattr(weight, '__getitem__'):
+                lookups.append((name, weight))
+            elif weight:
+                multipliers.append((name, weight))
+
+        self.multipliers = tuple(multipliers)
+        self.lookups = tuple(lookups)
+        self.functions = tuple(functions)
+
+        # All field names which contribute to the score, in plan order.
+        self.fields = tuple(f[0] for f in chain(
+            multipliers, lookups, functions))
+
+        # Fetch all values in a single call, in the order of the lists above.
+        # attrgetter() returns a bare value (not a tuple) for a single name.
+        names = self.fields
+        if len(names) > 1:
+            self.values = attrgetter(*names)
+        else:
+            self.values = lambda obj: tuple(getattr(obj, n) for n in names)
+
+        self._weights = tuple(f[1] for f in multipliers)
+        self._tables = tuple(f[1] for f in lookups)
+        self._funcs = tuple(f[1] for f in functions)
+
+    def __call__(self, obj):
+        values = self.values(obj)
+        mult = len(self._weights)
+        look = mult + len(self._tables)
+
+        score = sum(map(mul, values[:mult], self._weights))
+        for value, table in zip(values[mult:look], self._tables):
+            score += table[value]
+        for value, func in zip(values[look:], self._funcs):
+            score += func(value)
+        return score
+
+    def columns(self, columns):
+        # Vectorised form of __call__, for scoring many sheets at once.
+        # columns maps each field name to a NumPy array of values (one per
+        # sheet), and an array of scores is returned in the same order.
+        size = max((len(c) for c in columns.values()), default=0)
+        score = np.zeros(size, dtype=np.int64)
+        for name, weight in self.multipliers:
+            score = score + columns[name] * weight
+        for name, table in self.lookups:
+            if isinstance(table, (list, tuple, range)):
+                score = score + np.asarray(table)[columns[name]]
+            else:
+                # Arbitrary mapping, must be looked up one value at a time.
+                score = score + np.array([table[v] for v in columns[name]])
+        for name, func in self.functions:
+            score = score + np.array([func(v) for v in columns[name]])
+        return score
+
+    def expression(self):
+        # Database form of __call__, as an expression for annotate()/filter().
+        # Callable weights can't be translated to SQL, so None is returned.
+        if self.functions:
+            return None
+
+        def integer(name):
+            # Booleans can't be multiplied on all backends (e.g. PostgreSQL).
+            if name in self.booleans:
+                return Cast(F(name), IntegerField())
+            return F(name)
+
+        terms = [ExpressionWrapper(integer(name) * Value(weight),
+                                   output_field=IntegerField())
+                 for name, weight in self.multipliers]
+        for name, table in self.lookups:
+            if isinstance(table, (list, tuple, range)):
+                table = enumerate(table)
+            else:
+                table = table.items()
+            terms.append(Case(
+                *(When(**{name: key}, then=Value(weight))
+                  for key, weight in table if weight),
+                default=Value(0), output_field=IntegerField()))
+        return reduce(add, terms, Value(0, output_field=IntegerField()))
+
+
 class MetaScoresheet(ModelBase):
     def __new__(mcls, name, bases, attrs, **kwargs):
         # This method transforms the mission specification [tuple] into a set
@@ -107,10 +212,71 @@ class MetaScoresheet(ModelBase):
             newmissions.append((mname, mission))
 
         attrs['missions'] = newmissions
+        # Compile once here, so calculatescore() doesn't walk the spec.
+        attrs['scoring_plan'] = ScoringPlan(newmissions)
         return super().__new__(mcls, name, bases, attrs, **kwargs)
 
 
+class ScoresheetQuerySet(models.QuerySet):
+    def with_calculated_score(self):
+        # Annotates calculated_score, computed from the missions by the DB.
+        if not self.model.has_score_expression():
+            raise ImproperlyConfigured(
+                "{} scores can't be calculated by the database.".format(
+                    self.model.__module__))
+        return self.annotate(calculated_score=self.model.score_expression())
+
+    def stale(self):
+        # Scoresheets where the cached score doesn't match the missions.
+        return self.with_calculated_score().exclude(
+            score=F('calculated_score'))
+
+
+class Signature(models.Model):
+    # Content-addressed store for scoresheet signatures, keyed by SHA-256.
+    # Kept out of the scoresheet table, so only loaded when displayed, and
+    # versions of a scoresheet only store the key. Never modified once saved.
+    digest = models.CharField(primary_key=True, max_length=64, editable=False)
+    # BLOB preferred vs file: https://arxiv.org/ftp/cs/papers/0701/0701168.pdf
+    # Student signature, as strokes (see signatures.py) or a legacy PNG.
+    data = models.BinaryField(verbose_name=_("team initials"))
+    # Cache only, rasterised from data on first view (see png()).
+    image = models.BinaryField(null=True, editable=False)
+
+    @classmethod
+    def fromdata(cls, data):
+        # Unsaved, BaseScoresheet.save() stores it (if not already stored).
+        return cls(digest=sha256(data).hexdigest(), data=data)
+
+    def store(self, using=None):
+        # Identical data has the same key, so never overwrite (or re-read).
+        # If another transaction inserts it first, that's fine too.
+        manager = self.__class__._default_manager.using(using)
+        if not manager.filter(pk=self.pk).exists():
+            with suppress(IntegrityError), transaction.atomic(using=using):
+                self.save(force_insert=True, using=using)
+        self._state.adding = False
+        self._state.db = manager.db
+
+    def png(self):
+        # The signature as a PNG, which is rasterised once then kept.
+        if self.image is not None:
+            return bytes(self.image)
+        if signatures.is_png(self.data):
+            return bytes(self.data)  # Legacy, don't store it twice.
+        self.image = signatures.png(self.data)
+        if not self._state.adding:
+            self.__class__._default_manager.using(self._state.db).filter(
+                pk=self.pk).update(image=self.image)
+        return bytes(self.image)
+
+    def __str__(self):
+        return self.digest
+
+
 class BaseScoresheet(models.Model, metaclass=MetaScoresheet):
+    objects = ScoresheetQuerySet.as_manager()
+
     player = models.OneToOneField(
         'player', related_name="scoresheet", on_delete=models.PROTECT,
         verbose_name=_("player"))
@@ -123,39 +289,81 @@ class BaseScoresheet(models.Model, metaclass=MetaScoresheet):
     referee = models.ForeignKey(
         settings.AUTH_USER_MODEL, on_delete=models.PROTECT,
         verbose_name=_("station referee"))
-    # BLOB preferred vs file: https://arxiv.org/ftp/cs/papers/0701/0701168.pdf
-    # Student signature. (PNG < 50KB)
-    signature = models.BinaryField(editable=True,
-                                   verbose_name=_("team initials"))
+    # Student signature (see Signature). Assign Signature.fromdata(data).
+    signature = models.ForeignKey(
+        Signature, related_name="+", on_delete=models.PROTECT,
+        verbose_name=_("team initials"))
+
+    # Idempotency key from the batch submission API, so that a tablet which
+    # retries a submission (e.g. after losing its connection) can't create
+    # the scoresheet twice. Null for scoresheets entered through the admin.
+    submission = models.UUIDField(
+        blank=True, null=True, unique=True, editable=False,
+        verbose_name=_("submission key"))
 
     def calculatescore(self):
-        score = 0
-
-        # Iterate over each mission to calculate the score.
-        # Subclasses can implement custom logic if missions rely on each other.
-        fields = chain.from_iterable((m[1]['fields'] for m in self.missions))
-        for name, config in fields:
-            # If weight is not declared, a zero multiplier (no score) is used.
-            value = getattr(self, name)  # The value entered on the scoresheet.
-            weight = config.get('value', 0)  # What the mission is worth.
-
-            # Determine type(weight) and use accordingly.
-            if callable(weight):
-                score += weight(value)
-            elif hasattr(weight, '__getitem__'):
-                score += weight[value]
-            else:
-                # Assume multiplier (integer/float).
-                score += value * weight
-
-        return score
+        # Score each mission field from the plan compiled by MetaScoresheet.
+        # If weight is not declared, a zero multiplier (no score) is used.
+        # Weights may be a multiplier (integer/float), a lookup (list/dict,
+        # indexed by the value entered) or a callable (called with the value).
+        # Subclasses can implement custom logic if missions rely on each other
+        # by extending this method (see intoorbit2018 for an example).
+        return self.scoring_plan(self)
+
+    @classmethod
+    def calculatescores(cls, columns):
+        # Vectorised calculatescore(), see ScoringPlan.columns() for details.
+        # Subclasses with custom logic in calculatescore() must also override
+        # this, or bulk rescoring will fall back to calculatescore() per row.
+        return cls.scoring_plan.columns(columns)
+
+    @classmethod
+    def score_expression(cls):
+        # Database expression equivalent to calculatescore(), or None if the
+        # score can't be calculated by the database. Subclasses with custom
+        # logic in calculatescore() must also override this (or return None).
+        return cls.scoring_plan.expression()
+
+    @classmethod
+    def _overridden_with(cls, attr):
+        # True if attr is at least as derived as calculatescore() (i.e. it
+        # was overridden along with any custom scoring logic).
+        def owner(attr):
+            return next(k for k in cls.__mro__ if attr in vars(k))
+        return issubclass(owner(attr), owner('calculatescore'))
+
+    @classmethod
+    def has_vectorised_scoring(cls):
+        return cls._overridden_with('calculatescores')
+
+    @classmethod
+    def has_score_expression(cls):
+        return (cls._overridden_with('score_expression')
+                and cls.score_expression() is not None)
+
+    def _new_signature(self):
+        # The assigned Signature, if it's not stored yet (else None).
+        if self._meta.get_field('signature').is_cached(self):
+            signature = self.signature
+            if signature is not None and signature._state.adding:
+                return signature
+        return None
+
+    def clean_fields(self, exclude=None):
+        # A new signature is only stored by save(), so skip the check that
+        # it exists. (Its data has been validated by the form field anyway.)
+        if self._new_signature() is not None:
+            exclude = [*(exclude or ()), 'signature']
+        super().clean_fields(exclude)
 
     def clean(self):
         errs = defaultdict(list)
 
         if self.pk is not None:
-            old = self.__class__.objects.get(pk=self.pk)
-            if old.signature == self.signature:
+            # Compare digests, rather than fetching the old signature.
+            old = self.__class__.objects.filter(pk=self.pk).values_list(
+                'signature', flat=True).get()
+            if old == self.signature_id:
                 errs['signature'].append(ValidationError(
                     _("A new signature is required when updating scores."),
                     code='signature_must_change'))
@@ -173,6 +381,9 @@ class BaseScoresheet(models.Model, metaclass=MetaScoresheet):
 
     def save(self, *args, **kwargs):
         self.score = self.calculatescore()
+        signature = self._new_signature()
+        if signature is not None:
+            signature.store(using=kwargs.get('using'))
         super().save(*args, **kwargs)
 
     def __repr__(self, raw=False):
@@ -0,0 +1,85 @@
+from django.db.models import (
+    Case, ExpressionWrapper, F, Q, Value, When)
+from django.db.models.expressions import CombinedExpression
+from django.db.models.functions import Cast
+
+
+# The (simple) query expressions and check constraints of scoresheets, as
+# trees of plain data, for evaluating outside the database: in the browser
+# (_rules.py and score_preview.js) and over NumPy columns (scorespace).
+
+# Expressions are nested JSON objects:
+#   {"field": name}, {"value": v}, {"op": "+", "args": [lhs, rhs]},
+#   {"case": [[condition, result], ...], "default": expr}
+# Conditions (Q objects) are:
+#   {"connector": "AND"/"OR", "negated": bool, "children": [...]}
+# where each child is a condition or {"field", "lookup", "value": expr}.
+
+LOOKUPS = {'exact', 'gt', 'gte', 'lt', 'lte', 'in'}
+OPS = {
+    CombinedExpression.ADD, CombinedExpression.SUB,
+    CombinedExpression.MUL, CombinedExpression.DIV,
+}
+
+
+class Unsupported(Exception):
+    # An expression (or lookup) with no tree form, so can't be evaluated
+    # outside the database.
+    pass
+
+
+def expression_json(expression):
+    if isinstance(expression, F):
+        return {'field': expression.name}
+    if isinstance(expression, Value):
+        return {'value': expression.value}
+    if isinstance(expression, (Cast, ExpressionWrapper)):
+        # Only used to coerce types, which the evaluators don't need.
+        return expression_json(expression.get_source_expressions()[0])
+    if isinstance(expression, CombinedExpression):
+        if expression.connector not in OPS:
+            raise Unsupported(expression)
+        return {'op': expression.connector, 'args': [
+            expression_json(expression.lhs),
+            expression_json(expression.rhs)]}
+    if isinstance(expression, Case):
+        return {
+            'case': [[q_json(when.condition), expression_json(when.result)]
+                     for when in expression.cases],
+            'default': expression_json(expression.default),
+        }
+    if isinstance(expression, When) or hasattr(
+            expression, 'resolve_expression'):
+        raise Unsupported(expression)
+    if isinstance(expression, (list, tuple, range)):
+        return {'value': list(expression)}
+    return {'value': expression}
+
+
+def q_json(q):
+    children = []
+    for child in q.children:
+        if isinstance(child, Q):
+            children.append(q_json(child))
+            continue
+        lookup, value = child
+        name, _sep, op = lookup.partition('__')
+        if (op or 'exact') not in LOOKUPS:
+            raise Unsupported(lookup)
+        children.append({'field': name, 'lookup': op or 'exact',
+                         'value': expression_json(value)})
+    return {'connector': q.connector, 'negated': q.negated,
+            'children': children}
+
+
+def tree_fields(tree):
+    # All field names referenced by an expression or condition tree.
+    if isinstance(tree, list):
+        return set().union(*map(tree_fields, tree))
+    if not isinstance(tree, dict):
+        return set()
+    fields = {tree['field']} if 'field' in tree else set()
+    for key, value in tree.items():
+        if key != 'field':
+            fields |= tree_fields(value)
+    return fields
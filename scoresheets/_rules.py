@@ -0,0 +1,48 @@
+from functools import lru_cache
+from hashlib import sha1
+from itertools import chain
+import json
+
+from ._expressions import Unsupported, expression_json, q_json
+
+
+# Exports a scoresheet's scoring rules (fields, choices, score expression and
+# check constraints) as JSON, so the admin can preview scores in the browser.
+# Expressions are exported as trees (see _expressions.py), and evaluated by
+# static/fllfms/score_preview.js; keep them in sync.
+# The server remains authoritative (save() and clean() are unchanged).
+
+
+@lru_cache(maxsize=None)
+def scoring_rules(model):
+    # Returns (json, etag). Rules can't change at runtime, so this is cached
+    # for the life of the process. Labels are not included (they're already
+    # on the form), so the document doesn't depend on the active language.
+    fields = chain.from_iterable((m[1]['fields'] for m in model.missions))
+    generated = set()
+    rules = {'fields': [], 'score': None, 'constraints': []}
+    for name, config in fields:
+        rules['fields'].append({
+            'name': name,
+            'choices': len(config.get('choices', (False, True))),
+            'boolean': 'choices' not in config,
+        })
+        generated.add("{}_choices".format(name))
+
+    # The expression only exists if the database (and so the browser) can
+    # calculate the score. Otherwise, there's no preview.
+    if model.has_score_expression():
+        rules['score'] = expression_json(model.score_expression())
+
+    for constraint in model._meta.constraints:
+        if constraint.name in generated:
+            continue  # Always satisfied by the radio buttons.
+        try:
+            check = q_json(constraint.check)
+        except Unsupported:
+            continue  # Not checked in the browser, but still on save.
+        rules['constraints'].append({'name': constraint.name,
+                                     'check': check})
+
+    data = json.dumps(rules, separators=(',', ':'), sort_keys=True)
+    return data, '"{}"'.format(sha1(data.encode()).hexdigest())
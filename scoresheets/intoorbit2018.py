@@ -1,6 +1,6 @@
 from django.core.exceptions import ValidationError
 from django.db import models
-from django.db.models import F, Q
+from django.db.models import Case, F, IntegerField, Q, Value, When
 from django.utils.translation import gettext_lazy as _
 
 from ._base import BaseScoresheet
@@ -273,6 +273,33 @@ class Scoresheet(BaseScoresheet):
 
         return score
 
+    @classmethod
+    def calculatescores(cls, columns):
+        # Vectorised form of the above (columns are NumPy arrays).
+        score = super().calculatescores(columns)
+
+        score = score + (columns['m04a'] & columns['m04b']) * 20
+
+        m15a, m15b = columns['m15a'], columns['m15b']
+        score = score + (m15b == 1) * 16
+        score = score + ((m15b == 2) & m15a) * 20
+        score = score + ((m15b == 3) & m15a) * 22
+
+        return score
+
+    @classmethod
+    def score_expression(cls):
+        # Database form of calculatescore() (see above for details).
+        return super().score_expression() + Case(
+            When(m04a=True, m04b=True, then=Value(20)),
+            default=Value(0), output_field=IntegerField(),
+        ) + Case(
+            When(m15b=1, then=Value(16)),
+            When(m15a=True, m15b=2, then=Value(20)),
+            When(m15a=True, m15b=3, then=Value(22)),
+            default=Value(0), output_field=IntegerField(),
+        )
+
     def clean_scores(self, errs):
         if self.m03b and not self.m03a:
             e = ValidationError(
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark comparing the original scoring path (walking the mission spec
+on every call) with the compiled ScoringPlan built by MetaScoresheet.
+
+Usage: python scripts/benchmarks/scoring.py [iterations]
+
+Uses the SCORESHEET model from the Django settings. No database is required,
+as scoresheets are only instantiated (never saved).
+"""
+
+from itertools import chain
+import os
+from os.path import abspath, dirname
+import random
+import sys
+import timeit
+
+
+APP_ROOT = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, dirname(APP_ROOT))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                      'fllfms.djangoproject.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from fllfms.models import Scoresheet  # noqa: E402
+from fllfms.scoresheets._base import BaseScoresheet  # noqa: E402
+
+
+def legacy_base_score(self):
+    # BaseScoresheet.calculatescore, as it was before the ScoringPlan.
+    score = 0
+    fields = chain.from_iterable((m[1]['fields'] for m in self.missions))
+    for name, config in fields:
+        value = getattr(self, name)
+        weight = config.get('value', 0)
+        if callable(weight):
+            score += weight(value)
+        elif hasattr(weight, '__getitem__'):
+            score += weight[value]
+        else:
+            score += value * weight
+    return score
+
+
+def random_sheet(rng):
+    sheet = Scoresheet()
+    for name, config in chain.from_iterable(
+            (m[1]['fields'] for m in Scoresheet.missions)):
+        if 'choices' in config:
+            setattr(sheet, name, rng.randrange(len(config['choices'])))
+        else:
+            setattr(sheet, name, rng.random() < 0.5)
+    return sheet
+
+
+def main(iterations=20000):
+    rng = random.Random(2018)
+    sheets = [random_sheet(rng) for _ in range(1000)]
+
+    # Both paths must agree before timing means anything.
+    for sheet in sheets:
+        assert legacy_base_score(sheet) == BaseScoresheet.calculatescore(
+            sheet), sheet
+
+    runs = max(1, iterations // len(sheets))
+    results = {}
+    for label, func in (
+            ("legacy", legacy_base_score),
+            ("compiled", BaseScoresheet.calculatescore)):
+        timer = timeit.Timer(lambda: [func(s) for s in sheets])
+        best = min(timer.repeat(repeat=5, number=runs))
+        results[label] = best / (runs * len(sheets)) * 1e6
+        print("{:>10}: {:8.3f} us/sheet".format(label, results[label]))
+
+    print("{:>10}: {:8.2f}x".format(
+        "speedup", results['legacy'] / results['compiled']))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:2]))
@@ -0,0 +1,128 @@
+"""
+Benchmark of concurrent SQLite reads and writes, with SQLite's defaults (a
+rollback journal) and with the FMS's connection profile (fllfms/sqlite.py).
+
+Usage: python scripts/benchmarks/sqlite.py [seconds] [readers] [writers]
+
+Readers repeatedly list the schedule (as displays and admin pages do), and
+writers repeatedly start a match (as timers do), each on its own connection,
+against a scratch database file.
+"""
+
+from datetime import datetime, timedelta
+import os
+from os.path import abspath, dirname, join
+import sqlite3
+import sys
+from tempfile import TemporaryDirectory
+import threading
+import time
+
+
+APP_ROOT = dirname(dirname(dirname(abspath(__file__))))
+sys.path.insert(0, dirname(APP_ROOT))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                      'fllfms.djangoproject.settings')
+
+import django  # noqa: E402
+django.setup()
+
+from fllfms.sqlite import configure, pragmas  # noqa: E402
+
+MATCHES = 500
+
+
+def connect(path, profile):
+    # As Django connects (autocommit, and a 5 second default timeout).
+    conn = sqlite3.connect(path, timeout=5, isolation_level=None,
+                           check_same_thread=False)
+    if profile:
+        configure(conn.cursor())
+    return conn
+
+
+def setup(path, profile):
+    conn = connect(path, profile)
+    conn.execute("CREATE TABLE match (id INTEGER PRIMARY KEY, number INTEGER,"
+                 " schedule TEXT, actual TEXT, played BOOLEAN)")
+    conn.execute("CREATE INDEX match_schedule ON match (schedule)")
+    start = datetime(2019, 2, 21, 9)
+    conn.executemany(
+        "INSERT INTO match (number, schedule, played) VALUES (?, ?, 0)",
+        [(i, (start + timedelta(minutes=5 * i)).isoformat())
+         for i in range(1, MATCHES + 1)])
+    conn.close()
+
+
+def run(path, profile, seconds, readers, writers):
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    lock = threading.Lock()
+    stop = time.monotonic() + seconds
+
+    def count(key):
+        with lock:
+            counts[key] += 1
+
+    def read():
+        conn = connect(path, profile)
+        while time.monotonic() < stop:
+            try:
+                conn.execute("SELECT * FROM match WHERE played = 0 "
+                             "ORDER BY schedule LIMIT 100").fetchall()
+                count('reads')
+            except sqlite3.OperationalError:
+                count('errors')
+        conn.close()
+
+    def write(offset):
+        conn = connect(path, profile)
+        i = offset
+        while time.monotonic() < stop:
+            i = i % MATCHES + 1
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.execute("UPDATE match SET actual = ? WHERE id = ?",
+                             (datetime.now().isoformat(), i))
+                conn.execute("UPDATE match SET played = actual IS NOT NULL "
+                             "WHERE id = ?", (i,))
+                conn.execute("COMMIT")
+                count('writes')
+            except sqlite3.OperationalError:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                count('errors')
+        conn.close()
+
+    threads = ([threading.Thread(target=read) for _ in range(readers)]
+               + [threading.Thread(target=write, args=(i * 97,))
+                  for i in range(writers)])
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counts
+
+
+def main(seconds=5, readers=8, writers=2):
+    print("{} readers and {} writers, {} seconds each.".format(
+        readers, writers, seconds))
+    print("FMS pragmas: {}".format(", ".join(
+        "{}={}".format(*p) for p in pragmas().items())))
+    results = {}
+    with TemporaryDirectory() as tmp:
+        for label, profile in (("default", False), ("fms", True)):
+            path = join(tmp, label + ".sqlite3")
+            setup(path, profile)
+            counts = run(path, profile, seconds, readers, writers)
+            results[label] = counts
+            print("{:>10}: {:9.1f} reads/s {:8.1f} writes/s {:6} errors"
+                  .format(label, counts['reads'] / seconds,
+                          counts['writes'] / seconds, counts['errors']))
+
+    for key in ('reads', 'writes'):
+        print("{:>10}: {:8.2f}x".format(key, results['fms'][key]
+                                        / max(1, results['default'][key])))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
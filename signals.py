@@ -1,10 +1,97 @@
 from contextlib import suppress
 
+from django.db import transaction
+from django.db.models import Q
 from django.db.models.signals import pre_save, post_save, post_delete
 from django.dispatch import receiver
 
-from .consumers import TimerConsumer
-from .models import Timer, TimerProfile, Match
+from .consumers import ScheduleConsumer, TimerConsumer
+from .models import (Timer, TimerProfile, Match, Player, Scoresheet, Team,
+                     TIMERSTATES)
+from .outbox import outbox
+from .projection import project
+
+
+# All broadcasts go through the outbox, so they are only sent once the saving
+# transaction commits, and never block the saving thread. Outbox keys are
+# (subscription, timer pk), so many saves in one transaction coalesce into a
+# single message per timer and subscription.
+
+
+class MatchPayloadRefresh:
+    # A timer's match payload depends on the timer (which match), the match,
+    # and the match's players and their teams. Rather than looking up timers
+    # on every save, we collect what changed over the transaction, and resolve
+    # the affected timers with one query after commit, sending each just once.
+    KEY = "match_payload"
+
+    def __init__(self):
+        self.timers = set()
+        self.matches = set()
+        self.teams = set()
+
+    def collect(self, timers=(), matches=(), teams=()):
+        self.timers.update(timers)
+        self.matches.update(matches)
+        self.teams.update(teams)
+
+    def __call__(self):
+        query = Q()
+        if self.timers:
+            query |= Q(pk__in=self.timers)
+        if self.matches:
+            query |= Q(match__in=self.matches)
+        if self.teams:
+            query |= Q(match__players__team__in=self.teams)
+        if not query:
+            return
+
+        for timer in Timer.objects.filter(query).select_related(
+                'match').distinct():
+            TimerConsumer.send_match(timer)
+
+    @classmethod
+    def queue(cls, using=None, **kwargs):
+        outbox.collect(cls.KEY, cls, using=using, **kwargs)
+
+
+class ScheduleProjection:
+    # Projected times depend on all the matches on a field (see projection.py)
+    # so the fields changed are collected over the transaction, then each is
+    # reprojected once after commit, off the request, in its own transaction.
+    # The times that changed are then pushed to the schedule displays.
+    KEY = "schedule_projection"
+
+    def __init__(self, using=None):
+        self.using = using or 'default'
+        self.fields = set()
+
+    def collect(self, fields=()):
+        self.fields.update(fields)
+
+    def __call__(self):
+        changed = []
+        for field in sorted(self.fields):
+            with transaction.atomic(using=self.using):
+                changed += project(field, using=self.using)
+        if changed:
+            ScheduleConsumer.send_projected(changed)
+
+    @classmethod
+    def queue(cls, using=None, **kwargs):
+        outbox.collect((cls.KEY, using), lambda: cls(using), using=using,
+                       **kwargs)
+
+    @classmethod
+    def queue_matches(cls, matches, using=None):
+        # The fields of these matches, and those they were loaded with.
+        fields = set()
+        for match in matches:
+            fields.add(match.field)
+            loaded = getattr(match, '_loaded', {}).get('field')
+            if loaded is not None:
+                fields.add(loaded)
+        cls.queue(fields=fields, using=using)
 
 
 class TimerSignalCache:
@@ -61,17 +148,30 @@ class TimerSignalCache:
 
         if any(changed(i) for i in ['starttime', 'state']):
             # starttime also affects state/elapsed, must also be checked.
-            TimerConsumer.send_state(instance)
+            outbox.put(("state", instance.pk), TimerConsumer.send_state,
+                       instance, using=using)
+
+        if (changed('state') and new['state'] == TIMERSTATES.START
+                and new['match_id'] is not None):
+            # The match starts with its timer (if not already started), and
+            # the delay carries through to the rest of its field.
+            matches = Match.objects.using(using).filter(pk=new['match_id'])
+            if matches.filter(actual__isnull=True).update(
+                    actual=new['starttime']):
+                matches.update_state()
+                ScheduleProjection.queue(fields=matches.values_list(
+                    'field', flat=True), using=using)
 
         if changed('profile'):
             # sendable should be declared to just be timer's profile, not all
             # timers using this profile (the profile itself was not changed).
             sendable = TimerConsumer.group_sendable(
                 TimerConsumer.getgroup(instance.pk, "profile"))
-            TimerConsumer.send_profile(instance.profile, sendable=sendable)
+            outbox.put(("profile", instance.pk), TimerConsumer.send_profile,
+                       instance.profile, sendable=sendable, using=using)
 
         if changed('match'):
-            TimerConsumer.send_match(instance)
+            MatchPayloadRefresh.queue(timers=[instance.pk], using=using)
 
 
 _timer_signal_cache = TimerSignalCache()
@@ -82,17 +182,107 @@ _timer_signal_cache = TimerSignalCache()
 def profile_post_save(sender, instance, created, raw, using, update_fields,
                       **kwargs):
     if not created:
-        TimerConsumer.send_profile(instance)
+        # Keyed on the profile, not a timer, as it goes to all its timers.
+        outbox.put(("profile", "all", instance.pk), TimerConsumer.send_profile,
+                   instance, using=using)
 
 
 @receiver(post_save, sender=Match, dispatch_uid="match_post_save")
 def match_post_save(sender, instance, created, raw, using, update_fields,
                     **kwargs):
+    if not created or raw:
+        # The saved counts may have been stale (or reverted), so recalculate.
+        Match.objects.using(using).filter(pk=instance.pk).update_state()
+    if (raw or not created) and instance.moved():
+        # Players keep a copy, for player_round_tournament_uniq. (Raw saves,
+        # e.g. reverts and fixtures, may come before or after the players'.)
+        instance.players.using(using).update(
+            round=instance.round, tournament=instance.tournament)
     if not created:
-        # We don't want to send an event if there's no timer.
-        # If no timer, no event will be sent due to Timer.DoesNotExist.
-        with suppress(Timer.DoesNotExist):
-            TimerConsumer.send_match(instance.timer)
+        # We don't want to send an event if there's no timer, but that's only
+        # resolved after commit (a new match can't have a timer yet).
+        MatchPayloadRefresh.queue(matches=[instance.pk], using=using)
+    ScheduleProjection.queue_matches([instance], using=using)
+
+
+@receiver(post_delete, sender=Match, dispatch_uid="match_post_delete")
+def match_post_delete(sender, instance, using, **kwargs):
+    ScheduleProjection.queue(fields=[instance.field], using=using)
+
+
+@receiver(post_save, sender=Team, dispatch_uid="team_post_save")
+def team_post_save(sender, instance, created, raw, using, update_fields,
+                   **kwargs):
+    # Team name, number and dq are all part of the match payload.
+    if not created and not raw:
+        MatchPayloadRefresh.queue(teams=[instance.pk], using=using)
+
+
+@receiver(pre_save, sender=Player, dispatch_uid="player_pre_save")
+def player_pre_save(sender, instance, raw, using, update_fields, **kwargs):
+    # If the player is moved to another match, the old one must be refreshed
+    # (and its state updated, after saving).
+    instance._old_matches = []
+    if instance.pk is not None:
+        instance._old_matches = list(Player.objects.using(using).filter(
+            pk=instance.pk).exclude(match=instance.match_id).values_list(
+                'match', flat=True))
+        if not raw:
+            MatchPayloadRefresh.queue(matches=instance._old_matches,
+                                      using=using)
+
+
+@receiver(post_save, sender=Player, dispatch_uid="player_post_save")
+def player_post_save(sender, instance, created, raw, using, update_fields,
+                     **kwargs):
+    # Only new (or moved) players change the matches' counts.
+    old = getattr(instance, '_old_matches', [])
+    if created or old:
+        Match.objects.using(using).filter(
+            pk__in=[instance.match_id, *old]).update_state()
+    if raw:
+        # Raw saves (reverts, fixtures) skip Player.save(), so the copy of the
+        # match's round and tournament may be stale. (If the match isn't
+        # there yet, its own save brings the copy up to date.)
+        Match.objects.using(using).filter(
+            pk=instance.match_id).update_players()
+    else:
+        MatchPayloadRefresh.queue(matches=[instance.match_id], using=using)
+
+
+@receiver(post_delete, sender=Player, dispatch_uid="player_post_delete")
+def player_post_delete(sender, instance, using, **kwargs):
+    Match.objects.using(using).filter(pk=instance.match_id).update_state()
+    MatchPayloadRefresh.queue(matches=[instance.match_id], using=using)
+
+
+@receiver(pre_save, sender=Scoresheet, dispatch_uid="scoresheet_pre_save")
+def scoresheet_pre_save(sender, instance, raw, using, update_fields,
+                        **kwargs):
+    # If the scoresheet is moved to another player, that player's match
+    # has one less scoresheet.
+    instance._old_matches = []
+    if instance.pk is not None:
+        instance._old_matches = list(Player.objects.using(using).filter(
+            scoresheet__pk=instance.pk).exclude(
+                pk=instance.player_id).values_list('match', flat=True))
+
+
+@receiver(post_save, sender=Scoresheet, dispatch_uid="scoresheet_post_save")
+def scoresheet_post_save(sender, instance, created, raw, using, update_fields,
+                         **kwargs):
+    # Only new (or moved) scoresheets change the matches' scoresheet counts.
+    old = getattr(instance, '_old_matches', [])
+    if created or old:
+        Match.objects.using(using).filter(
+            Q(players__pk=instance.player_id) | Q(pk__in=old)).update_state()
+
+
+@receiver(post_delete, sender=Scoresheet,
+          dispatch_uid="scoresheet_post_delete")
+def scoresheet_post_delete(sender, instance, using, **kwargs):
+    Match.objects.using(using).filter(
+        players__pk=instance.player_id).update_state()
 
 
 # We need to close sockets where the timer has been deleted. Note that it's not
@@ -100,6 +290,10 @@ def match_post_save(sender, instance, created, raw, using, update_fields,
 # match deletes (sets timer.match = None, triggering timer_post_save).
 @receiver(post_delete, sender=Timer, dispatch_uid="timer_post_delete")
 def timer_post_delete(sender, instance, using, **kwargs):
+    # Messages queued for the timer earlier in the transaction are still sent
+    # first, which is harmless as the sockets are closed straight afterwards.
     for sub in TimerConsumer.valid_subscriptions:
-        TimerConsumer.terminate_group(TimerConsumer.group_sendable(
-            TimerConsumer.getgroup(instance.pk, sub)))
+        outbox.put(("close", instance.pk, sub), TimerConsumer.terminate_group,
+                   TimerConsumer.group_sendable(
+                       TimerConsumer.getgroup(instance.pk, sub)),
+                   using=using)
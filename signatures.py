@@ -0,0 +1,172 @@
+import struct
+import zlib
+
+import numpy as np
+
+# Compact signature format, as captured by signature_widget.js (keep in sync).
+# Points are quantised to a grid (GRID_WIDTH wide, the height keeping the
+# pad's aspect ratio) and each is stored as a delta from the previous point.
+# All integers are varints (LEB128), deltas are zigzag encoded. Layout:
+#   version, width, height, stroke count,
+#   then per stroke: point count, then (dx, dy) per point.
+# The first point of each stroke is relative to the last of the previous
+# stroke, or (0, 0). Most deltas fit in a byte, so ~2 bytes per point.
+# Signatures captured before this format are PNGs, which are left as is.
+VERSION = 1
+GRID_WIDTH = 500
+MAX_GRID = 1000  # In either dimension.
+MAX_POINTS = 20000
+MAX_BYTES = 50 * 1024  # Also the limit for (legacy) PNGs.
+
+PNG_MAGIC = b'\x89PNG\r\n\x1a\n'
+PEN_COLOUR = (0, 0, 255)  # Matches penColor in signature_widget.js.
+PEN_RADIUS = 1.5  # In grid units.
+
+
+def _varints(data):
+    # Generator over the unsigned varints in data.
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        shift += 7
+        if not byte & 0x80:
+            yield value
+            value = shift = 0
+        elif shift > 28:
+            raise ValueError("Varint too long.")
+    if shift:
+        raise ValueError("Truncated varint.")
+
+
+def _unzigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def _zigzag(n):
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def _varint(n):
+    out = bytearray()
+    while n > 0x7f:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+    return out
+
+
+def is_png(data):
+    return bytes(data[:len(PNG_MAGIC)]) == PNG_MAGIC
+
+
+def encode(width, height, strokes):
+    # The inverse of decode(), strokes being sequences of (x, y) points.
+    out = bytearray()
+    for n in (VERSION, width, height, len(strokes)):
+        out += _varint(n)
+    last = (0, 0)
+    for stroke in strokes:
+        out += _varint(len(stroke))
+        for point in stroke:
+            out += _varint(_zigzag(point[0] - last[0]))
+            out += _varint(_zigzag(point[1] - last[1]))
+            last = point
+    return bytes(out)
+
+
+def decode(data):
+    # Returns (width, height, strokes), each stroke an (n, 2) array of (x, y).
+    # Raises ValueError if the data is malformed or out of bounds.
+    if len(data) > MAX_BYTES:
+        raise ValueError("Signature too large.")
+    values = _varints(bytes(data))
+    try:
+        version, width, height, count = [next(values) for _ in range(4)]
+        if version != VERSION:
+            raise ValueError("Unknown signature version.")
+        if not (0 < width <= MAX_GRID and 0 < height <= MAX_GRID):
+            raise ValueError("Invalid signature size.")
+        if count == 0:
+            raise ValueError("Empty signature.")
+
+        strokes, total = [], 0
+        for _ in range(count):
+            n = next(values)
+            total += n
+            if n == 0 or total > MAX_POINTS:
+                raise ValueError("Invalid point count.")
+            strokes.append([next(values) for _ in range(2 * n)])
+    except StopIteration:
+        raise ValueError("Truncated signature.")
+    if next(values, None) is not None:
+        raise ValueError("Trailing data in signature.")
+
+    # Undo the delta encoding across all strokes at once.
+    lengths = [len(s) // 2 for s in strokes]
+    deltas = np.fromiter((_unzigzag(v) for s in strokes for v in s),
+                         dtype=np.int64, count=2 * total).reshape(-1, 2)
+    points = np.cumsum(deltas, axis=0)
+    if (points < 0).any() or (points >= (width, height)).any():
+        raise ValueError("Signature point out of bounds.")
+    return width, height, np.split(points, np.cumsum(lengths)[:-1])
+
+
+def check(data):
+    # Raises ValueError unless data is a valid signature (or legacy PNG).
+    if is_png(data):
+        if len(data) > MAX_BYTES:
+            raise ValueError("Signature too large.")
+    else:
+        decode(data)
+
+
+def rasterise(data):
+    # Draws the strokes into a (height, width) boolean bitmap.
+    width, height, strokes = decode(data)
+    samples = []
+    for points in strokes:
+        # Sample each segment at (at least) every half unit of its length.
+        segments = np.diff(points, axis=0)
+        steps = np.maximum(2 * np.abs(segments).max(axis=1, initial=0), 1)
+        index = np.repeat(np.arange(len(segments)), steps)
+        offset = np.arange(len(index)) - np.repeat(np.cumsum(steps) - steps,
+                                                   steps)
+        fraction = (offset / np.repeat(steps, steps))[:, None]
+        samples.append(points[index] + segments[index] * fraction)
+        samples.append(points[-1:])
+    samples = np.rint(np.concatenate(samples)).astype(np.int64)
+
+    # Stamp a round pen at every sample.
+    bitmap = np.zeros((height, width), dtype=bool)
+    reach = int(PEN_RADIUS)
+    for dy in range(-reach, reach + 1):
+        for dx in range(-reach, reach + 1):
+            if dx * dx + dy * dy > PEN_RADIUS * PEN_RADIUS:
+                continue
+            x, y = samples[:, 0] + dx, samples[:, 1] + dy
+            inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            bitmap[y[inside], x[inside]] = True
+    return bitmap
+
+
+def png(data):
+    # A PNG of the signature: 1 bit per pixel, pen on a transparent background.
+    if is_png(data):
+        return bytes(data)
+    bitmap = rasterise(data)
+    height, width = bitmap.shape
+    rows = np.packbits(bitmap, axis=1)
+    raw = np.hstack([np.zeros((height, 1), dtype=np.uint8), rows]).tobytes()
+
+    def chunk(kind, body):
+        return (struct.pack('>I', len(body)) + kind + body +
+                struct.pack('>I', zlib.crc32(kind + body)))
+
+    return b''.join((
+        PNG_MAGIC,
+        chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 1, 3, 0, 0, 0)),
+        chunk(b'PLTE', bytes((255, 255, 255, *PEN_COLOUR))),
+        chunk(b'tRNS', b'\x00'),  # Background is transparent.
+        chunk(b'IDAT', zlib.compress(raw, 9)),
+        chunk(b'IEND', b''),
+    ))
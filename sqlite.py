@@ -0,0 +1,111 @@
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+logger = logging.getLogger(__name__)
+
+
+# SQLite's default rollback journal locks the whole database for each write,
+# so readers (timer consumers, admin users, public pages) wait on writers and
+# the reverse. In WAL mode, readers and a writer work concurrently, and with
+# synchronous=NORMAL, commits no longer wait for the disk (a power cut could
+# only lose the last commits, never corrupt the database). Override these in
+# settings.FLLFMS['SQLITE_PRAGMAS'] (e.g. None to leave one at the default).
+PRAGMAS = {
+    'journal_mode': "WAL",
+    'synchronous': "NORMAL",
+    'mmap_size': 256 * 1024 * 1024,  # Bytes.
+    'cache_size': -64 * 1024,  # Negative is KiB, per connection.
+    'busy_timeout': 5000,  # Milliseconds to wait on a lock, not fail.
+}
+
+
+def pragmas():
+    return {name: value for name, value in dict(
+        PRAGMAS, **settings.FLLFMS.get('SQLITE_PRAGMAS', {})).items()
+        if value is not None}
+
+
+def configure(cursor, persistent=True):
+    # Apply the pragmas with this (DB-API) cursor. journal_mode persists in
+    # the database file, but the rest are per connection.
+    for name, value in pragmas().items():
+        if name != 'journal_mode' or persistent:
+            cursor.execute("PRAGMA {} = {}".format(name, value))
+
+
+# Rows ANALYZE samples from each index, keeping it quick on a large database
+# (the statistics only need to be roughly right).
+ANALYSIS_LIMIT = 1000
+
+
+def maintain(cursor):
+    # Refresh the query planner's statistics (sqlite_stat1) with a bounded
+    # ANALYZE, then checkpoint the WAL (folding the log back into the
+    # database, so it doesn't grow, and reads don't slow). PASSIVE
+    # checkpoints never wait on readers or writers; the WAL is also
+    # checkpointed on commits anyway, but only ever fully once no reader is
+    # active. (PRAGMA optimize would do nothing here: it only analyzes what
+    # the connection's own queries have used, and this one has run none.)
+    cursor.execute("PRAGMA analysis_limit = {}".format(ANALYSIS_LIMIT))
+    cursor.execute("ANALYZE")
+    cursor.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+
+class Maintenance:
+    # Runs maintain() every interval, from a daemon thread, on each SQLite
+    # database. Use the module-level instance below. Started with the first
+    # connection.
+    def __init__(self, interval):
+        self.interval = interval
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="fllfms-sqlite", daemon=True)
+                self._thread.start()
+
+    def run_once(self):
+        for alias in connections:
+            connection = connections[alias]
+            if (connection.vendor != 'sqlite'
+                    or connection.is_in_memory_db()):
+                continue
+            try:
+                with connection.cursor() as cursor:
+                    maintain(cursor)
+            except Exception:
+                logger.exception("SQLite maintenance failed (%s).", alias)
+            finally:
+                # This thread isn't managed by the request cycle.
+                connection.close()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.run_once()
+
+
+maintenance = Maintenance(
+    settings.FLLFMS.get('SQLITE_MAINTENANCE_INTERVAL', 5 * 60))
+
+
+@receiver(connection_created, dispatch_uid="sqlite_connection_created")
+def sqlite_connection_created(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    # WAL doesn't apply to in-memory databases (e.g. tests).
+    persistent = not connection.is_in_memory_db()
+    with connection.cursor() as cursor:
+        configure(cursor, persistent)
+    if persistent and maintenance.interval:
+        maintenance.start()
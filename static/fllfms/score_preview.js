@@ -0,0 +1,134 @@
+// Live score preview for the scoresheet admin form.
+// Evaluates the rules exported by scoresheets/_rules.py (keep in sync).
+// The server remains authoritative: scores are recalculated on save.
+function scorepreview() {
+
+    var output = document.querySelector("output.score-preview");
+    if (!output) {
+        return;
+    }
+    var form = output.closest("form");
+    var errors = document.createElement("ul");
+    errors.className = "errorlist score-preview-errors";
+    output.parentNode.appendChild(errors);
+
+    var evaluate = function(expr, values) {
+        if ("field" in expr) {
+            return values[expr.field];
+        }
+        if ("value" in expr) {
+            return expr.value;
+        }
+        if ("op" in expr) {
+            var lhs = evaluate(expr.args[0], values);
+            var rhs = evaluate(expr.args[1], values);
+            switch (expr.op) {
+                case "+": return lhs + rhs;
+                case "-": return lhs - rhs;
+                case "*": return lhs * rhs;
+                case "/": return Math.trunc(lhs / rhs);
+            }
+            throw new Error("Unknown operator " + expr.op);
+        }
+        if ("case" in expr) {
+            for (let [condition, result] of expr.case) {
+                if (check(condition, values)) {
+                    return evaluate(result, values);
+                }
+            }
+            return evaluate(expr.default, values);
+        }
+        throw new Error("Unknown expression");
+    };
+
+    var lookups = {
+        exact: (a, b) => a == b,
+        gt: (a, b) => a > b,
+        gte: (a, b) => a >= b,
+        lt: (a, b) => a < b,
+        lte: (a, b) => a <= b,
+        "in": (a, b) => b.includes(a),
+    };
+
+    var check = function(q, values) {
+        var and = q.connector == "AND";
+        var result = and;
+        for (let child of q.children) {
+            var ok = ("connector" in child) ? check(child, values) :
+                lookups[child.lookup](values[child.field],
+                                      evaluate(child.value, values));
+            result = and ? (result && ok) : (result || ok);
+        }
+        return q.negated ? !result : result;
+    };
+
+    var fieldsof = function(q, found) {
+        // Every field referenced by a condition (to highlight errors).
+        for (let child of q.children) {
+            if ("connector" in child) {
+                fieldsof(child, found);
+            } else {
+                found.add(child.field);
+            }
+        }
+        return found;
+    };
+
+    var update = function(rules) {
+        // Booleans are submitted as "True"/"False", choices as integers.
+        // Use numbers throughout, as the database does.
+        var values = {};
+        var missing = false;
+        for (let field of rules.fields) {
+            var input = form.querySelector(
+                "input[name='" + field.name + "']:checked");
+            if (!input) {
+                missing = true;
+                continue;
+            }
+            values[field.name] = field.boolean ?
+                Number(input.value == "True") : Number(input.value);
+        }
+
+        for (let row of form.querySelectorAll(".score-preview-invalid")) {
+            row.classList.remove("score-preview-invalid");
+        }
+        errors.innerHTML = "";
+        var valid = true;
+        if (!missing) {
+            for (let constraint of rules.constraints) {
+                if (check(constraint.check, values)) {
+                    continue;
+                }
+                valid = false;
+                var names = Array.from(fieldsof(constraint.check, new Set()));
+                for (let name of names) {
+                    var row = form.querySelector(".field-" + name);
+                    if (row) {
+                        row.classList.add("score-preview-invalid");
+                    }
+                }
+                var item = document.createElement("li");
+                item.textContent = constraint.name + " (" +
+                    names.join(", ") + ")";
+                errors.appendChild(item);
+            }
+        }
+
+        if (missing || !valid || rules.score === null) {
+            output.textContent = "-";
+        } else {
+            output.textContent = evaluate(rules.score, values);
+        }
+    };
+
+    fetch(output.dataset.rules, {credentials: "same-origin"})
+        .then(response => response.json())
+        .then(function(rules) {
+            form.addEventListener("change", () => update(rules));
+            update(rules);
+        });
+
+}
+
+window.addEventListener("load", scorepreview);
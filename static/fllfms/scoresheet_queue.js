@@ -0,0 +1,137 @@
+// Offline queue for the scoresheet add form (for referee tablets).
+// While offline (or the server was last unreachable), submitting the form
+// stores the scoresheet in localStorage instead. Queued scoresheets are sent
+// in one batch to ScoresheetAdmin's submit_view once the connection returns,
+// the page is next loaded, or on a retry (backing off) after a failed send.
+// Each has a random key, so a batch can be retried without duplicates.
+function scoresheetqueue() {
+
+    var STORAGE_KEY = "fllfms.scoresheetqueue";
+    var RETRY_MIN = 5 * 1000;  // Milliseconds, doubling to RETRY_MAX.
+    var RETRY_MAX = 5 * 60 * 1000;
+    var output = document.querySelector("output.score-preview");
+    if (!output || !output.dataset.submit) {
+        return;
+    }
+    var form = output.closest("form");
+    var adding = !!form.querySelector("input[name='_save']") &&
+        /\/add\/$/.test(window.location.pathname);
+
+    var status = document.createElement("div");
+    status.className = "scoresheet-queue-status";
+    form.parentNode.insertBefore(status, form);
+
+    var load = function() {
+        try {
+            return JSON.parse(localStorage.getItem(STORAGE_KEY)) || [];
+        } catch (e) {
+            return [];
+        }
+    };
+    var store = function(queue) {
+        localStorage.setItem(STORAGE_KEY, JSON.stringify(queue));
+        var failed = queue.filter(item => item.errors).length;
+        status.textContent = queue.length ?
+            queue.length + " scoresheet(s) waiting to be sent" +
+            (failed ? " (" + failed + " rejected, please re-enter)" : "") :
+            "";
+    };
+
+    var uuid4 = function() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        var bytes = crypto.getRandomValues(new Uint8Array(16));
+        bytes[6] = (bytes[6] & 0x0f) | 0x40;
+        bytes[8] = (bytes[8] & 0x3f) | 0x80;
+        var hex = Array.from(bytes, b => b.toString(16).padStart(2, "0"));
+        return [hex.slice(0, 4), hex.slice(4, 6), hex.slice(6, 8),
+                hex.slice(8, 10), hex.slice(10)].map(h => h.join("")).join("-");
+    };
+
+    var csrftoken = function() {
+        var input = form.querySelector("input[name='csrfmiddlewaretoken']");
+        return input ? input.value : "";
+    };
+
+    var sending = false;
+    // navigator.onLine only knows about the device's own network, so whether
+    // the server could be reached is also tracked by the sends themselves.
+    var reachable = true;
+    var retry = RETRY_MIN;
+    var timeout = null;
+    var sync = function() {
+        var queue = load();
+        var pending = queue.filter(item => !item.errors);
+        clearTimeout(timeout);
+        if (sending || !pending.length) {
+            store(queue);
+            return;
+        }
+        sending = true;
+        fetch(output.dataset.submit, {
+            method: "POST",
+            credentials: "same-origin",
+            headers: {
+                "Content-Type": "application/json",
+                "X-CSRFToken": csrftoken(),
+            },
+            body: JSON.stringify({scoresheets: pending.map(
+                item => ({key: item.key, fields: item.fields}))}),
+        }).then(function(response) {
+            if (!response.ok) {
+                throw new Error(response.statusText);
+            }
+            return response.json();
+        }).then(function(data) {
+            // Sent (or previously sent) scoresheets leave the queue, but
+            // rejected ones stay, with their errors, for the referee.
+            var results = {};
+            for (let result of data.results) {
+                results[result.key] = result;
+            }
+            store(load().filter(function(item) {
+                var result = results[item.key];
+                if (result && result.status == "invalid") {
+                    item.errors = result.errors;
+                }
+                return !result || result.status == "invalid";
+            }));
+            reachable = true;
+            retry = RETRY_MIN;
+        }).catch(function() {
+            // Offline, the server is unreachable, or it failed (a non-2xx
+            // response). The queue is kept, to try again later.
+            reachable = false;
+            timeout = setTimeout(sync, retry);
+            retry = Math.min(retry * 2, RETRY_MAX);
+        }).then(function() {
+            sending = false;
+        });
+    };
+
+    if (adding) {
+        form.addEventListener("submit", function(event) {
+            if (navigator.onLine && reachable) {
+                return;  // Normal form submission.
+            }
+            event.preventDefault();
+            var fields = {};
+            for (let [name, value] of new FormData(form)) {
+                if (name != "csrfmiddlewaretoken" && !name.startsWith("_")) {
+                    fields[name] = value;
+                }
+            }
+            var queue = load();
+            queue.push({key: uuid4(), fields: fields});
+            store(queue);
+            form.reset();
+            sync();
+        });
+    }
+
+    window.addEventListener("online", sync);
+    sync();
+}
+
+window.addEventListener("load", scoresheetqueue);
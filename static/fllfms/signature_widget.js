@@ -1,4 +1,81 @@
 // Requires https://github.com/szimek/signature_pad
+// Signatures are submitted as quantised, delta-encoded strokes rather than
+// as images. See signatures.py for the format (keep in sync).
+var SIGNATURE_VERSION = 1;
+var SIGNATURE_GRID_WIDTH = 500;
+var PNG_MAGIC = "\x89PNG";
+
+function encodestrokes(groups, dimensions) {
+    // Quantise to the grid, keeping the pad's aspect ratio.
+    var width = SIGNATURE_GRID_WIDTH;
+    var height = Math.max(1, Math.round(
+        width * dimensions.height / dimensions.width));
+    var scale = (width - 1) / dimensions.width;
+    var bytes = [];
+    var varint = function(n) {
+        while (n > 0x7f) {
+            bytes.push((n & 0x7f) | 0x80);
+            n >>>= 7;
+        }
+        bytes.push(n);
+    };
+    var zigzag = n => (n >= 0) ? n * 2 : -n * 2 - 1;
+    var clamp = (n, max) => Math.min(Math.max(Math.round(n), 0), max - 1);
+
+    varint(SIGNATURE_VERSION);
+    varint(width);
+    varint(height);
+    var strokes = groups.filter(group => group.points.length);
+    varint(strokes.length);
+    var last = [0, 0];
+    for (let group of strokes) {
+        varint(group.points.length);
+        for (let point of group.points) {
+            var x = clamp(point.x * scale, width);
+            var y = clamp(point.y * scale, height);
+            varint(zigzag(x - last[0]));
+            varint(zigzag(y - last[1]));
+            last = [x, y];
+        }
+    }
+    return btoa(String.fromCharCode.apply(null, bytes));
+}
+
+function decodestrokes(value, dimensions, color) {
+    // The inverse of encodestrokes(), as signature_pad point groups.
+    var bytes = atob(value);
+    var position = 0;
+    var varint = function() {
+        var n = 0;
+        for (let shift = 0; ; shift += 7) {
+            var byte = bytes.charCodeAt(position++);
+            n += (byte & 0x7f) * Math.pow(2, shift);
+            if (!(byte & 0x80)) {
+                return n;
+            }
+        }
+    };
+    var unzigzag = n => (n % 2) ? -(n + 1) / 2 : n / 2;
+
+    varint();  // Version.
+    var width = varint();
+    varint();  // Height, implied by the aspect ratio of the pad.
+    var scale = dimensions.width / (width - 1);
+    var groups = [];
+    var count = varint();
+    var last = [0, 0];
+    for (let i = 0; i < count; i++) {
+        var points = [];
+        for (let n = varint(); n > 0; n--) {
+            last = [last[0] + unzigzag(varint()),
+                    last[1] + unzigzag(varint())];
+            points.push({x: last[0] * scale, y: last[1] * scale, time: 0});
+        }
+        groups.push({color: color, points: points});
+    }
+    return groups;
+}
+
 function padsetup() {
 
     var queryset = document.querySelectorAll(".signature-pad");
@@ -14,11 +91,22 @@ function padsetup() {
         pad.input = wrapper.querySelector("input");
         pad.overlay = wrapper.querySelector("div").querySelector("div");
         pad.lock = function() {
+            pad.locked = true;
             pad.overlay.style.display = "flex";
             pad.off();
-            pad.fromDataURL("data:image/png;base64," + pad.input.value);
+            if (!pad.input.value) {
+                return;  // Nothing to show.
+            }
+            if (atob(pad.input.value).startsWith(PNG_MAGIC)) {
+                // Signed before strokes were stored.
+                pad.fromDataURL("data:image/png;base64," + pad.input.value);
+            } else {
+                pad.fromData(decodestrokes(
+                    pad.input.value, pad.dimensions, pad.penColor));
+            }
         };
         pad.unlock = function() {
+            pad.locked = false;
             pad.overlay.style.display = "none";
             pad.clear();
             pad.input.value = "";
@@ -26,11 +114,13 @@ function padsetup() {
         };
         // "When the pad is updated"
         pad.onEnd = function() {
+            if (pad.locked) {
+                return;  // Unchanged, the input already has the value.
+            }
             if (pad.isEmpty()) {
                 pad.input.value = "";
             } else {
-                // cut data:image/png;base64,
-                pad.input.value = this.toDataURL().substring(22);
+                pad.input.value = encodestrokes(pad.toData(), pad.dimensions);
             }
         };
         pad._canvasResize = function () {
@@ -1,5 +1,8 @@
 from datetime import datetime, timezone
+from itertools import chain
+import random
 
+import numpy as np
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.contrib.auth import get_user_model
@@ -7,7 +10,7 @@ from django.db import transaction
 from django.db.utils import IntegrityError
 from django.test import TestCase
 
-from ...models import Team, Match, Player, Scoresheet
+from ...models import Team, Match, Player, Scoresheet, Signature
 User = get_user_model()
 
 
@@ -38,7 +41,7 @@ class BaseScoresheetTests(TestCase):
         # are set up correctly, and it also means inheritance flows correctly.
         return Scoresheet(
             player=Player.objects.first(), referee=User.objects.first(),
-            signature=b'1234')
+            signature=Signature.fromdata(b'1234'))
 
     def with_missions(self, scoresheet=None):
         # This will be overridden in TestSuite subclasses.
@@ -54,7 +57,7 @@ class BaseScoresheetTests(TestCase):
         s.save()
         self.assertIsNotNone(s.pk)
         self.assertIsNotNone(s.score)  # Check save() sets score.
-        s.signature = b'4321'  # Set new signature per clean().
+        s.signature = Signature.fromdata(b'4321')  # New signature per clean().
         s.full_clean()  # Simulate edit (pk is not None) for clean()/save().
 
     def test_validate_signature_must_change(self):
@@ -64,9 +67,24 @@ class BaseScoresheetTests(TestCase):
         with self.assertRaises(ValidationError):
             with transaction.atomic():
                 s.full_clean()
-        s.signature = b'4321'  # Change signature and verify error is resolved.
+        # Change signature and verify error is resolved.
+        s.signature = Signature.fromdata(b'4321')
         s.full_clean()
 
+    def test_signature_stored_once(self):
+        s = self.with_missions()
+        s.save()
+        self.assertEqual(s.signature_id, Signature.fromdata(b'1234').pk)
+        s.signature = Signature.fromdata(b'1234')  # Identical data.
+        s.save()
+        self.assertEqual(bytes(Signature.objects.get().data), b'1234')
+        # Loading a scoresheet doesn't load the signature.
+        s = Scoresheet.objects.get(pk=s.pk)
+        with self.assertNumQueries(0):
+            s.signature_id
+        with self.assertNumQueries(1):
+            self.assertEqual(bytes(s.signature.data), b'1234')
+
     def test_player_onetoone(self):
         s1 = self.with_missions()
         s2 = self.with_missions()
@@ -109,6 +127,70 @@ class BaseScoresheetTests(TestCase):
             with transaction.atomic():
                 p.full_clean()
 
+    def random_sheets(self, count, seed=0):
+        # Yields (scoresheet, fields) with random (possibly invalid) values.
+        fields = list(chain.from_iterable(
+            (m[1]['fields'] for m in Scoresheet.missions)))
+        rng = random.Random(seed)
+        for i in range(count):
+            s = self.get_base()
+            for name, config in fields:
+                value = rng.randrange(len(config.get('choices', (0, 1))))
+                if 'choices' not in config:
+                    value = bool(value)
+                setattr(s, name, value)
+            yield s, fields
+
+    def test_scoring_plan(self):
+        # The compiled plan must agree with walking the mission spec.
+        for i, (s, fields) in enumerate(self.random_sheets(100)):
+            expected = 0
+            for name, config in fields:
+                value = getattr(s, name)
+
+                weight = config.get('value', 0)
+                if callable(weight):
+                    expected += weight(value)
+                elif hasattr(weight, '__getitem__'):
+                    expected += weight[value]
+                else:
+                    expected += value * weight
+            with self.subTest(i=i):
+                self.assertEqual(Scoresheet.scoring_plan(s), expected)
+
+    def test_vectorised_scoring(self):
+        # calculatescores() must agree with calculatescore(), if provided.
+        if not Scoresheet.has_vectorised_scoring():
+            self.skipTest("No vectorised scoring for this scoresheet.")
+        sheets = list(self.random_sheets(200))
+        fields = sheets[0][1]
+        columns = {
+            name: np.array([getattr(s, name) for s, _ in sheets])
+            for name, config in fields
+        }
+        self.assertEqual(
+            list(Scoresheet.calculatescores(columns)),
+            [s.calculatescore() for s, _ in sheets])
+
+    def test_score_expression(self):
+        # The database must calculate the same score as calculatescore().
+        if not Scoresheet.has_score_expression():
+            self.skipTest("No score expression for this scoresheet.")
+        saved = self.with_missions()
+        saved.save()
+        for i, (s, fields) in enumerate(self.random_sheets(50)):
+            values = {name: getattr(s, name) for name, config in fields}
+            try:
+                with transaction.atomic():
+                    Scoresheet.objects.filter(pk=saved.pk).update(**values)
+            except IntegrityError:
+                continue  # Invalid combination (rejected by constraints).
+            with self.subTest(i=i):
+                self.assertEqual(
+                    Scoresheet.objects.with_calculated_score().get(
+                        pk=saved.pk).calculated_score,
+                    s.calculatescore())
+
     def test_empty_repr_str(self):
         # No need to assert anything as it just verifies no crash.
         _ = repr(Scoresheet())
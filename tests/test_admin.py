@@ -0,0 +1,611 @@
+from base64 import b64encode
+from datetime import datetime, timezone
+import json
+from unittest import mock
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection
+from django.db.models import Q
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.http import urlencode
+from django.urls import reverse
+from django.utils import translation
+from django.utils.timezone import localtime
+import reversion
+from reversion.models import Revision, Version
+
+from ..admin import (MatchAdmin, RadioRow, ScoresheetAdmin, SignatureWidget,
+                     TeamAdmin, violates)
+from ..models import Team, Match, Player, Scoresheet, Signature
+from ..pagination import count
+from ..signatures import PNG_MAGIC, encode
+User = get_user_model()
+
+
+class AdminTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.superuser = User.objects.create_superuser(
+            'su', 'su@example.com', 'norootpassword')
+
+    def setUp(self):
+        self.client.force_login(self.superuser)
+
+    @staticmethod
+    def url(model, view, *args):
+        return reverse("admin:{}_{}_{}".format(
+            model._meta.app_label, model._meta.model_name, view), args=args)
+
+
+class ScoresheetRulesTests(AdminTestCase):
+    def test_rules(self):
+        response = self.client.get(self.url(Scoresheet, 'rules'))
+        self.assertEqual(response.status_code, 200)
+        rules = response.json()
+        self.assertEqual(
+            [f['name'] for f in rules['fields']],
+            [f[0] for m in Scoresheet.missions for f in m[1]['fields']])
+        self.assertTrue(response.has_header('ETag'))
+
+        response = self.client.get(
+            self.url(Scoresheet, 'rules'),
+            HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_rules_permission(self):
+        self.client.logout()
+        response = self.client.get(self.url(Scoresheet, 'rules'))
+        self.assertEqual(response.status_code, 302)  # To the login page.
+
+        staff = User.objects.create_user('staff', 'staff@example.com', 'pw',
+                                         is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(self.url(Scoresheet, 'rules'))
+        self.assertEqual(response.status_code, 403)
+
+    def test_add_form_preview(self):
+        response = self.client.get(self.url(Scoresheet, 'add'))
+        self.assertContains(response, 'class="score-preview"')
+        self.assertContains(response, self.url(Scoresheet, 'rules'))
+
+
+SIGNATURE = encode(500, 200, [[(10, 10), (20, 30)], [(40, 40)]])
+TOO_MANY_MATCHES = ("Cannot have more than one match per team, per round, "
+                    "per tournament (non-surrogate matches). Nothing was "
+                    "saved.")
+
+
+class ScoresheetAdminTestCase(AdminTestCase):
+    # Some played (but unscored) players.
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.players = []
+        for i in (1, 2):
+            match = Match.objects.create(
+                tournament=settings.FLLFMS['TOURNAMENTS'][0][0],
+                number=i, round=1, field=settings.FLLFMS['FIELDS'][0][0],
+                schedule=datetime(2019, 2, 21, 4, 59, 00,
+                                  tzinfo=timezone.utc),
+                actual=datetime(2019, 2, 21, 5, i, 00, tzinfo=timezone.utc))
+            cls.players.append(Player.objects.create(
+                match=match, team=Team.objects.create(number=i),
+                station=settings.FLLFMS['STATIONS'][0][0]))
+
+    def fields(self, player):
+        # Add form data for a scoresheet with no missions scored.
+        fields = {'player': player.pk, 'referee': self.superuser.pk,
+                  'signature': str(b64encode(SIGNATURE), 'ascii')}
+        for mission in Scoresheet.missions:
+            for name, config in mission[1]['fields']:
+                fields[name] = 0 if 'choices' in config else False
+        return fields
+
+
+class ScoresheetSubmitTests(ScoresheetAdminTestCase):
+    def submit(self, *items):
+        return self.client.post(
+            self.url(Scoresheet, 'submit'), content_type='application/json',
+            data=json.dumps({'scoresheets': [
+                {'key': str(k), 'fields': f} for k, f in items]}))
+
+    def test_submit(self):
+        key = uuid.uuid4()
+        response = self.submit((key, self.fields(self.players[0])))
+        self.assertEqual(response.status_code, 200)
+        result, = response.json()['results']
+        self.assertEqual(result['status'], 'created')
+        sheet = Scoresheet.objects.get(pk=result['pk'])
+        self.assertEqual(sheet.submission, key)
+        self.assertEqual(sheet.player, self.players[0])
+        # With its history, as from the add form.
+        version, = Version.objects.get_for_object(sheet)
+        self.assertEqual(version.revision.user, self.superuser)
+
+        # A retry (e.g. the response was lost) is not saved again.
+        response = self.submit((key, self.fields(self.players[0])))
+        result, = response.json()['results']
+        self.assertEqual(result['status'], 'duplicate')
+        self.assertEqual(result['pk'], sheet.pk)
+        self.assertEqual(Scoresheet.objects.count(), 1)
+
+        # The change form shows the stored signature (not its key).
+        response = self.client.get(self.url(Scoresheet, 'change', sheet.pk))
+        self.assertContains(response, str(b64encode(SIGNATURE), 'ascii'))
+        self.assertNotContains(response, sheet.signature_id)
+
+    def test_submit_invalid(self):
+        invalid = self.fields(self.players[0])
+        invalid['signature'] = str(b64encode(b'1234'), 'ascii')
+        response = self.submit((uuid.uuid4(), invalid),
+                               ("not a key", self.fields(self.players[0])),
+                               (uuid.uuid4(), self.fields(self.players[1])))
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results],
+                         ['invalid', 'invalid', 'created'])
+        self.assertIn('signature', results[0]['errors'])
+        # The rest of the batch is still saved.
+        self.assertQuerysetEqual(
+            Scoresheet.objects.values_list('player', flat=True),
+            [self.players[1].pk], transform=int)
+
+    def test_submit_integrity(self):
+        # Rejected by the database, without taking the rest of the batch.
+        key = uuid.uuid4()
+        save = Scoresheet.save
+
+        def fail(sheet, *args, **kwargs):
+            if sheet.player == self.players[0]:
+                raise IntegrityError("CHECK constraint failed: fllfms")
+            save(sheet, *args, **kwargs)
+
+        with mock.patch.object(Scoresheet, 'save', fail):
+            response = self.submit(
+                (uuid.uuid4(), self.fields(self.players[0])),
+                (key, self.fields(self.players[1])))
+        results = response.json()['results']
+        self.assertEqual([r['status'] for r in results],
+                         ['invalid', 'created'])
+        self.assertEqual(results[0]['errors']['__all__'][0]['code'],
+                         'integrity')
+        self.assertEqual(Scoresheet.objects.get().submission, key)
+
+    def test_violates(self):
+        self.assertTrue(violates(IntegrityError(
+            "UNIQUE constraint failed: fllfms_scoresheet.submission"),
+            Scoresheet, 'submission'))
+        self.assertTrue(violates(IntegrityError(
+            'duplicate key value violates unique constraint '
+            '"player_round_tournament_uniq"'),
+            Player, 'player_round_tournament_uniq'))
+        self.assertFalse(violates(IntegrityError(
+            "UNIQUE constraint failed: fllfms_scoresheet.player_id"),
+            Scoresheet, 'submission'))
+
+    def test_submit_bad_request(self):
+        self.assertEqual(
+            self.client.get(self.url(Scoresheet, 'submit')).status_code, 405)
+        response = self.client.post(self.url(Scoresheet, 'submit'),
+                                    content_type='application/json',
+                                    data="[]")
+        self.assertEqual(response.status_code, 400)
+        response = self.submit(*[(uuid.uuid4(), {})] * (
+            ScoresheetAdmin.SUBMIT_BATCH_LIMIT + 1))
+        self.assertEqual(response.status_code, 400)
+
+
+class ScoresheetSignatureTests(AdminTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.signature = Signature.fromdata(SIGNATURE)
+        cls.signature.store()
+
+    def test_signature(self):
+        url = self.url(Scoresheet, 'signature', self.signature.pk)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], "image/png")
+        self.assertTrue(response.content.startswith(PNG_MAGIC))
+        self.assertIn("immutable", response['Cache-Control'])
+
+        # Revalidation doesn't touch the database.
+        with self.assertNumQueries(2):  # Session and user (admin_view).
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        response = self.client.get(self.url(Scoresheet, 'signature', 'f00'))
+        self.assertEqual(response.status_code, 404)
+
+    def test_widget_disabled(self):
+        # Shown as a (cacheable) image from signature_view, not inline.
+        url = self.url(Scoresheet, 'signature', '__digest__')
+        html = SignatureWidget(url=url).render(
+            'signature', str(b64encode(SIGNATURE), 'ascii'),
+            attrs={'disabled': True})
+        self.assertInHTML('<img src="{}">'.format(
+            self.url(Scoresheet, 'signature', self.signature.pk)), html)
+
+    def test_signature_permission(self):
+        staff = User.objects.create_user('staff', 'staff@example.com', 'pw',
+                                         is_staff=True)
+        self.client.force_login(staff)
+        response = self.client.get(
+            self.url(Scoresheet, 'signature', self.signature.pk))
+        self.assertEqual(response.status_code, 403)
+
+
+class ScoresheetPlayerAutocompleteTests(ScoresheetAdminTestCase):
+    def search(self, **params):
+        response = self.client.get(
+            self.url(Scoresheet, 'player_autocomplete'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_search(self):
+        results = self.search()['results']
+        # Most recently played first, as str(player).
+        self.assertEqual([r['text'] for r in results],
+                         [str(p) for p in reversed(self.players)])
+        results = self.search(term="1")['results']
+        self.assertEqual([r['id'] for r in results], [str(self.players[0].pk)])
+
+        # Unplayed players can't be scored.
+        Match.objects.filter(pk=self.players[0].match_id).update(actual=None)
+        results = self.search(term="1")['results']
+        self.assertEqual(results, [])
+
+    def test_scored(self):
+        response = self.client.post(self.url(Scoresheet, 'add'),
+                                    self.fields(self.players[0]))
+        self.assertEqual(response.status_code, 302)
+        sheet = Scoresheet.objects.get()
+        results = self.search()['results']
+        self.assertEqual([r['id'] for r in results], [str(self.players[1].pk)])
+
+        # Unless it's the scoresheet being edited.
+        results = self.search(scoresheet=sheet.pk)['results']
+        self.assertEqual(len(results), 2)
+        response = self.client.get(self.url(Scoresheet, 'change', sheet.pk))
+        self.assertContains(response, "?scoresheet={}".format(sheet.pk))
+        self.assertContains(response, str(self.players[0]))
+        self.assertNotContains(response, str(self.players[1]))
+
+    def test_pagination(self):
+        with mock.patch.object(ScoresheetAdmin, 'PLAYER_AUTOCOMPLETE_PAGE', 1):
+            data = self.search()
+            self.assertEqual(len(data['results']), 1)
+            self.assertTrue(data['pagination']['more'])
+            data = self.search(page=2)
+            self.assertEqual(data['results'][0]['id'],
+                             str(self.players[0].pk))
+            self.assertFalse(data['pagination']['more'])
+
+
+class RadioRowTests(TestCase):
+    choices = [(0, "Zero"), (1, "One"), (2, "Two")]
+
+    def setUp(self):
+        RadioRow._rendered.clear()
+
+    def test_cached(self):
+        widget = RadioRow(choices=self.choices, cache_key='test')
+        expected = RadioRow(choices=self.choices).render('m01', 1)
+        with mock.patch.object(RadioRow, 'get_context',
+                               wraps=widget.get_context) as get_context:
+            self.assertHTMLEqual(widget.render('m01', 1), expected)
+            self.assertHTMLEqual(widget.render('m01', 1), expected)
+            self.assertEqual(get_context.call_count, 1)
+
+            # Each value (checked state) is rendered separately.
+            self.assertInHTML(
+                '<input type="radio" name="m01" value="2" class="radiorow" '
+                'checked>',
+                widget.render('m01', 2))
+            self.assertEqual(get_context.call_count, 2)
+
+            # Values which aren't choices are never cached.
+            widget.render('m01', 3)
+            widget.render('m01', 3)
+            self.assertEqual(get_context.call_count, 4)
+
+    def test_language(self):
+        widget = RadioRow(choices=self.choices, cache_key='test')
+        with translation.override('en'):
+            widget.render('m01', 1)
+        with translation.override('fr'):
+            widget.render('m01', 1)
+        self.assertEqual(len(RadioRow._rendered), 2)
+
+
+class ScoresheetQueryBudgetTests(ScoresheetAdminTestCase):
+    # The number of queries shouldn't grow with the number of players (or
+    # how often the form is built). Includes the session, user and savepoints.
+    def setUp(self):
+        super().setUp()
+        response = self.client.post(self.url(Scoresheet, 'add'),
+                                    self.fields(self.players[0]))
+        self.assertEqual(response.status_code, 302)
+        self.sheet = Scoresheet.objects.get()
+        fields = self.fields(self.players[0])
+        fields['signature'] = str(b64encode(encode(500, 200, [[(1, 1)]])),
+                                  'ascii')
+        response = self.client.post(
+            self.url(Scoresheet, 'change', self.sheet.pk), fields)
+        self.assertEqual(response.status_code, 302)
+        self.version = Version.objects.get_for_object(self.sheet).last()
+
+        # Plenty more players to choose from.
+        for i in range(3, 13):
+            match = Match.objects.create(
+                tournament=settings.FLLFMS['TOURNAMENTS'][0][0],
+                number=i, round=1, field=settings.FLLFMS['FIELDS'][0][0],
+                schedule=datetime(2019, 2, 21, 4, 59, 00,
+                                  tzinfo=timezone.utc),
+                actual=datetime(2019, 2, 21, 5, i, 00, tzinfo=timezone.utc))
+            Player.objects.create(
+                match=match, team=Team.objects.create(number=i),
+                station=settings.FLLFMS['STATIONS'][0][0])
+
+    def assertQueries(self, num, url):
+        with self.assertNumQueries(num):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    def test_change(self):
+        self.assertQueries(10, self.url(Scoresheet, 'change', self.sheet.pk))
+
+    def test_history(self):
+        self.assertQueries(4, self.url(Scoresheet, 'history', self.sheet.pk))
+
+    def test_revision(self):
+        self.assertQueries(24, self.url(
+            Scoresheet, 'revision', self.sheet.pk, self.version.pk))
+
+
+class PlayerInlineQueryTests(ScoresheetAdminTestCase):
+    def change_queries(self, match):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url(Match, 'change', match.pk))
+        self.assertEqual(response.status_code, 200)
+        return response, len(queries)
+
+    def test_queries_per_player(self):
+        # The queries for a match's page don't depend on how many players it
+        # has (or whether they have scoresheets).
+        match = self.players[0].match
+        self.change_queries(match)  # Warm up caches (i.e. content types).
+        response, one = self.change_queries(match)
+        self.assertContains(response, self.url(Scoresheet, 'add') +
+                            "?player={}".format(self.players[0].pk))
+
+        response = self.client.post(self.url(Scoresheet, 'add'),
+                                    self.fields(self.players[0]))
+        self.assertEqual(response.status_code, 302)
+        sheet = Scoresheet.objects.get()
+        for team, station in zip((3, 4), settings.FLLFMS['STATIONS'][1:]):
+            Player.objects.create(match=match, station=station[0],
+                                  team=Team.objects.create(number=team))
+        response, many = self.change_queries(match)
+        self.assertContains(response,
+                            self.url(Scoresheet, 'change', sheet.pk))
+        self.assertEqual(one, many)
+
+
+class MatchFilterTests(ScoresheetAdminTestCase):
+    def changelist(self, **params):
+        response = self.client.get(self.url(Match, 'changelist'), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(m.number for m in response.context['cl'].result_list)
+
+    def test_filters(self):
+        unplayed = Match.objects.create(
+            tournament=settings.FLLFMS['TOURNAMENTS'][0][0],
+            number=3, round=1, field=settings.FLLFMS['FIELDS'][0][0],
+            schedule=datetime(2019, 2, 21, 4, 59, 00, tzinfo=timezone.utc))
+        self.assertEqual(self.changelist(complete=0), [1, 2])
+        self.assertEqual(self.changelist(complete=1), [unplayed.number])
+        self.assertEqual(self.changelist(stationcount=0), [unplayed.number])
+        self.assertEqual(self.changelist(stationcount=1), [1, 2])
+        self.assertEqual(self.changelist(stationcount=2), [])
+
+
+class MatchChangeTests(ScoresheetAdminTestCase):
+    def test_team_too_many_matches(self):
+        # Adding the first team to the second match, in the same round.
+        match = self.players[1].match
+        station = settings.FLLFMS['STATIONS'][1][0]
+        response = self.client.post(self.url(Match, 'change', match.pk), {
+            'tournament': match.tournament, 'number': match.number,
+            'round': match.round, 'field': match.field,
+            'schedule_0': localtime(match.schedule).strftime('%Y-%m-%d'),
+            'schedule_1': localtime(match.schedule).strftime('%H:%M:%S'),
+            'actual_0': "", 'actual_1': "",
+            'players-TOTAL_FORMS': 2, 'players-INITIAL_FORMS': 1,
+            'players-MAX_NUM_FORMS': 1000,
+            'players-0-id': self.players[1].pk,
+            'players-0-match': match.pk,
+            'players-0-station': self.players[1].station,
+            'players-0-team': self.players[1].team.pk,
+            'players-1-match': match.pk,
+            'players-1-station': station,
+            'players-1-team': self.players[0].team.pk})
+        # Shown again, with the user's input, and nothing saved.
+        self.assertEqual(response.status_code, 200)
+        form = response.context['adminform'].form
+        self.assertEqual(form.non_field_errors(), [TOO_MANY_MATCHES])
+        self.assertEqual(form.data['players-1-station'], str(station))
+        self.assertEqual(Player.objects.filter(match=match).count(), 1)
+        self.assertEqual(Match.objects.get(pk=match.pk).actual,
+                         match.actual)
+
+
+class MatchBulkTests(ScoresheetAdminTestCase):
+    def setUp(self):
+        super().setUp()
+        self.matches = [player.match for player in self.players]
+        # Bulk changes must not fall back to saving match by match.
+        patcher = mock.patch.object(Match, 'save', side_effect=AssertionError)
+        self.addCleanup(patcher.stop)
+        self.revisions = Revision.objects.count()
+        response = self.client.post(self.url(Scoresheet, 'add'),
+                                    self.fields(self.players[0]))
+        self.assertEqual(response.status_code, 302)
+        patcher.start()
+
+    def action(self, action):
+        response = self.client.post(self.url(Match, 'changelist'), {
+            'action': action, 'index': 0,
+            '_selected_action': [match.pk for match in self.matches]})
+        self.assertEqual(response.status_code, 302)
+
+    def assertRevision(self, **state):
+        # One new revision (besides the scoresheet's), with every match in it.
+        self.assertEqual(Revision.objects.count(), self.revisions + 2)
+        revision = Revision.objects.latest('pk')
+        versions = revision.version_set.filter(
+            content_type__model=Match._meta.model_name)
+        self.assertEqual(sorted(int(v.object_id) for v in versions),
+                         [match.pk for match in self.matches])
+        for version in versions:
+            fields = version.field_dict
+            for name, value in state.items():
+                self.assertEqual(fields[name], value)
+
+    def test_reset(self):
+        self.action('reset')
+        self.assertFalse(Scoresheet.objects.exists())
+        self.assertFalse(Match.objects.filter(
+            Q(played=True) | Q(actual__isnull=False) | Q(scored_count__gt=0)
+        ).exists())
+        self.assertRevision(played=False, actual=None, scored_count=0)
+
+    def test_empty(self):
+        self.action('reset')
+        self.revisions += 1
+        self.action('empty')
+        self.assertFalse(Player.objects.exists())
+        self.assertFalse(Match.objects.filter(player_count__gt=0).exists())
+        self.assertRevision(player_count=0)
+
+    def test_empty_played(self):
+        self.action('empty')
+        self.assertEqual(Player.objects.count(), len(self.players))
+
+    def list_edit(self, round, status=302):
+        data = {'_save': "Save", 'form-TOTAL_FORMS': len(self.matches),
+                'form-INITIAL_FORMS': len(self.matches),
+                'form-MAX_NUM_FORMS': 1000}
+        for i, match in enumerate(self.matches):
+            data.update({
+                'form-{}-id'.format(i): match.pk,
+                'form-{}-round'.format(i): round,
+                'form-{}-field'.format(i): match.field,
+                'form-{}-actual_0'.format(i): "",
+                'form-{}-actual_1'.format(i): ""})
+            for j, f in enumerate(('%Y-%m-%d', '%H:%M:%S')):
+                data['form-{}-schedule_{}'.format(i, j)] = localtime(
+                    match.schedule).strftime(f)
+        response = self.client.post(self.url(Match, 'changelist'), data)
+        self.assertEqual(response.status_code, status)
+        return response
+
+    def test_list_editable(self):
+        self.list_edit(round=2)
+        # The first match is still played, as it has a scoresheet.
+        self.assertEqual(list(Match.objects.order_by('number').values_list(
+            'round', 'actual', 'played')), [(2, None, True), (2, None, False)])
+        self.assertRevision(round=2, actual=None)
+        # The players' copies of the round follow.
+        self.assertEqual(set(Player.objects.values_list('round', flat=True)),
+                         {2})
+
+    def test_list_editable_team_too_many_matches(self):
+        # The first team also plays in the second match, in round 2.
+        Match.objects.filter(pk=self.matches[1].pk).update(round=2)
+        Player.objects.create(match=Match.objects.get(pk=self.matches[1].pk),
+                              team=self.players[0].team,
+                              station=settings.FLLFMS['STATIONS'][1][0])
+        # Shown again, with the error (rather than the database's).
+        response = self.list_edit(round=1, status=200)
+        self.assertEqual(response.context['cl'].formset.non_form_errors(),
+                         [TOO_MANY_MATCHES])
+        self.assertEqual(list(Match.objects.order_by('number').values_list(
+            'round', flat=True)), [1, 2])
+
+
+class KeysetPaginationTests(AdminTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for i in range(1, 26):
+            Match.objects.create(
+                tournament=settings.FLLFMS['TOURNAMENTS'][i % 2][0],
+                number=i, round=1, field=settings.FLLFMS['FIELDS'][0][0],
+                schedule=datetime(2019, 2, 21, 4, 59, 00, tzinfo=timezone.utc),
+                actual=datetime(2019, 2, 21, 5, i % 7, i, tzinfo=timezone.utc)
+                if i % 3 else None)
+
+    def pages(self, **params):
+        url = self.url(Match, 'changelist') + "?" + urlencode(params)
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            cl = response.context['cl']
+            self.assertTrue(cl.keys)  # Not page numbers.
+            pages.append([m.number for m in cl.result_list])
+            url = cl.next_url and self.url(Match, 'changelist') + cl.next_url
+        return pages
+
+    @mock.patch.object(MatchAdmin, 'list_per_page', 4)
+    def test_pages(self):
+        # Default ordering, and by nullable (actual) and descending columns.
+        for order in ('', '6', '-6.2', '5.-2'):
+            params = {'o': order} if order else {}
+            response = self.client.get(self.url(Match, 'changelist'),
+                                       {'all': '', **params})
+            expected = [m.number for m in response.context['cl'].result_list]
+            pages = self.pages(**params)
+            self.assertEqual([len(page) for page in pages], [4] * 6 + [1])
+            self.assertEqual(sum(pages, []), expected)
+
+    @mock.patch.object(MatchAdmin, 'list_per_page', 10)
+    def test_filtered(self):
+        tournament = settings.FLLFMS['TOURNAMENTS'][0][0]
+        pages = self.pages(tournament__exact=tournament)
+        self.assertEqual(sum(pages, []), list(range(2, 26, 2)))
+
+    def test_invalid(self):
+        response = self.client.get(self.url(Match, 'changelist'),
+                                   {'after': '[1]'})
+        self.assertRedirects(response, self.url(Match, 'changelist') +
+                             "?e=1", fetch_redirect_response=False)
+
+    def test_count(self):
+        self.assertEqual(count(Match.objects.all(), limit=10), (10, True))
+        self.assertEqual(count(Match.objects.all(), limit=25), (25, False))
+
+    @mock.patch.object(TeamAdmin, 'history_per_page', 2)
+    def test_history(self):
+        team = Team.objects.create(number=1)
+        for name in "ABCDE":
+            with reversion.create_revision():
+                team.name = name
+                team.save()
+        url = self.url(Team, 'history', team.pk)
+        comments = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            comments.extend(Version.objects.get(
+                revision=action['revision']).field_dict['name']
+                for action in response.context['action_list'])
+            url = response.context['history_next_url']
+            url = url and self.url(Team, 'history', team.pk) + url
+        self.assertEqual("".join(comments), "ABCDE")
@@ -0,0 +1,469 @@
+from datetime import datetime, timezone
+from io import StringIO
+from itertools import chain
+import os.path
+from tempfile import TemporaryDirectory
+from textwrap import dedent
+from unittest import mock
+
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.db.models import CheckConstraint, F, Q
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+import reversion
+
+from ..management.commands.scorespace import (
+    Command as ScorespaceCommand, evaluate_expression, evaluate_q,
+    self_attributes)
+from ..models import Team, Match, Player, Scoresheet, Signature
+from ..scoresheets._expressions import expression_json
+User = get_user_model()
+
+
+class ScoresheetCommandTestCase(TestCase):
+    # Some saved scoresheets (no missions scored) to work on.
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        referee = User.objects.create_user('ref', 'ref@example.com', 'pass')
+        for i in (1, 2, 3):
+            team = Team.objects.create(number=i)
+            match = Match.objects.create(
+                tournament=settings.FLLFMS['TOURNAMENTS'][0][0],
+                number=i, round=1, field=settings.FLLFMS['FIELDS'][0][0],
+                schedule=datetime(2019, 2, 21, 4, 59, 00,
+                                  tzinfo=timezone.utc),
+                actual=datetime(2019, 2, 21, 5, 0, 00, tzinfo=timezone.utc))
+            player = Player.objects.create(
+                match=match, team=team,
+                station=settings.FLLFMS['STATIONS'][0][0])
+            sheet = Scoresheet(player=player, referee=referee,
+                               signature=Signature.fromdata(b'1234'))
+            for name, config in chain.from_iterable(
+                    (m[1]['fields'] for m in Scoresheet.missions)):
+                setattr(sheet, name, 0 if 'choices' in config else False)
+            sheet.save()
+
+    def call(self, *args, **kwargs):
+        out = StringIO()
+        call_command(*args, stdout=out, **kwargs)
+        return out.getvalue()
+
+
+class RescoreCommandTests(ScoresheetCommandTestCase):
+    def test_up_to_date(self):
+        out = self.call('rescore')
+        self.assertIn("up to date", out)
+
+    def test_rescore(self):
+        stale = Scoresheet.objects.first()
+        correct = stale.score
+        Scoresheet.objects.filter(pk=stale.pk).update(score=correct + 1000)
+
+        out = self.call('rescore', dry_run=True)
+        self.assertIn("{} -> {}".format(correct + 1000, correct), out)
+        self.assertEqual(Scoresheet.objects.get(pk=stale.pk).score,
+                         correct + 1000)
+
+        out = self.call('rescore', chunk_size=1)
+        self.assertIn("{} -> {}".format(correct + 1000, correct), out)
+        self.assertEqual(Scoresheet.objects.get(pk=stale.pk).score, correct)
+
+    def test_rescore_fallback(self):
+        # Per-row scoring, for custom logic without calculatescores().
+        stale = Scoresheet.objects.first()
+        Scoresheet.objects.filter(pk=stale.pk).update(score=stale.score - 7)
+        with mock.patch.object(Scoresheet, 'has_vectorised_scoring',
+                               return_value=False):
+            out = self.call('rescore')
+        self.assertIn("individually", out)
+        self.assertEqual(Scoresheet.objects.get(pk=stale.pk).score,
+                         stale.score)
+
+
+class AuditScoresCommandTests(ScoresheetCommandTestCase):
+    def test_clean(self):
+        with self.assertNumQueries(1):
+            out = self.call('auditscores')
+        self.assertIn("All cached scores match", out)
+
+    def test_stale(self):
+        stale = Scoresheet.objects.last()
+        Scoresheet.objects.filter(pk=stale.pk).update(score=stale.score + 5)
+        with self.assertRaises(CommandError):
+            self.call('auditscores')
+        self.assertEqual(list(Scoresheet.objects.stale()), [stale])
+
+        self.call('rescore')
+        self.assertFalse(Scoresheet.objects.stale().exists())
+
+    def test_no_score_expression(self):
+        # A configuration error, reported as such (not a traceback).
+        with mock.patch.object(Scoresheet, 'has_score_expression',
+                               return_value=False):
+            with self.assertRaises(ImproperlyConfigured):
+                Scoresheet.objects.with_calculated_score()
+            with self.assertRaisesMessage(CommandError, "rescore --dry-run"):
+                self.call('auditscores')
+
+
+class PruneSignaturesCommandTests(ScoresheetCommandTestCase):
+    def test_prune(self):
+        orphan = Signature.fromdata(b'5678')
+        orphan.store()
+        # Only a version of a (since changed) scoresheet uses this one.
+        versioned = Signature.fromdata(b'9012')
+        sheet = Scoresheet.objects.first()
+        sheet.signature = versioned
+        with reversion.create_revision():
+            sheet.save()
+        sheet.signature = Signature.fromdata(b'1234')
+        sheet.save()
+
+        out = self.call('prunesignatures', '--dry-run')
+        self.assertIn("1 orphaned", out)
+        self.assertEqual(Signature.objects.count(), 3)
+        self.call('prunesignatures')
+        self.assertEqual(set(Signature.objects.values_list('pk', flat=True)),
+                         {sheet.signature_id, versioned.pk})
+        self.assertIn("No orphaned", self.call('prunesignatures'))
+
+
+class ScorespaceCommandTests(ScoresheetCommandTestCase):
+    def call(self, *args, **kwargs):
+        # No database access is needed to enumerate the score space.
+        with self.assertNumQueries(0):
+            return super().call(*args, **kwargs)
+
+    def test_agree(self):
+        out = self.call('scorespace', '--split-independent')
+        self.assertIn("heuristically", out)
+        self.assertIn("Score range", out)
+        self.assertIn("agree", out)
+
+    def test_joint(self):
+        # By default, nothing is convolved (so the whole space is enumerated).
+        fields = list(chain.from_iterable(
+            (m[1]['fields'] for m in Scoresheet.missions)))
+        if np.prod([len(c.get('choices', (False, True))) for n, c in fields],
+                   dtype=np.float64) > 1e5:
+            self.skipTest("Score space too large to enumerate jointly.")
+        out = self.call('scorespace')
+        self.assertNotIn("heuristically", out)
+        self.assertIn("Independent (convolved): -", out)
+        self.assertIn("agree", out)
+
+    def test_disagree(self):
+        # A constraint the validators don't know about.
+        name = Scoresheet.missions[0][1]['fields'][0][0]
+        constraints = Scoresheet._meta.constraints + [CheckConstraint(
+            check=Q(**{name + '__lte': 0}), name="test_disagree")]
+        with mock.patch.object(Scoresheet._meta, 'constraints', constraints):
+            with self.assertRaises(CommandError):
+                self.call('scorespace', '--split-independent')
+
+    def test_evaluate_q(self):
+        columns = {'a': np.array([0, 1, 2, 3]), 'b': np.array([2, 2, 1, 0])}
+        self.assertEqual(
+            evaluate_q(Q(a__lte=2 - F('b')), columns).tolist(),
+            [True, False, False, False])
+        self.assertEqual(
+            evaluate_q(~Q(a=1, b=2) | Q(b__in=[0]), columns).tolist(),
+            [True, False, True, True])
+
+    def test_scoring_agrees(self):
+        # calculatescore(), calculatescores() and score_expression() (as
+        # evaluated here) must agree on every combination of the fields read
+        # by custom scoring logic, with the other fields at random values.
+        fields = list(chain.from_iterable(
+            (m[1]['fields'] for m in Scoresheet.missions)))
+        names = [name for name, config in fields]
+        radix = {name: len(config.get('choices', (False, True)))
+                 for name, config in fields}
+        booleans = {name for name, config in fields
+                    if 'choices' not in config}
+        scored = self_attributes(Scoresheet, ['calculatescore'], names)
+        coupled = [n for n in names if n in scored]
+        size = int(np.prod([radix[n] for n in coupled], dtype=np.int64))
+
+        rows = size * 10
+        columns = ScorespaceCommand().decode(
+            np.arange(rows, dtype=np.int64) % size, coupled, radix, booleans)
+        random = np.random.RandomState(0)
+        for name in names:
+            if name not in coupled:
+                columns[name] = random.randint(radix[name], size=rows).astype(
+                    np.bool_ if name in booleans else np.int64)
+
+        expected = [
+            Scoresheet(**{n: columns[n][i].item() for n in names}
+                       ).calculatescore()
+            for i in range(rows)]
+        if Scoresheet.has_vectorised_scoring():
+            self.assertEqual(
+                Scoresheet.calculatescores(columns).tolist(), expected)
+        if Scoresheet.has_score_expression():
+            tree = expression_json(Scoresheet.score_expression())
+            self.assertEqual(
+                evaluate_expression(tree, columns).tolist(), expected)
+
+
+SCHEDULE = dedent("""\
+    Version Number,1
+    Block Format,1
+    Number of Teams,4
+    1,One
+    2,Two
+    3,Three
+    4,Four
+    Block Format,2
+    Number of Ranking Matches,5
+    Number of Tables,2
+    Number of Teams per Table,2
+    Number of Simultaneous Tables,1
+    Table Names,A,B
+    1,9:00 AM,9:05 AM,1,2,3,4
+    2,9:10 AM,9:15 AM,1,3,,
+    3,9:20 AM,9:25 AM,2,4,,
+    4,9:30 AM,9:35 AM,1,2,,
+    5,Day 2 9:40 AM,9:45 AM,3,1,,
+    Block Format,3
+    Number of Judging Events,0
+    Block Format,4
+    Number of Practice Matches,1
+    Number of Tables,2
+    Number of Teams per Table,2
+    Number of Simultaneous Tables,1
+    Table Names,A,B
+    1,8:00 AM,8:05 AM,4,,,
+    """)
+
+
+class ImportScheduleCommandTests(TestCase):
+    def call(self, schedule=SCHEDULE, **kwargs):
+        out = StringIO()
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "schedule.csv")
+            with open(path, 'w') as f:
+                f.write(schedule)
+            call_command('import_schedule', path, '2019-02-21', stdout=out,
+                         **kwargs)
+        return out.getvalue()
+
+    def matches(self):
+        return [
+            (m.tournament, m.number, m.round, m.player_count, [
+                (p.team.number, p.surrogate)
+                for p in m.players.order_by('station')])
+            for m in Match.objects.order_by('tournament', 'number')]
+
+    def test_import(self):
+        # One insert per model, however long the schedule.
+        with self.assertNumQueries(11):
+            out = self.call()
+        self.assertIn("Inserted 4 of 4 teams", out)
+        self.assertIn("Splitting simultaneous match", out)
+        ranking, practice = (t[0] for t in settings.FLLFMS['TOURNAMENTS'])
+        self.assertEqual(self.matches(), [
+            (ranking, 1, 1, 2, [(1, False), (2, False)]),
+            (ranking, 2, 1, 2, [(3, False), (4, False)]),
+            # All teams have played round 1, so round 2 starts.
+            (ranking, 3, 2, 2, [(1, False), (3, False)]),
+            (ranking, 4, 2, 2, [(2, False), (4, False)]),
+            (ranking, 5, 3, 2, [(1, False), (2, False)]),
+            # Team 1 already played round 3.
+            (ranking, 6, 3, 2, [(3, False), (1, True)]),
+            (practice, 1, 1, 1, [(4, False)]),
+        ])
+        self.assertEqual(Match.objects.get(tournament=ranking, number=6)
+                         .schedule.date().isoformat(), "2019-02-22")
+        self.assertEqual(Team.objects.get(number=3).name, "Three")
+
+    def test_batches(self):
+        out = self.call(batch_size=3)
+        self.assertIn("Inserted 3 of 7 matches", out)
+        self.assertIn("Inserted 12 of 13 players", out)
+        self.assertEqual(Player.objects.count(), 13)
+
+    def test_dry_run(self):
+        out = self.call(dry_run=True)
+        self.assertIn("Dry run", out)
+        self.assertFalse(Team.objects.exists())
+        self.assertFalse(Match.objects.exists())
+
+    def test_existing(self):
+        Team.objects.create(number=1)
+        with self.assertRaises(CommandError):
+            self.call()
+
+    def test_unknown_team(self):
+        with self.assertRaisesMessage(CommandError, "Team 5"):
+            self.call(SCHEDULE.replace("3,9:20 AM,9:25 AM,2,4",
+                                       "3,9:20 AM,9:25 AM,2,5"))
+        self.assertFalse(Team.objects.exists())
+
+    # Team 2 is renamed, team 4 replaces team 2 in ranking match 5, and a
+    # practice match is added.
+    CHANGED = (SCHEDULE.replace("2,Two", "2,Deux")
+               .replace("4,9:30 AM,9:35 AM,1,2", "4,9:30 AM,9:35 AM,1,4")
+               .replace("Practice Matches,1", "Practice Matches,2")
+               + "2,8:10 AM,8:15 AM,2,,,\n")
+
+    def score(self, player):
+        player.match.actual = datetime(2019, 2, 21, 5, 0, tzinfo=timezone.utc)
+        player.match.save()
+        sheet = Scoresheet(
+            player=player, signature=Signature.fromdata(b'1234'),
+            referee=User.objects.create_user('ref', 'ref@example.com', 'pw'))
+        for name, config in chain.from_iterable(
+                (m[1]['fields'] for m in Scoresheet.missions)):
+            setattr(sheet, name, 0 if 'choices' in config else False)
+        sheet.save()
+
+    def test_merge(self):
+        self.call()
+        ranking, practice = (t[0] for t in settings.FLLFMS['TOURNAMENTS'])
+        first = Match.objects.get(tournament=ranking, number=1)
+        self.score(first.players.get(team__number=1))
+        pks = set(Match.objects.values_list('pk', flat=True))
+
+        out = self.call(self.CHANGED, merge=True)
+        self.assertIn("'Two' -> 'Deux'", out)
+        self.assertIn("2 players added", out)
+        self.assertEqual(self.matches(), [
+            (ranking, 1, 1, 2, [(1, False), (2, False)]),
+            (ranking, 2, 1, 2, [(3, False), (4, False)]),
+            (ranking, 3, 2, 2, [(1, False), (3, False)]),
+            (ranking, 4, 2, 2, [(2, False), (4, False)]),
+            (ranking, 5, 3, 2, [(1, False), (4, False)]),
+            (ranking, 6, 3, 2, [(3, False), (1, True)]),
+            (practice, 1, 1, 1, [(4, False)]),
+            (practice, 2, 1, 1, [(2, False)]),
+        ])
+        self.assertEqual(Team.objects.get(number=2).name, "Deux")
+        # Existing matches are updated in place, keeping their results.
+        self.assertLess(pks, set(Match.objects.values_list('pk', flat=True)))
+        self.assertIsNotNone(Match.objects.get(pk=first.pk).actual)
+        self.assertTrue(Scoresheet.objects.exists())
+
+        # Nothing left to change.
+        out = self.call(self.CHANGED, merge=True)
+        self.assertIn("0 teams, 0 matches and 0 players added", out)
+
+    def test_merge_swap_surrogate(self):
+        # Team 1's non-surrogate match in round 2 changes: match 3 moves into
+        # the round (no longer as a surrogate), and match 4 becomes one.
+        rounds = dedent("""\
+            Version Number,1
+            Block Format,1
+            Number of Teams,5
+            1,One
+            2,Two
+            3,Three
+            4,Four
+            5,Five
+            Block Format,2
+            Number of Ranking Matches,4
+            Number of Tables,2
+            Number of Teams per Table,2
+            Number of Simultaneous Tables,1
+            Table Names,A,B
+            1,9:00 AM,9:05 AM,1,2,,
+            2,9:10 AM,9:15 AM,{},,
+            3,9:20 AM,9:25 AM,5,1,,
+            4,9:30 AM,9:35 AM,1,3,,
+            """)
+        self.call(rounds.format("3,4"))
+        self.call(rounds.format("2,"), merge=True)
+        ranking = settings.FLLFMS['TOURNAMENTS'][0][0]
+        self.assertEqual(self.matches(), [
+            (ranking, 1, 1, 2, [(1, False), (2, False)]),
+            (ranking, 2, 2, 1, [(2, False)]),
+            (ranking, 3, 2, 2, [(5, False), (1, False)]),
+            (ranking, 4, 2, 2, [(1, True), (3, False)]),
+        ])
+        self.assertEqual(set(Player.objects.values_list('round', flat=True)),
+                         {1, 2})
+
+    def test_merge_scored(self):
+        self.call()
+        ranking = settings.FLLFMS['TOURNAMENTS'][0][0]
+        self.score(Player.objects.get(match__tournament=ranking,
+                                      match__number=5, team__number=2))
+        with self.assertRaisesMessage(CommandError, "scoresheets"):
+            self.call(self.CHANGED, merge=True)
+        self.assertEqual(Team.objects.get(number=2).name, "Two")
+
+    def test_merge_dry_run(self):
+        self.call()
+        out = self.call(self.CHANGED, merge=True, dry_run=True)
+        self.assertIn("+ ", out)
+        self.assertEqual(Team.objects.get(number=2).name, "Two")
+        self.assertEqual(Match.objects.count(), 7)
+
+
+class GenerateScheduleCommandTests(TestCase):
+    def call(self, *args, **kwargs):
+        out = StringIO()
+        call_command('generate_schedule', '2019-02-21T09:00', *args,
+                     stdout=out, seed=1, **kwargs)
+        return out.getvalue()
+
+    def generate(self, teams):
+        # Returns the queries run to generate a schedule for teams.
+        Match.objects.all().delete()
+        Team.objects.all().delete()
+        Team.objects.bulk_create(Team(number=i) for i in range(1, teams + 1))
+        with CaptureQueriesContext(connection) as queries:
+            self.call('--cycle=5', '--turnaround=10', fields=2)
+        return [query['sql'] for query in queries]
+
+    def test_queries(self):
+        # Written in bulk, with one insert per model (within a batch), and
+        # no queries per team, match or player.
+        few, many = self.generate(7), self.generate(15)
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(len([sql for sql in many
+                              if sql.startswith("INSERT")]), 2)
+
+    def test_generate(self):
+        self.generate(7)
+        ranking = settings.FLLFMS['TOURNAMENTS'][0][0]
+        matches = Match.objects.filter(tournament=ranking)
+        # 7 teams need 4 matches a round, the last with a surrogate.
+        self.assertEqual(matches.count(), 12)
+        self.assertTrue(all(m.player_count == 2 for m in matches))
+        self.assertEqual(Player.objects.filter(surrogate=True).count(), 3)
+        for team in Team.objects.all():
+            players = team.players.order_by('match__schedule')
+            self.assertEqual([p.match.round for p in players
+                              if not p.surrogate], [1, 2, 3])
+            times = [p.match.schedule for p in players]
+            for a, b in zip(times, times[1:]):
+                self.assertGreaterEqual((b - a).total_seconds(), 600)
+
+    def test_teams_file(self):
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "teams.csv")
+            with open(path, 'w') as f:
+                f.write("1,One\n2,Two\n3,Three\n4,Four\n")
+            out = self.call(teams=path, dry_run=True)
+            self.assertIn("Dry run", out)
+            self.assertFalse(Team.objects.exists())
+            self.call(teams=path, rounds=1)
+        self.assertEqual(Team.objects.get(number=3).name, "Three")
+        self.assertEqual(Match.objects.count(), 2)
+
+    def test_existing(self):
+        Team.objects.create(number=1)
+        self.call(rounds=1)
+        with self.assertRaises(CommandError):
+            self.call(rounds=1)
@@ -2,8 +2,9 @@ from datetime import datetime, timezone
 from unittest import skipIf
 
 from django.conf import settings
+from django.core import serializers
 from django.core.exceptions import ValidationError
-from django.db import connection, transaction
+from django.db import transaction
 from django.db.utils import IntegrityError
 from django.test import TestCase
 
@@ -243,36 +244,10 @@ class ModelPlayerTests(TestCase):
             with transaction.atomic():
                 p2.save()
 
-    def test_validate_team_too_many_matches_form(self):
-        # Constraint: unique_together: (match__round, match__tournament, team)
-        # (optionally where surrogate == False)
-        # This is basically the same as database one but full_clean vs save.
-        Match.objects.update(round=1)  # Same round. Tournament already same.
-        m, m2 = Match.objects.all()[:2]
-        t = Team.objects.first()
-        station = settings.FLLFMS['STATIONS'][0][0]
-
-        p = Player(match=m, team=t, station=station, surrogate=False)
-        p.save()
-        self.assertIsNotNone(p.pk)
-        p2 = Player(match=m2, team=t, station=station, surrogate=False)
-
-        # Ensure clean() rejects this.
-        with self.assertRaises(ValidationError):
-            with transaction.atomic():
-                p2.full_clean()
-
-        # Change the match round, and ensure DB allows it if rounds differ.
-        m2.round = 2
-        m2.save()
-        p2.full_clean()
-
-    @skipIf(connection.settings_dict['ENGINE'] == "django.db.backends.sqlite3",
-            "Cannot test constraint on SQLite3 databases (no view indexes).")
     def test_validate_team_too_many_matches_db(self):
-        # Constraint: unique_together: (match__round, match__tournament, team)
-        # (optionally where surrogate == False)
-        # We can't enforce this on SQLite, so it's a separate test.
+        # Constraint: player_round_tournament_uniq, over (team, round,
+        # tournament) of non-surrogate players. Enforced by the database
+        # only, as the index is partial.
         Match.objects.update(round=1)  # Same round. Tournament already same.
         m, m2 = Match.objects.all()[:2]
         t = Team.objects.first()
@@ -282,22 +257,29 @@ class ModelPlayerTests(TestCase):
         p.save()
         self.assertIsNotNone(p.pk)
         p2 = Player(match=m2, team=t, station=station, surrogate=False)
+        p2.full_clean()  # Not checked here.
 
         # Ensure DB rejects this save.
         with self.assertRaises(IntegrityError):
             with transaction.atomic():
                 p2.save()
 
+        # Surrogates may play again in the round.
+        p2.surrogate = True
+        with transaction.atomic():
+            p2.save()
+        p2.delete()
+
         # Change the match round, and ensure DB allows it if rounds differ.
+        p2 = Player(match=m2, team=t, station=station, surrogate=False)
         m2.round = 2
         m2.save()
         p2.save()
         self.assertIsNotNone(p2.pk)
+        self.assertEqual((p2.round, p2.tournament), (2, m2.tournament))
 
-    def test_match_validate_team_too_many_matches_form(self):
-        # Constraint: unique_together: (match__round, match__tournament, team)
-        # (optionally where surrogate == False)
-        # This tests validation on the Match clean, for the Player constraint.
+    def test_match_team_too_many_matches_db(self):
+        # Players follow their match's round, for the constraint above.
         m, m2 = Match.objects.all()[:2]
         t = Team.objects.first()
         station = settings.FLLFMS['STATIONS'][0][0]
@@ -309,13 +291,36 @@ class ModelPlayerTests(TestCase):
         p2.save()
         self.assertIsNotNone(p2.pk)
 
-        m2.full_clean()  # Check it passes before altering round.
         m2.round = 1  # Now change round to violate constraint, and verify.
-        with self.assertRaises(ValidationError):
+        with self.assertRaises(IntegrityError):
             with transaction.atomic():
-                m2.full_clean()
+                m2.save()
+        m2.round = 3
+        m2.save()
+        p2.refresh_from_db()
+        self.assertEqual(p2.round, 3)
 
     def test_empty_repr_str(self):
         # No need to assert anything as it just verifies no crash.
         _ = repr(Player())
         _ = str(Player())
+
+    def test_raw_save_follows_match(self):
+        # Raw saves (e.g. reverts, fixtures) skip Player.save(), so the copies
+        # are synced from the match (whichever is saved first).
+        m = Match.objects.get(number=2)
+        p = Player.objects.create(match=m, team=Team.objects.first(),
+                                  station=settings.FLLFMS['STATIONS'][0][0])
+        data = serializers.serialize('json', [p])
+        Match.objects.filter(pk=m.pk).update(round=3)
+        for obj in serializers.deserialize('json', data):
+            obj.save()
+        p.refresh_from_db()
+        self.assertEqual(p.round, 3)
+
+        data = serializers.serialize('json', [Match.objects.get(pk=m.pk)])
+        Match.objects.filter(pk=m.pk).update(round=2)
+        for obj in serializers.deserialize('json', data):
+            obj.save()
+        p.refresh_from_db()
+        self.assertEqual(p.round, 3)
@@ -0,0 +1,113 @@
+from django.db import transaction
+from django.test import TransactionTestCase
+
+from ..outbox import Outbox
+
+
+class OutboxTests(TransactionTestCase):
+    # TransactionTestCase, since on_commit callbacks never run in TestCase.
+    def setUp(self):
+        self.outbox = Outbox()
+        self.sent = []
+
+    def record(self, value):
+        self.sent.append(value)
+
+    def test_autocommit_sends_immediately(self):
+        self.outbox.put("a", self.record, 1)
+        self.outbox.join()
+        self.assertEqual(self.sent, [1])
+
+    def test_sent_after_commit_only(self):
+        with transaction.atomic():
+            self.outbox.put("a", self.record, 1)
+            self.outbox.join()
+            self.assertEqual(self.sent, [])
+        self.outbox.join()
+        self.assertEqual(self.sent, [1])
+
+    def test_coalesce_by_key(self):
+        with transaction.atomic():
+            for i in range(50):
+                self.outbox.put("a", self.record, "a{}".format(i))
+                self.outbox.put(("b", i % 2), self.record, "b{}".format(i))
+        self.outbox.join()
+        self.assertEqual(self.sent, ["a49", "b48", "b49"])
+
+    def test_rollback_discards(self):
+        with self.assertRaises(ValueError):
+            with transaction.atomic():
+                self.outbox.put("a", self.record, 1)
+                raise ValueError
+        # A new transaction must not reuse the discarded batch.
+        with transaction.atomic():
+            self.outbox.put("b", self.record, 2)
+        self.outbox.join()
+        self.assertEqual(self.sent, [2])
+
+    def test_savepoint_rollback_discards(self):
+        with transaction.atomic():
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    self.outbox.put("a", self.record, 1)
+                    raise ValueError
+            self.outbox.put("b", self.record, 2)
+        self.outbox.join()
+        self.assertEqual(self.sent, [2])
+
+    def test_savepoint_rollback_keeps_outer(self):
+        with transaction.atomic():
+            self.outbox.put("a", self.record, 1)
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    self.outbox.put("a", self.record, 2)
+                    self.outbox.put("b", self.record, 3)
+                    raise ValueError
+        self.outbox.join()
+        self.assertEqual(self.sent, [1])
+
+    def test_savepoint_release_merges(self):
+        # Released savepoints' puts coalesce with the transaction's, in the
+        # order they were made.
+        with transaction.atomic():
+            self.outbox.put("a", self.record, 1)
+            with transaction.atomic():
+                self.outbox.put("a", self.record, 2)
+                self.outbox.put("b", self.record, 4)
+            self.outbox.put("a", self.record, 3)
+            with transaction.atomic():
+                self.outbox.put("c", self.record, 5)
+        self.outbox.join()
+        self.assertEqual(self.sent, [3, 4, 5])
+
+    def test_savepoint_release_collects(self):
+        # The outer and savepoint's collections are one entry.
+        collected = []
+
+        class Collector:
+            def __init__(self):
+                self.values = []
+
+            def collect(self, value):
+                self.values.append(value)
+
+            def __call__(self):
+                collected.append(self.values)
+
+        with transaction.atomic():
+            with transaction.atomic():
+                self.outbox.collect("a", Collector, 1)
+            self.outbox.collect("a", Collector, 2)
+        self.outbox.join()
+        self.assertEqual(collected, [[1, 2]])
+
+    def test_failure_does_not_block_batch(self):
+        def fail():
+            raise RuntimeError
+
+        with self.assertLogs('fllfms.outbox', level='ERROR'):
+            with transaction.atomic():
+                self.outbox.put("a", fail)
+                self.outbox.put("b", self.record, 2)
+            self.outbox.join()
+        self.assertEqual(self.sent, [2])
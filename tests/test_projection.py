@@ -0,0 +1,139 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+
+from ..consumers import ScheduleConsumer
+from ..models import Match, Timer, TimerProfile, TIMERSTATES
+from ..projection import project
+from ..signals import ScheduleProjection
+
+
+def at(minute):
+    return datetime(2019, 2, 21, 9, 0, tzinfo=timezone.utc) + timedelta(
+        minutes=minute)
+
+
+class ProjectionTests(TestCase):
+    field = settings.FLLFMS['FIELDS'][0][0]
+
+    def schedule(self, *minutes, timer=True):
+        for number, minute in enumerate(minutes, 1):
+            Match.objects.create(
+                tournament=settings.FLLFMS['TOURNAMENTS'][0][0],
+                number=number, round=1, field=self.field,
+                schedule=at(minute))
+        if timer:
+            Timer.objects.create(
+                match=Match.objects.get(number=1),
+                profile=TimerProfile.objects.create(
+                    name="Match", duration=timedelta(minutes=3)))
+
+    def start(self, number, minute):
+        Match.objects.filter(number=number).update(actual=at(minute))
+
+    def projected(self):
+        return [(m.projected - at(0)).total_seconds() / 60
+                if m.projected is not None else None
+                for m in Match.objects.order_by('number')]
+
+    def test_on_schedule(self):
+        self.schedule(0, 10, 20)
+        with self.assertNumQueries(5):
+            self.assertEqual(len(project(self.field)), 3)
+        self.assertEqual(self.projected(), [0, 10, 20])
+        with self.assertNumQueries(4):
+            self.assertEqual(project(self.field), [])
+
+    def test_played(self):
+        # A match started since it was projected is cleared (and pushed).
+        self.schedule(0, 10)
+        project(self.field)
+        self.start(1, 5)
+        self.assertEqual([m.number for m in project(self.field)], [1])
+        self.assertEqual(self.projected(), [None, 10])
+
+    def test_send_projected(self):
+        # Sent formatted in the server's time zone, not left to the browser.
+        self.schedule(0, 10)
+        project(self.field)
+        self.start(1, 5)
+        project(self.field)
+        sent = []
+
+        async def group_send(group, message):
+            sent.append(message)
+        with mock.patch.object(ScheduleConsumer.channel_layer, 'group_send',
+                               group_send):
+            with self.settings(TIME_ZONE='Australia/Adelaide'):
+                ScheduleConsumer.send_projected(
+                    Match.objects.order_by('number'))
+        (message,) = sent
+        self.assertEqual(message['matches'], [
+            {'id': Match.objects.get(number=1).pk, 'projected': None,
+             'played': True},
+            {'id': Match.objects.get(number=2).pk, 'projected': "19:40",
+             'played': False},
+        ])
+
+    def test_delay(self):
+        # Slack in the schedule absorbs the delay.
+        self.schedule(0, 10, 20, 40)
+        self.start(1, 12)
+        project(self.field)
+        self.assertEqual(self.projected(), [None, 15, 20, 40])
+
+    def test_overrun(self):
+        # Matches have recently taken 15 minutes each, running late.
+        self.schedule(0, 10, 20, 30)
+        self.start(1, 0)
+        self.start(2, 15)
+        project(self.field)
+        self.assertEqual(self.projected(), [None, None, 30, 45])
+
+    def test_duration(self):
+        # No sooner than the previous match has finished.
+        self.schedule(0, 1, 2)
+        self.start(1, 0)
+        project(self.field)
+        self.assertEqual(self.projected(), [None, 3, 6])
+
+    def test_no_timer(self):
+        # Without a timer (or recent starts) to go by, the scheduled gaps
+        # between matches are kept.
+        self.schedule(0, 5, 10, timer=False)
+        self.start(1, 12)
+        project(self.field)
+        self.assertEqual(self.projected(), [None, 17, 22])
+
+    def test_indexed(self):
+        # Both queries seek on the field's index, rather than scanning.
+        self.schedule(0, 5)
+        matches = Match.objects.filter(field=self.field)
+        for query in (
+                matches.filter(actual__isnull=False).order_by('-actual'),
+                matches.filter(actual__isnull=True).order_by('schedule')):
+            self.assertIn("match_field_actual_idx", query.explain())
+
+    def test_timer_start(self):
+        self.schedule(0, 10)
+        timer = Timer.objects.get()
+        timer.state = TIMERSTATES.START
+        timer.starttime = at(4)
+        timer.save()
+        match = Match.objects.get(number=1)
+        self.assertEqual(match.actual, at(4))
+        self.assertTrue(match.played)
+
+    def test_refresh(self):
+        self.schedule(0, 10)
+        self.start(1, 5)
+        refresh = ScheduleProjection()
+        refresh.collect(fields=[self.field])
+        with mock.patch('fllfms.consumers.ScheduleConsumer.send_projected'
+                        ) as send:
+            refresh()
+        (changed,), kwargs = send.call_args
+        self.assertEqual([m.number for m in changed], [2])
+        self.assertEqual(self.projected(), [None, 10])
@@ -0,0 +1,73 @@
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase
+import reversion
+from reversion.models import Version
+
+from .. import revisions
+from ..models import Team, Match, Player, Timer, TimerProfile, TIMERSTATES
+
+
+class RevisionBatchTests(TestCase):
+    def test_serialised_once(self):
+        team = Team.objects.create(number=1)
+        with mock.patch.object(revisions.reversion, 'add_to_revision',
+                               wraps=reversion.add_to_revision) as add:
+            with reversion.create_revision(), revisions.batched():
+                for name in ("First", "Second", "Third"):
+                    team.name = name
+                    team.save()
+                    self.assertFalse(add.called)
+        add.assert_called_once_with(team, model_db='default')
+        version, = Version.objects.get_for_object(team)
+        self.assertEqual(version.field_dict['name'], "Third")
+
+    def test_follow(self):
+        # Inline (followed) objects are still versioned with their parent.
+        match = Match.objects.create(
+            tournament=settings.FLLFMS['TOURNAMENTS'][0][0], number=1,
+            round=1, field=settings.FLLFMS['FIELDS'][0][0],
+            schedule=datetime(2019, 2, 21, 4, 59, 00, tzinfo=timezone.utc))
+        player = Player.objects.create(
+            match=match, team=Team.objects.create(number=1),
+            station=settings.FLLFMS['STATIONS'][0][0])
+        # Registered (by MatchAdmin) to follow its players, so they're
+        # prefetched in bulk.
+        self.assertIn('players', revisions.follows(Match))
+        with reversion.create_revision(), revisions.batched():
+            match.save()
+        self.assertEqual(Version.objects.get_for_object(player).count(), 1)
+
+    def test_rollback(self):
+        team = Team.objects.create(number=1)
+        with self.assertRaises(ValueError):
+            with reversion.create_revision(), revisions.batched():
+                team.save()
+                raise ValueError
+        self.assertFalse(Version.objects.exists())
+
+    def test_inactive(self):
+        with revisions.batched():
+            Team.objects.create(number=1)
+        self.assertFalse(Version.objects.exists())
+
+
+class TimerVersionTests(TestCase):
+    def test_state_excluded(self):
+        timer = Timer.objects.create(profile=TimerProfile.objects.create(
+            name="Match", duration=timedelta(minutes=2, seconds=30)))
+        with reversion.create_revision():
+            timer.name = "Field 1"
+            timer.save()
+        # Runs and resets aren't history.
+        for state in (TIMERSTATES.START, TIMERSTATES.ABORT):
+            with reversion.create_revision():
+                timer.state = state
+                timer.starttime = datetime.now(timezone.utc)
+                timer.save()
+        version, = Version.objects.get_for_object(timer)
+        self.assertEqual(version.field_dict['name'], "Field 1")
+        self.assertNotIn('state', version.field_dict)
+        self.assertNotIn('starttime', version.field_dict)
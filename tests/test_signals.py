@@ -0,0 +1,154 @@
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from ..models import (Team, Match, Player, Scoresheet, Signature, Timer,
+                      TimerProfile)
+from ..signals import MatchPayloadRefresh
+User = get_user_model()
+
+
+class MatchPayloadRefreshTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+
+        profile = TimerProfile.objects.create(
+            name="Match", duration=timedelta(minutes=2, seconds=30))
+        for i in (1, 2, 3):
+            team = Team.objects.create(number=i)
+            match = Match.objects.create(
+                tournament=settings.FLLFMS['TOURNAMENTS'][0][0],
+                number=i, round=1, field=settings.FLLFMS['FIELDS'][0][0],
+                schedule=datetime(2019, 2, 21, 4, 59, 00,
+                                  tzinfo=timezone.utc))
+            Player.objects.create(match=match, team=team,
+                                  station=settings.FLLFMS['STATIONS'][0][0])
+            if i < 3:
+                Timer.objects.create(profile=profile, match=match)
+        Timer.objects.create(profile=profile)  # No match.
+
+    def refreshed(self, **kwargs):
+        refresh = MatchPayloadRefresh()
+        refresh.collect(**kwargs)
+        with mock.patch('fllfms.consumers.TimerConsumer.send_match') as send:
+            refresh()
+        return sorted(call[0][0].pk for call in send.call_args_list)
+
+    def test_team_dependency(self):
+        team = Team.objects.get(number=1)
+        timer = Timer.objects.get(match__number=1)
+        self.assertEqual(self.refreshed(teams=[team.pk]), [timer.pk])
+
+    def test_team_without_timer(self):
+        self.assertEqual(
+            self.refreshed(teams=[Team.objects.get(number=3).pk]), [])
+
+    def test_one_refresh_per_timer(self):
+        # Team, match and timer all point at the same timer.
+        timer = Timer.objects.get(match__number=1)
+        self.assertEqual(self.refreshed(
+            timers=[timer.pk], matches=[timer.match.pk],
+            teams=[timer.match.teams.get().pk]), [timer.pk])
+
+    def test_single_query(self):
+        refresh = MatchPayloadRefresh()
+        refresh.collect(timers=Timer.objects.values_list('pk', flat=True),
+                        matches=Match.objects.values_list('pk', flat=True),
+                        teams=Team.objects.values_list('pk', flat=True))
+        with mock.patch('fllfms.consumers.TimerConsumer.send_match') as send:
+            with self.assertNumQueries(1):
+                refresh()
+        self.assertEqual(send.call_count, Timer.objects.count())
+
+    def test_timer_without_match(self):
+        timer = Timer.objects.get(match=None)
+        self.assertEqual(self.refreshed(timers=[timer.pk]), [timer.pk])
+
+    def test_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(self.refreshed(), [])
+
+
+class MatchStateTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.referee = User.objects.create_user('ref', 'ref@example.com', 'pw')
+        cls.matches = [Match.objects.create(
+            tournament=settings.FLLFMS['TOURNAMENTS'][0][0],
+            number=i, round=1, field=settings.FLLFMS['FIELDS'][0][0],
+            schedule=datetime(2019, 2, 21, 4, 59, 00, tzinfo=timezone.utc))
+            for i in (1, 2)]
+
+    def assertState(self, match, played, scored_count, player_count):
+        match.refresh_from_db()
+        self.assertEqual(
+            (match.played, match.scored_count, match.player_count),
+            (played, scored_count, player_count))
+
+    def scoresheet(self, player):
+        sheet = Scoresheet(player=player, referee=self.referee,
+                           signature=Signature.fromdata(b'1234'))
+        for name, config in chain.from_iterable(
+                (m[1]['fields'] for m in Scoresheet.missions)):
+            setattr(sheet, name, 0 if 'choices' in config else False)
+        sheet.save()
+        return sheet
+
+    def test_players(self):
+        match, other = self.matches
+        self.assertState(match, False, 0, 0)
+        stations = [s[0] for s in settings.FLLFMS['STATIONS']]
+        players = [Player.objects.create(
+            match=match, station=station, team=Team.objects.create(number=i))
+            for i, station in enumerate(stations, 1)]
+        self.assertState(match, False, 0, len(stations))
+
+        players[0].match = other
+        players[0].save()
+        self.assertState(match, False, 0, len(stations) - 1)
+        self.assertState(other, False, 0, 1)
+        players[1].delete()
+        self.assertState(match, False, 0, len(stations) - 2)
+
+    def test_played(self):
+        match, other = self.matches
+        player = Player.objects.create(
+            match=match, team=Team.objects.create(number=1),
+            station=settings.FLLFMS['STATIONS'][0][0])
+        match.actual = datetime(2019, 2, 21, 5, 0, 00, tzinfo=timezone.utc)
+        match.save()
+        self.assertState(match, True, 0, 1)
+
+        sheet = self.scoresheet(player)
+        self.assertState(match, True, 1, 1)
+        match.actual = None
+        match.save()
+        self.assertState(match, True, 1, 1)  # Still has a scoresheet.
+
+        # Moving the scoresheet moves the match's state with it.
+        player2 = Player.objects.create(
+            match=other, team=Team.objects.create(number=2),
+            station=settings.FLLFMS['STATIONS'][0][0])
+        sheet.player = player2
+        sheet.save()
+        self.assertState(match, False, 0, 1)
+        self.assertState(other, True, 1, 1)
+
+        sheet.delete()
+        self.assertState(other, False, 0, 1)
+
+    def test_update_state(self):
+        # Recalculates from scratch, e.g. for existing databases.
+        match = self.matches[0]
+        Player.objects.create(match=match, team=Team.objects.create(number=1),
+                              station=settings.FLLFMS['STATIONS'][0][0])
+        Match.objects.update(played=True, scored_count=5, player_count=5)
+        Match.objects.update_state()
+        self.assertState(match, False, 0, 1)
+        self.assertState(self.matches[1], False, 0, 0)
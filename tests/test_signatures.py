@@ -0,0 +1,50 @@
+from base64 import b64encode
+import struct
+
+from django.test import TestCase
+
+from ..models import Signature
+from ..signatures import MAX_POINTS, PNG_MAGIC, check, decode, encode, png
+
+
+class SignatureFormatTests(TestCase):
+    strokes = [[(0, 0), (3, 1), (499, 199)], [(250, 100)], [(0, 199)]]
+
+    def test_roundtrip(self):
+        width, height, strokes = decode(encode(500, 200, self.strokes))
+        self.assertEqual((width, height), (500, 200))
+        self.assertEqual([s.tolist() for s in strokes],
+                         [[list(p) for p in s] for s in self.strokes])
+
+    def test_invalid(self):
+        data = encode(500, 200, self.strokes)
+        for invalid in (
+                b'', data[:-1], data + b'\x00', b'\x02' + data[1:],
+                encode(500, 200, []), encode(0, 200, [[(0, 0)]]),
+                encode(500, 200, [[(500, 0)]]),
+                encode(500, 200, [[(0, 0)] * (MAX_POINTS + 1)])):
+            with self.subTest(invalid=invalid[:8]):
+                with self.assertRaises(ValueError):
+                    check(invalid)
+
+    def test_png(self):
+        image = png(encode(500, 200, self.strokes))
+        self.assertTrue(image.startswith(PNG_MAGIC))
+        self.assertEqual(struct.unpack('>II', image[16:24]), (500, 200))
+        self.assertEqual(png(image), image)  # Legacy PNGs are unchanged.
+
+    def test_png_cached(self):
+        signature = Signature.fromdata(encode(500, 200, self.strokes))
+        signature.store()
+        signature = Signature.objects.get()
+        self.assertIsNone(signature.image)
+        image = signature.png()
+        self.assertEqual(bytes(Signature.objects.get().image), image)
+        with self.assertNumQueries(0):
+            signature.png()
+
+    def test_compact(self):
+        # A long stroke (of small movements) is ~2 bytes per point.
+        stroke = [(i % 400, (i // 400) * 10 + i % 7) for i in range(2000)]
+        data = encode(500, 200, [stroke])
+        self.assertLess(len(b64encode(data)), 6 * 1024)
@@ -0,0 +1,71 @@
+import os.path
+import sqlite3
+from tempfile import TemporaryDirectory
+from unittest import mock, skipIf
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from .. import sqlite
+
+
+class ConfigureTests(SimpleTestCase):
+    def pragma(self, conn, name):
+        return conn.execute("PRAGMA {}".format(name)).fetchone()[0]
+
+    def test_configure(self):
+        with TemporaryDirectory() as tmp:
+            conn = sqlite3.connect(os.path.join(tmp, "db.sqlite3"))
+            try:
+                sqlite.configure(conn.cursor())
+                self.assertEqual(self.pragma(conn, 'journal_mode'), "wal")
+                self.assertEqual(self.pragma(conn, 'synchronous'), 1)
+                self.assertEqual(self.pragma(conn, 'busy_timeout'), 5000)
+                self.assertEqual(self.pragma(conn, 'cache_size'), -65536)
+            finally:
+                conn.close()
+
+    def test_override(self):
+        conn = sqlite3.connect(":memory:", timeout=0)
+        with self.settings(FLLFMS={'SQLITE_PRAGMAS': {'busy_timeout': None,
+                                                      'cache_size': 100}}):
+            sqlite.configure(conn.cursor(), persistent=False)
+        self.assertEqual(self.pragma(conn, 'busy_timeout'), 0)
+        self.assertEqual(self.pragma(conn, 'cache_size'), 100)
+        conn.close()
+
+    def test_maintain(self):
+        # The planner's statistics are gathered, on a fresh connection.
+        with TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "db.sqlite3")
+            conn = sqlite3.connect(path)
+            conn.execute("CREATE TABLE t (a INTEGER, b INTEGER)")
+            conn.execute("CREATE INDEX t_a ON t (a)")
+            conn.executemany("INSERT INTO t VALUES (?, ?)",
+                             [(i % 10, i) for i in range(100)])
+            conn.commit()
+            conn.close()
+            conn = sqlite3.connect(path, isolation_level=None)
+            try:
+                sqlite.configure(conn.cursor())
+                sqlite.maintain(conn.cursor())
+                self.assertEqual(conn.execute(
+                    "SELECT tbl, idx FROM sqlite_stat1").fetchall(),
+                    [("t", "t_a")])
+            finally:
+                conn.close()
+
+
+@skipIf(connection.vendor != 'sqlite', "SQLite only.")
+class ConnectionTests(TestCase):
+    def test_connection_created(self):
+        with connection.cursor() as cursor:
+            cursor.execute("PRAGMA busy_timeout")
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_maintenance_skips_memory(self):
+        # The test database is in memory, so has nothing to maintain (and
+        # mustn't be closed).
+        with mock.patch.object(connection, 'close') as close:
+            sqlite.maintenance.run_once()
+        self.assertFalse(close.called)
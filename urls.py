@@ -10,4 +10,5 @@ urlpatterns = [
 
 websocket_urlpatterns = [
     path("websocket/timercontrol/<path:object_id>/", consumers.TimerConsumer),
+    path("websocket/schedule/", consumers.ScheduleConsumer),
 ]